@@ -1,307 +1,427 @@
-from typing import Optional, Union
-import pandas as pd
-import numpy as np
-import re
+import argparse
+import hashlib
+import json
+import math
+import os
 import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
 
-fields = ["price", "volume", "value"]
+from trader.vm import MarketIndex, VM, blank_memory, data_ops, fields, window_ops
 
 generators = {
-    "float": (lambda x: random.random()),
-    "int": (lambda x: random.randint(0, x)),
-    "sint": (lambda x: random.randint(-x, x)),
-    "item": (lambda x: random.choice(x))
+    "float": (lambda rng, x: rng.random()),
+    "int": (lambda rng, x: rng.randint(0, x)),
+    "sint": (lambda rng, x: rng.randint(-x, x)),
+    "item": (lambda rng, x: rng.choice(x))
 }
 
 
-class VM:
-    df: pd.DataFrame
-    memory = np.zeros(256)
-    stk = np.zeros(65536)
-    call_stk = np.zeros(65536, dtype=np.uint32)
-    sp = 0
-    csp = 0
-    ip = 0
-    steps = 0
-    ccy = 1000
-    crypto = 0
-    halted = False
-    exceeded = False
-    maxexec = 5000
-
-    def __init__(self, df: pd.DataFrame) -> None:
-        self.df = df
-
-    def parse(self, text):
-        lines = text.split("\n")
-        code = []
-        labels = dict()
-        consts = dict()
-        ctr = 0
-        for line in lines:
-            line = re.sub("#.*$", "", line).strip()
-            if len(line) == 0:
+class BatchVM:
+    # Runs a whole batch of programs in lockstep over the same row. Stacks, memory and
+    # instruction pointers are matrices with one row per program, and on every step
+    # programs are grouped by opcode at their ip, so each group executes as one NumPy
+    # operation and window statistics are looked up for all of them at once. Programs
+    # that outgrow max_depth of stacks or use instructions without a batched form are
+    # rerun for that row on scalar VM, so results are always identical to VM.run().
+    # Same happens to stragglers once fewer than min_live programs are still running,
+    # as a NumPy step costs about as much as a few hundred scalar instructions.
+    index: MarketIndex
+    cursor: int
+
+    def __init__(
+        self,
+        index: MarketIndex,
+        cursor: int = 0,
+        depth: int = 64,
+        max_depth: int = 2048,
+        maxexec: int = 5000,
+        min_live: int = 128,
+    ) -> None:
+        self.index = index
+        self.cursor = cursor
+        self.depth = depth
+        self.max_depth = max_depth
+        self.min_live = min_live
+        self.maxexec = maxexec
+        self.scalar = VM(index, cursor)
+        self.scalar.maxexec = maxexec
+        self.handlers = {
+            "PUSH": self.LOADK, "LOADK": self.LOADK, "LOAD0": self.LOADK, "LOAD1": self.LOADK, "LOADM1": self.LOADK,
+            "POP": self.POP, "LOAD": self.LOAD, "STORE": self.STORE, "DUP": self.DUP, "DUP2": self.DUP2,
+            "ADD": self.ADD, "SUB": self.SUB, "MUL": self.MUL, "DIV": self.DIV, "MOD": self.MOD,
+            "CMPEQ": self.CMPEQ, "CMPLT": self.CMPLT, "CMPLTE": self.CMPLTE,
+            "JZ": self.JZ, "JNZ": self.JNZ, "JMP": self.JMP, "CALL": self.CALL, "RET": self.RET, "HALT": self.HALT,
+            "STD": self.STD, "MAX": self.MAX, "MIN": self.MIN, "MEDIAN": self.MEDIAN, "MEAN": self.MEAN,
+            "READ": self.READ, "BUY": self.BUY, "SELL": self.SELL,
+        }
+        self.opcodes = list(self.handlers.keys())
+        # Sparse tables padded into matrices, so range MIN/MAX is a single gather
+        size = len(index)
+        self.levels = np.array([max(count.bit_length() - 1, 0) for count in range(size + 1)], dtype=np.int64)
+        self.maxima = {name: self.pad(table, size) for name, table in index.maxima.items()}
+        self.minima = {name: self.pad(table, size) for name, table in index.minima.items()}
+        self.load([])
+
+    @staticmethod
+    def pad(table: List[np.ndarray], size: int) -> np.ndarray:
+        matrix = np.full((len(table), size), np.nan)
+        for level, values in enumerate(table):
+            matrix[level, : len(values)] = values
+        return matrix
+
+    def get_is(self):
+        return self.scalar.get_is()
+
+    def on_row(self):
+        self.cursor += 1
+
+    def seek(self, cursor: int):
+        self.cursor = cursor
+
+    def load(self, codes):
+        count = len(codes)
+        width = max([len(code) for code in codes], default=1)
+        self.codes = codes
+        self.programs = [None] * count
+        self.lengths = np.array([len(code) for code in codes], dtype=np.int64)
+        self.ops = np.full((count, max(width, 1)), -1, dtype=np.int64)
+        self.imms = np.zeros((count, max(width, 1)))
+        for k, code in enumerate(codes):
+            for pos, (op, imm) in enumerate(code):
+                # Constants are pushed as floats, like VM does, unknown opcodes spill to scalar VM
+                if op in ("LOAD0", "LOAD1", "LOADM1"):
+                    imm = {"LOAD0": 0.0, "LOAD1": 1.0, "LOADM1": -1.0}[op]
+                self.ops[k, pos] = self.opcodes.index(op) if op in self.handlers else -1
+                self.imms[k, pos] = imm
+        self.stk = np.zeros((count, self.depth))
+        self.call_stk = np.zeros((count, self.depth), dtype=np.int64)
+        self.memory = np.zeros((count, len(blank_memory)))
+        self.sp = np.zeros(count, dtype=np.int64)
+        self.csp = np.zeros(count, dtype=np.int64)
+        self.ip = np.zeros(count, dtype=np.int64)
+        self.steps = np.zeros(count, dtype=np.int64)
+        self.running = np.zeros(count, dtype=bool)
+        self.halted = np.zeros(count, dtype=bool)
+        self.failed = np.zeros(count, dtype=bool)
+        self.spilled = np.zeros(count, dtype=bool)
+        self.ccy = np.zeros(count)
+        self.crypto = np.zeros(count)
+
+    def run(self, ccy: np.ndarray, crypto: np.ndarray, active: np.ndarray) -> np.ndarray:
+        # Runs active programs over current row from given holdings, which are updated
+        # in place of self.ccy and self.crypto. Returns mask of programs that failed.
+        self.sp[active] = 0
+        self.csp[active] = 0
+        self.ip[active] = 0
+        self.steps[active] = 0
+        self.memory[active] = 0
+        self.halted[:] = False
+        self.failed[:] = False
+        self.spilled[:] = False
+        self.running[:] = active
+        self.ccy[:] = ccy
+        self.crypto[:] = crypto
+        rows = np.arange(len(self.codes))
+
+        with np.errstate(all="ignore"):
+            self.loop(rows)
+
+        # Programs that didn't fit batched execution are rerun from the start on scalar VM
+        for k in np.flatnonzero(self.spilled & ~self.failed):
+            if self.programs[k] is None:
+                self.programs[k] = self.scalar.compile(self.codes[k])
+            self.scalar.seek(self.cursor)
+            try:
+                self.scalar.run(self.programs[k], ccy[k], crypto[k])
+                self.ccy[k] = self.scalar.ccy
+                self.crypto[k] = self.scalar.crypto
+            except BaseException as ex:
+                self.failed[k] = True
+        return self.failed & active
+
+    def loop(self, rows: np.ndarray):
+        while True:
+            live = rows[self.running]
+            if len(live) < self.min_live:
+                self.spilled[live] = True
+                break
+            ip = self.ip[live]
+            n = self.lengths[live]
+            bad = (ip >= n) | (ip < -n)
+            if bad.any():
+                self.failed[live[bad]] = True
+                self.running[live[bad]] = False
+                live, ip, n = live[~bad], ip[~bad], n[~bad]
+            pos = np.where(ip < 0, ip + n, ip)
+            ops = self.ops[live, pos]
+            imms = self.imms[live, pos]
+            order = np.argsort(ops, kind="stable")
+            ops, live, imms = ops[order], live[order], imms[order]
+            bounds = np.flatnonzero(np.diff(ops)) + 1
+            for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(ops)]])):
+                op = ops[start]
+                if op < 0:
+                    self.spilled[live[start:end]] = True
+                else:
+                    self.handlers[self.opcodes[op]](live[start:end], imms[start:end])
+            self.ip[live] += 1
+            self.steps[live] += 1
+            done = self.failed[live] | self.spilled[live] | self.halted[live]
+            done |= (self.ip[live] == self.lengths[live]) | (self.steps[live] >= self.maxexec)
+            self.running[live[done]] = False
+
+    def evaluate(self, codes, carry: bool = False, rows: int = 1000) -> List[Tuple[int, float]]:
+        # Same as evaluate() with scalar VM, all programs advance row by row together
+        self.load(codes)
+        count = len(codes)
+        alive = np.ones(count, dtype=bool)
+        ccy = np.full(count, 1000.0)
+        crypto = np.zeros(count)
+        equity = np.zeros(count)
+        self.seek(1000)
+        for i in range(0, rows):
+            if not carry:
+                ccy[:] = 1000
+                crypto[:] = 0
+            alive &= ~self.run(ccy, crypto, alive)
+            ccy[:] = self.ccy
+            crypto[:] = self.crypto
+            equity[alive] = ccy[alive] + crypto[alive] * self.index.last("price", self.cursor)
+            self.on_row()
+        return [(k, equity[k]) for k in np.flatnonzero(alive)]
+
+    def fail(self, sel: np.ndarray, ok: np.ndarray) -> np.ndarray:
+        self.failed[sel[~ok]] = True
+        return sel[ok]
+
+    def require(self, sel: np.ndarray, depth: int) -> np.ndarray:
+        return self.fail(sel, self.sp[sel] >= depth)
+
+    def grow(self, stack: np.ndarray, need: np.ndarray) -> np.ndarray:
+        # Stacks start shallow and double up to max_depth, programs needing more spill
+        width = stack.shape[1]
+        if len(need) > 0 and need.max() > width and width < self.max_depth:
+            width = min(self.max_depth, max(int(need.max()), width * 2))
+            stack = np.pad(stack, ((0, 0), (0, width - stack.shape[1])))
+        return stack
+
+    def room(self, sel: np.ndarray, count: int) -> np.ndarray:
+        need = self.sp[sel] + count
+        self.stk = self.grow(self.stk, need)
+        ok = need <= self.stk.shape[1]
+        self.spilled[sel[~ok]] = True
+        return ok
+
+    def push(self, sel: np.ndarray, values):
+        self.stk[sel, self.sp[sel]] = values
+        self.sp[sel] += 1
+
+    def pop(self, sel: np.ndarray) -> np.ndarray:
+        self.sp[sel] -= 1
+        return self.stk[sel, self.sp[sel]]
+
+    def LOADK(self, sel: np.ndarray, imm: np.ndarray):
+        ok = self.room(sel, 1)
+        self.push(sel[ok], imm[ok])
+
+    def POP(self, sel: np.ndarray, imm: np.ndarray):
+        sel = self.require(sel, 1)
+        self.sp[sel] -= 1
+
+    def LOAD(self, sel: np.ndarray, imm: np.ndarray):
+        cell = imm.astype(np.int64)
+        ok = (cell < len(blank_memory)) & (cell >= -len(blank_memory))
+        self.failed[sel[~ok]] = True
+        sel, cell = sel[ok], cell[ok]
+        ok = self.room(sel, 1)
+        self.push(sel[ok], self.memory[sel[ok], cell[ok]])
+
+    def STORE(self, sel: np.ndarray, imm: np.ndarray):
+        cell = imm.astype(np.int64)
+        ok = (cell < len(blank_memory)) & (cell >= -len(blank_memory)) & (self.sp[sel] > 0)
+        sel, cell = self.fail(sel, ok), cell[ok]
+        self.memory[sel, cell] = self.pop(sel)
+
+    def DUP(self, sel: np.ndarray, imm: np.ndarray):
+        sel = self.require(sel, 1)
+        sel = sel[self.room(sel, 1)]
+        self.push(sel, self.stk[sel, self.sp[sel] - 1])
+
+    def DUP2(self, sel: np.ndarray, imm: np.ndarray):
+        sel = self.require(sel, 2)
+        sel = sel[self.room(sel, 2)]
+        a = self.stk[sel, self.sp[sel] - 2]
+        b = self.stk[sel, self.sp[sel] - 1]
+        self.push(sel, a)
+        self.push(sel, b)
+
+    def binary(self, sel: np.ndarray, fn, nonzero: bool = False):
+        sel = self.require(sel, 2)
+        b = self.pop(sel)
+        if nonzero:
+            ok = b != 0
+            sel, b = self.fail(sel, ok), b[ok]
+        top = self.sp[sel] - 1
+        self.stk[sel, top] = fn(self.stk[sel, top], b)
+
+    def ADD(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, lambda a, b: b + a)
+
+    def SUB(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, lambda a, b: a - b)
+
+    def MUL(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, lambda a, b: b * a)
+
+    def DIV(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, lambda a, b: a / b, nonzero=True)
+
+    def MOD(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, np.remainder, nonzero=True)
+
+    def CMPEQ(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, lambda a, b: np.where(b == a, 0.0, 1.0))
+
+    def CMPLT(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, lambda a, b: np.where(b >= a, 0.0, 1.0))
+
+    def CMPLTE(self, sel: np.ndarray, imm: np.ndarray):
+        self.binary(sel, lambda a, b: np.where(b > a, 0.0, 1.0))
+
+    def branch(self, sel: np.ndarray, imm: np.ndarray, zero: bool):
+        ok = self.sp[sel] > 0
+        sel, imm = self.fail(sel, ok), imm[ok]
+        taken = (self.pop(sel) == 0) == zero
+        self.ip[sel[taken]] += imm[taken].astype(np.int64) - 1
+
+    def JZ(self, sel: np.ndarray, imm: np.ndarray):
+        self.branch(sel, imm, True)
+
+    def JNZ(self, sel: np.ndarray, imm: np.ndarray):
+        self.branch(sel, imm, False)
+
+    def JMP(self, sel: np.ndarray, imm: np.ndarray):
+        self.ip[sel] += imm.astype(np.int64) - 1
+
+    def CALL(self, sel: np.ndarray, imm: np.ndarray):
+        # Return addresses are unsigned in VM, so calling from negative ip fails there too
+        ok = self.ip[sel] >= 0
+        sel, imm = self.fail(sel, ok), imm[ok]
+        need = self.csp[sel] + 1
+        self.call_stk = self.grow(self.call_stk, need)
+        ok = need <= self.call_stk.shape[1]
+        self.spilled[sel[~ok]] = True
+        sel, imm = sel[ok], imm[ok]
+        self.call_stk[sel, self.csp[sel]] = self.ip[sel]
+        self.csp[sel] += 1
+        self.ip[sel] += imm.astype(np.int64) - 1
+
+    def RET(self, sel: np.ndarray, imm: np.ndarray):
+        sel = self.fail(sel, self.csp[sel] > 0)
+        self.csp[sel] -= 1
+        self.ip[sel] = self.call_stk[sel, self.csp[sel]]
+
+    def HALT(self, sel: np.ndarray, imm: np.ndarray):
+        self.halted[sel] = True
+
+    def windows(self, sel: np.ndarray, imm: np.ndarray):
+        # Pops window like VM.stat() and yields programs grouped by field with their ranges
+        ok = self.sp[sel] > 0
+        sel, imm = self.fail(sel, ok), imm[ok]
+        window = self.pop(sel)
+        ok = np.isfinite(window)
+        sel, window, imm = self.fail(sel, ok), window[ok], imm[ok]
+        end = self.cursor
+        window = np.clip(np.trunc(window), -end - 1, end + 1).astype(np.int64)
+        lo = np.where(window >= 0, np.maximum(0, end - window), np.minimum(-window, end))
+        field = imm.astype(np.int64) % len(fields)
+        for f, name in enumerate(fields):
+            group = field == f
+            if not group.any():
                 continue
-            parts = re.match(
-                "([a-zA-Z0-9_.]+:)?\\s*([a-zA-Z01]+)\\s*(\\$?[a-zA-Z0-9_.]+)?", line
-            )
-            if parts is None:
+            if name not in self.index.columns:
+                self.failed[sel[group]] = True
                 continue
+            yield name, sel[group], lo[group], end
 
-            label = parts[1]
-            op = parts[2].upper()
-            imm = parts[3]
-
-            if label is not None:
-                label = label.replace(":", "")
-
-            # print(line, [label, op, imm])
-            if imm is not None:
-                if imm.startswith("$"):
-                    id = 0
-                    if imm in consts:
-                        id = consts[imm]
-                    else:
-                        consts[imm] = ctr
-                        id = ctr
-                        ctr += 1
-                    imm = id
-                elif re.match("^([0-9.]+)$", imm):
-                    if "." in imm:
-                        imm = float(imm)
-                    else:
-                        imm = int(imm)
-            else:
-                imm = 0
+    def MEAN(self, sel: np.ndarray, imm: np.ndarray):
+        for name, group, lo, hi in self.windows(sel, imm):
+            sums = self.index.sums[name]
+            count = hi - lo
+            mean = self.index.shifts[name] + (sums[hi] - sums[lo]) / count
+            self.push(group, np.where(count > 0, mean, np.nan))
 
-            if getattr(self, op, None) is None:
-                raise RuntimeError("invalid instruction: " + op)
+    def STD(self, sel: np.ndarray, imm: np.ndarray):
+        for name, group, lo, hi in self.windows(sel, imm):
+            sums, squares = self.index.sums[name], self.index.squares[name]
+            count = hi - lo
+            total = sums[hi] - sums[lo]
+            variance = (squares[hi] - squares[lo] - total * total / count) / (count - 1)
+            std = np.sqrt(np.where(0.0 > variance, 0.0, variance))
+            self.push(group, np.where(count >= 2, std, np.nan))
 
-            if label is not None:
-                labels[label] = len(code)
+    def extreme(self, sel: np.ndarray, imm: np.ndarray, tables: Dict[str, np.ndarray], pick):
+        for name, group, lo, hi in self.windows(sel, imm):
+            count = hi - lo
+            level = self.levels[np.maximum(count, 1)]
+            table = tables[name]
+            a = table[level, np.minimum(lo, table.shape[1] - 1)]
+            b = table[level, np.maximum(hi - (1 << level), 0)]
+            self.push(group, np.where(count > 0, pick(a, b), np.nan))
 
-            code.append([op, imm, label])
-        final = []
+    def MAX(self, sel: np.ndarray, imm: np.ndarray):
+        self.extreme(sel, imm, self.maxima, lambda a, b: np.where(b > a, b, a))
 
-        for i, inst in enumerate(code):
-            if isinstance(inst[1], str):
-                label = inst[1]
-                if label not in labels:
-                    raise RuntimeError("invalid label: " + label)
-                final.append([inst[0], labels[label] - i])
-            else:
-                final.append([inst[0], inst[1]])
-
-        return final
-
-    def on_row(self, row) -> float:
-        self.df = self.df.append(row)
-
-    def reset(self):
-        self.steps = 0
-        self.ip = 0
-        self.sp = 0
-        self.csp = 0
-        self.halted = False
-        self.exceeded = True
-        self.ccy = 1000
-        self.crypto = 0
-        self.memory = np.zeros(256)
-        self.stk = np.zeros(65536)
-        self.call_stk = np.zeros(65536, dtype=np.uint32)
-
-    def execute(self, code) -> float:
-        self.reset()
-        while not self.halted:
-            op = code[self.ip]
-            getattr(self, op[0])(op[1])
-            self.ip += 1
-            self.steps += 1
-            if self.ip == len(code) or self.steps >= self.maxexec:
-                self.exceeded = self.steps >= self.maxexec
-                break
+    def MIN(self, sel: np.ndarray, imm: np.ndarray):
+        self.extreme(sel, imm, self.minima, lambda a, b: np.where(b < a, b, a))
+
+    def MEDIAN(self, sel: np.ndarray, imm: np.ndarray):
+        for name, group, lo, hi in self.windows(sel, imm):
+            # Medians stay per window, but are memoized in the shared index
+            self.push(group, [self.index.median(name, hi, hi - start) for start in lo])
+
+    def READ(self, sel: np.ndarray, imm: np.ndarray):
+        for name, group, lo, hi in self.windows(sel, imm):
+            values = self.index.columns[name]
+            self.push(group, np.where(hi > lo, values[np.minimum(lo, len(values) - 1)], 0.0))
 
-        if self.sp <= 0:
+    def price(self, sel: np.ndarray) -> Optional[float]:
+        if self.cursor <= 0 or "price" not in self.index.columns:
+            self.failed[sel] = True
             return None
-        return self.stk[self.sp - 1]
-
-    def PUSH(self, value: Union[int, float]):
-        self.stk[self.sp] = value
-        self.sp += 1
-
-    def POP(self, value: Optional[int] = None):
-        assert self.sp > 0
-        self.sp -= 1
-        return self.stk[self.sp]
-
-    def LOADK(self, k: int):
-        self.PUSH(k)
-
-    def LOAD0(self, k: int):
-        self.PUSH(0)
-
-    def LOAD1(self, k: int):
-        self.PUSH(1)
-
-    def LOADM1(self, k: int):
-        self.PUSH(-1)
-
-    def LOAD(self, imm: int):
-        self.PUSH(self.memory[imm])
-
-    def STORE(self, imm: int):
-        self.memory[imm] = self.POP(0)
-
-    def DUP(self, value: Optional[int]):
-        assert self.sp > 0
-        self.PUSH(self.stk[self.sp - 1])
-
-    def DUP2(self, value: Optional[int]):
-        assert self.sp > 1
-        b = self.POP(0)
-        a = self.POP(0)
-        self.PUSH(a)
-        self.PUSH(b)
-        self.PUSH(a)
-        self.PUSH(b)
-
-    def STD(self, value: int):
-        assert self.sp > 0
-        window = int(self.POP(0))
-        df = self.df[fields[value % len(fields)]].tail(window)
-        self.PUSH(df.std())
-
-    def MAX(self, value: int):
-        assert self.sp > 0
-        window = int(self.POP(0))
-        df = self.df[fields[value % len(fields)]].tail(window)
-        self.PUSH(df.max())
-
-    def MIN(self, value: int):
-        assert self.sp > 0
-        window = int(self.POP(0))
-        df = self.df[fields[value % len(fields)]].tail(window)
-        self.PUSH(df.min())
-
-    def MEDIAN(self, value: int):
-        assert self.sp > 0
-        window = int(self.POP(0))
-        df = self.df[fields[value % len(fields)]].tail(window)
-        self.PUSH(df.median())
-
-    def MEAN(self, value: int):
-        assert self.sp > 0
-        window = int(self.POP(0))
-        df = self.df[fields[value % len(fields)]].tail(window)
-        self.PUSH(df.mean())
-
-    def READ(self, value: int):
-        assert self.sp > 0
-        window = int(self.POP(0))
-        df = self.df[fields[value % len(fields)]].tail(window).head(1)
-        if df.shape[0] == 0:
-            self.PUSH(0)
-        else:
-            self.PUSH(df.values[0])
-
-    def ADD(self, value: Optional[int] = None):
-        assert self.sp > 1
-        self.PUSH(self.POP(0) + self.POP(0))
-
-    def SUB(self, value: Optional[int] = None):
-        assert self.sp > 1
-        b = self.POP(0)
-        a = self.POP(0)
-        self.PUSH(a - b)
-
-    def MUL(self, value: Optional[int] = None):
-        assert self.sp > 1
-        self.PUSH(self.POP(0) * self.POP(0))
-
-    def DIV(self, value: Optional[int] = None):
-        assert self.sp > 1
-        b = self.POP(0)
-        a = self.POP(0)
-        assert b != 0
-        self.PUSH(a / b)
-
-    def MOD(self, value: Optional[int] = None):
-        assert self.sp > 1
-        b = self.POP(0)
-        a = self.POP(0)
-        assert b != 0
-        self.PUSH(a % b)
-
-    def CMPEQ(self, value: Optional[int] = None):
-        assert self.sp > 1
-        self.PUSH(0 if self.POP(0) == self.POP(0) else 1)
-
-    def CMPLT(self, value: Optional[int] = None):
-        assert self.sp > 1
-        self.PUSH(0 if self.POP(0) >= self.POP(0) else 1)
-
-    def CMPLTE(self, value: Optional[int] = None):
-        assert self.sp > 1
-        self.PUSH(0 if self.POP(0) > self.POP(0) else 1)
-
-    def JZ(self, value: int):
-        assert self.sp > 0
-        if self.POP(0) == 0:
-            self.ip += value - 1
-
-    def JNZ(self, value: int):
-        assert self.sp > 0
-        if self.POP(0) != 0:
-            self.ip += value - 1
-
-    def JMP(self, value: int):
-        self.ip += value - 1
-
-    def CALL(self, value: int):
-        self.call_stk[self.csp] = self.ip
-        self.csp += 1
-        self.ip += value - 1
-
-    def RET(self, value: Optional[int] = None):
-        assert self.csp > 0
-        self.csp -= 1
-        self.ip = self.call_stk[self.csp]
-
-    def HALT(self, value: Optional[int] = None):
-        self.halted = True
-
-    def PRINT(self, value: Optional[int] = None):
-        assert self.sp > 0
-        print(self.stk[self.sp - 1])
-
-    def BUY(self, value: Optional[int] = None):
-        price = self.df["price"].tail(1)[0]
-        amt = self.ccy / price
-        self.ccy -= amt * price
-        self.crypto += amt
-
-    def SELL(self, value: Optional[int] = None):
-        price = self.df["price"].tail(1)[0]
-        self.ccy += self.crypto * price
-        self.crypto = 0
+        return self.index.last("price", self.cursor)
 
-    def get_is(self):
-        censored = ["PRINT", "HALT", "PUSH", "POP"]
-        return [fn for fn in dir(VM) if fn == fn.upper() and fn not in censored]
+    def BUY(self, sel: np.ndarray, imm: np.ndarray):
+        price = self.price(sel)
+        if price is None:
+            return
+        amt = self.ccy[sel] / price
+        self.ccy[sel] -= amt * price
+        self.crypto[sel] += amt
 
-    def print_top(self):
-        print(self.stk[self.sp - 1])
+    def SELL(self, sel: np.ndarray, imm: np.ndarray):
+        price = self.price(sel)
+        if price is None:
+            return
+        self.ccy[sel] += self.crypto[sel] * price
+        self.crypto[sel] = 0
 
-    def equity(self):
-        price = self.df["price"].tail(1)[0]
-        return self.ccy + self.crypto * price
 
-base = pd.read_csv(
-    "stock_dataset.csv",
-    header=None,
-    names=["seq", "symbol", "price", "bid", "ask", "side", "time", "txid", "vol"],
-    parse_dates=["time"],
-).set_index("time")
+def load_dataset(path: str) -> pd.DataFrame:
+    return pd.read_csv(
+        path,
+        header=None,
+        names=["seq", "symbol", "price", "bid", "ask", "side", "time", "txid", "vol"],
+        parse_dates=["time"],
+    ).set_index("time")
 
 
 gen = {
@@ -320,28 +440,586 @@ gen = {
     "READ": (generators["int"], 100),
 }
 
-for j in range(0, 200000):
-    vm = VM(base.head(1000))
-    isa = vm.get_is()
-    df = base.tail(-1000).head(1000)
-    code = [ [random.choice(isa), 0 ] for x in range(0, 20) ]
+
+def program_rng(seed: int, number: int) -> random.Random:
+    # Every program has its own generator, so program N is the same no matter
+    # which batch or worker process generates it
+    return random.Random(seed * 4294967296 + number)
+
+
+def random_program(isa: List[str], length: int = 20, rng: random.Random = random):
+    code = [[rng.choice(isa), 0] for x in range(0, length)]
     for inst in code:
         if inst[0] in gen:
             desc = gen[inst[0]]
-            inst[1] = desc[0](desc[1])
-    # print(code)
-    interrupted = False
-    for i in range(0, df.shape[0]):
-        row = df.head(i).tail(1)
-        vm.on_row(row)
-        try:
-            result = vm.execute(code)
-        except BaseException as ex:
-            #print("Steps: ", vm.steps)
-            interrupted = True
-            break
-    
-    if not interrupted:
-        print(vm.equity(), code)
-
-print(vm.get_is())
\ No newline at end of file
+            inst[1] = desc[0](rng, desc[1])
+    return code
+
+
+# Stack effect of instructions as (items needed, change in depth)
+stack_effects = {
+    "PUSH": (0, 1), "LOADK": (0, 1), "LOAD0": (0, 1), "LOAD1": (0, 1), "LOADM1": (0, 1), "LOAD": (0, 1),
+    "POP": (1, -1), "STORE": (1, -1), "DUP": (1, 1), "DUP2": (2, 2),
+    "ADD": (2, -1), "SUB": (2, -1), "MUL": (2, -1), "DIV": (2, -1), "MOD": (2, -1),
+    "CMPEQ": (2, -1), "CMPLT": (2, -1), "CMPLTE": (2, -1), "JZ": (1, -1), "JNZ": (1, -1),
+    "STD": (1, 0), "MAX": (1, 0), "MIN": (1, 0), "MEDIAN": (1, 0), "MEAN": (1, 0), "READ": (1, 0),
+    "PRINT": (1, 0), "JMP": (0, 0), "CALL": (0, 0), "RET": (0, 0), "HALT": (0, 0), "BUY": (0, 0), "SELL": (0, 0),
+}
+
+jump_ops = ["JZ", "JNZ", "JMP", "CALL"]
+
+# Abstract stack depths are 0..depth_cap, where depth_cap stands for anything deeper
+depth_cap = 4
+
+
+class Analysis:
+    # Abstract interpretation of a program over (ip, stack depth) states, done once before
+    # any data is touched. ip is kept raw, so wraparound to negative ip is followed exactly.
+    # RET may return after any reachable CALL and data dependent failures (division by zero,
+    # NaN windows) are assumed not to happen, so analysis only ever over-approximates what
+    # program can do: if it says program always fails or never trades, it really doesn't.
+    code: List[list]
+
+    def __init__(self, code, columns: Optional[Dict[str, np.ndarray]] = None) -> None:
+        self.code = code
+        self.columns = columns
+        self.n = len(code)
+        self.edges = dict()
+        self.halts = set()
+        self.explore()
+        self.good = self.prune()
+
+    def fails(self, ip: int, depth: int) -> bool:
+        # Whether instruction certainly fails in this state, whatever the data is
+        op, imm = self.code[ip]
+        if depth < stack_effects[op][0]:
+            return True
+        if op in ("LOAD", "STORE") and not -len(blank_memory) <= int(imm) < len(blank_memory):
+            return True
+        if op == "CALL" and ip < 0:
+            return True
+        if self.columns is not None:
+            if op in window_ops and fields[int(imm) % len(fields)] not in self.columns:
+                return True
+            if op in ("BUY", "SELL") and "price" not in self.columns:
+                return True
+        return False
+
+    def explore(self):
+        n = self.n
+        start = (0, 0)
+        work = [start]
+        seen = {start}
+        returns = set()
+        rets = set()
+        while len(work) > 0:
+            state = work.pop()
+            ip, depth = state
+            successors = []
+            if ip >= n or ip < -n:
+                # Jumped out of program, IndexError
+                self.edges[state] = successors
+                continue
+            if self.fails(ip, depth):
+                self.edges[state] = successors
+                continue
+            op, imm = self.code[ip]
+            need, delta = stack_effects[op]
+            if delta < 0 and depth == depth_cap:
+                depths = [depth_cap + delta, depth_cap]
+            else:
+                depths = [min(depth + delta, depth_cap)]
+            if op == "HALT":
+                self.halts.add(state)
+            elif op == "RET":
+                rets.add(state)
+                successors = [(target, depth) for target in returns]
+            elif op in ("JMP", "CALL"):
+                successors = [(ip + int(imm), depth)]
+                if op == "CALL" and ip + 1 not in returns:
+                    returns.add(ip + 1)
+                    # Newly found return address is a successor of every RET seen so far
+                    for ret in rets:
+                        self.edges[ret].append((ip + 1, ret[1]))
+                        if (ip + 1, ret[1]) not in seen:
+                            seen.add((ip + 1, ret[1]))
+                            work.append((ip + 1, ret[1]))
+            elif op in ("JZ", "JNZ"):
+                successors = [(ip + 1, d) for d in depths] + [(ip + int(imm), d) for d in depths]
+            else:
+                successors = [(ip + 1, d) for d in depths]
+            self.edges[state] = successors
+            for successor in successors:
+                if successor[0] != n and successor not in seen:
+                    seen.add(successor)
+                    work.append(successor)
+
+    def prune(self) -> set:
+        # States from which some execution finishes, halts or loops until maxexec
+        good = set(self.edges.keys())
+        changed = True
+        while changed:
+            changed = False
+            for state in list(good):
+                if state in self.halts:
+                    continue
+                if any(s[0] == self.n or s in good for s in self.edges[state]):
+                    continue
+                good.discard(state)
+                changed = True
+        return good
+
+    @property
+    def survivable(self) -> bool:
+        return (0, 0) in self.good
+
+    @property
+    def trades(self) -> bool:
+        return any(self.code[ip][0] in ("BUY", "SELL") for ip, depth in self.good)
+
+    @property
+    def reachable(self) -> List[int]:
+        return sorted({ip for ip, depth in self.edges.keys() if -self.n <= ip < self.n})
+
+    def simplify(self) -> List[list]:
+        # Drops instructions that can never execute and fixes up jump offsets. Steps and
+        # failures stay the same, but programs that wrap around to negative ip depend on
+        # their length, so those are kept as they are.
+        reachable = self.reachable
+        if len(reachable) == 0 or reachable[0] < 0:
+            return [list(inst) for inst in self.code]
+        n = self.n
+        index = {ip: k for k, ip in enumerate(reachable)}
+        size = len(reachable)
+        simplified = []
+        for k, ip in enumerate(reachable):
+            op, imm = self.code[ip]
+            if op in jump_ops:
+                target = ip + int(imm)
+                if target == n:
+                    target = size
+                elif target in index:
+                    target = index[target]
+                else:
+                    # Never taken, or taken into IndexError, which has to stay that way
+                    target = size + 1
+                imm = target - k
+            simplified.append([op, imm])
+        return simplified
+
+
+def prune(codes, columns: Optional[Dict[str, np.ndarray]] = None) -> List[Optional[list]]:
+    # Simplified programs worth running, None for ones that certainly fail or never trade
+    pruned = []
+    for code in codes:
+        analysis = Analysis(code, columns)
+        pruned.append(analysis.simplify() if analysis.survivable and analysis.trades else None)
+    return pruned
+
+
+def evaluate(
+    vm: Union[VM, BatchVM], codes, carry: bool = False, rows: int = 1000, static: bool = True
+) -> List[Tuple[int, float]]:
+    # Equity of programs that survive all rows. Unless static is off, programs that can
+    # never trade or are certain to fail are left out without running and the rest is run
+    # with unreachable code removed.
+    if not static:
+        return run_rows(vm, codes, carry, rows)
+    kept = [(k, code) for k, code in enumerate(prune(codes, vm.index.columns)) if code is not None]
+    results = run_rows(vm, [code for k, code in kept], carry, rows)
+    return [(kept[j][0], equity) for j, equity in results]
+
+
+def run_rows(vm: Union[VM, BatchVM], codes, carry: bool = False, rows: int = 1000) -> List[Tuple[int, float]]:
+    # Programs are evaluated with rows as outer loop, so one VM walks the shared dataset
+    # once per batch instead of once per program. Only whether a program failed and state
+    # of its last run carry over between rows, as run() resets the VM, unless carry is set,
+    # in which case ccy and crypto are kept between rows like an actual account.
+    if isinstance(vm, BatchVM):
+        return vm.evaluate(codes, carry, rows)
+    alive = [(k, vm.compile(code)) for k, code in enumerate(codes)]
+    accounts = [(1000, 0)] * len(codes)
+    equity = [0.0] * len(codes)
+    vm.seek(1000)
+    for i in range(0, rows):
+        survivors = []
+        for k, program in alive:
+            try:
+                if carry:
+                    result = vm.run(program, *accounts[k])
+                    accounts[k] = (vm.ccy, vm.crypto)
+                else:
+                    result = vm.run(program)
+            except BaseException as ex:
+                #print("Steps: ", vm.steps)
+                continue
+            survivors.append((k, program))
+            equity[k] = vm.equity()
+        alive = survivors
+        vm.on_row()
+    return [(k, equity[k]) for k, program in alive]
+
+
+def fitness(vm: Union[VM, BatchVM], codes) -> List[Optional[float]]:
+    # Final equity of account traded by program over whole dataset, None if program failed
+    scores = [None] * len(codes)
+    for k, equity in evaluate(vm, codes, carry=True):
+        scores[k] = float(equity)
+    return scores
+
+
+def evaluate_batch(vm: Union[VM, BatchVM], start: int, end: int, seed: int):
+    isa = vm.get_is()
+    codes = [random_program(isa, rng=program_rng(seed, number)) for number in range(start, end)]
+    return [(equity, codes[k]) for k, equity in evaluate(vm, codes)]
+
+
+def make_vm(index: MarketIndex, lockstep: bool = False) -> Union[VM, BatchVM]:
+    return BatchVM(index) if lockstep else VM(index)
+
+
+def search(base: pd.DataFrame, programs: int, seed: int = 0, batch: int = 1000, lockstep: bool = False):
+    vm = make_vm(MarketIndex.from_frame(base.head(2000)), lockstep)
+    for start in range(0, programs, batch):
+        for equity, code in evaluate_batch(vm, start, min(start + batch, programs), seed):
+            print(equity, code)
+
+    print(vm.get_is())
+
+
+# Per process VM of parallel search, set up by init_worker
+worker_vm: Optional[Union[VM, BatchVM]] = None
+
+
+def init_worker(path: str, lockstep: bool):
+    global worker_vm
+    # Columns are memory mapped read-only, so all workers share page cache instead of copies
+    columns = {
+        name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        for name in fields
+        if os.path.exists(os.path.join(path, name + ".npy"))
+    }
+    worker_vm = make_vm(MarketIndex(columns), lockstep)
+
+
+def run_batch(start: int, end: int, seed: int):
+    return evaluate_batch(worker_vm, start, end, seed)
+
+
+def run_fitness(codes):
+    return fitness(worker_vm, codes)
+
+
+@contextmanager
+def worker_pool(base: pd.DataFrame, workers: int, lockstep: bool = False):
+    if workers < 0:
+        workers = os.cpu_count() or 1
+    path = tempfile.mkdtemp(prefix="genetic-")
+    try:
+        data = base.head(2000)
+        for name in fields:
+            if name in data.columns:
+                np.save(os.path.join(path, name + ".npy"), data[name].to_numpy(dtype=np.float64))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(path, lockstep)) as pool:
+            yield pool
+    finally:
+        shutil.rmtree(path)
+
+
+def parallel_search(
+    base: pd.DataFrame, programs: int, workers: int, seed: int = 0, batch: int = 1000, lockstep: bool = False
+):
+    # Same programs and results as search(), printed as batches finish
+    with worker_pool(base, workers, lockstep) as pool:
+        futures = [
+            pool.submit(run_batch, start, min(start + batch, programs), seed)
+            for start in range(0, programs, batch)
+        ]
+        for future in as_completed(futures):
+            for equity, code in future.result():
+                print(equity, code, flush=True)
+
+    print(VM(MarketIndex({})).get_is())
+
+
+def program_hash(code) -> str:
+    # Immediates of instructions that ignore them and field selectors beyond
+    # len(fields) don't change behaviour, so they don't change the hash either
+    canonical = []
+    for op, imm in code:
+        if op in data_ops:
+            imm = imm % len(fields)
+        elif op not in gen:
+            imm = 0
+        canonical.append([op, imm])
+    return hashlib.sha1(json.dumps(canonical).encode("utf-8")).hexdigest()
+
+
+class Evolution:
+    # Generational search over VM programs. Parents are picked by tournament, children
+    # are made by one point crossover and mutation of opcodes or immediates drawn from
+    # the gen table, best programs survive unchanged. Fitness is cached by program hash,
+    # so duplicate genomes are never evaluated twice, and population, hall of fame and
+    # cache are checkpointed after every generation, so the run can be resumed.
+    population: List[list]
+    hall: List[Tuple[float, list]]
+    scores: Dict[str, Optional[float]]
+
+    def __init__(
+        self,
+        isa: List[str],
+        evaluate: Callable[[List[list]], List[Optional[float]]],
+        size: int = 200,
+        elite: int = 10,
+        tournament: int = 4,
+        crossover_rate: float = 0.7,
+        mutation_rate: float = 0.05,
+        length: int = 20,
+        hall_size: int = 20,
+        seed: int = 0,
+        checkpoint: Optional[str] = None,
+    ) -> None:
+        self.isa = isa
+        self.evaluate = evaluate
+        self.size = size
+        self.elite = elite
+        self.tournament = tournament
+        self.crossover_rate = crossover_rate
+        self.mutation_rate = mutation_rate
+        self.length = length
+        self.hall_size = hall_size
+        self.checkpoint = checkpoint
+        self.rng = random.Random(seed)
+        self.generation = 0
+        self.population = [random_program(isa, length, self.rng) for x in range(size)]
+        self.hall = []
+        self.scores = dict()
+        self.evaluated = 0
+        if checkpoint is not None and os.path.exists(checkpoint):
+            self.load()
+
+    def load(self):
+        with open(self.checkpoint, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.generation = state["generation"]
+        self.population = state["population"]
+        self.hall = [(score, code) for score, code in state["hall"]]
+        self.scores = state["scores"]
+        version, internal, gauss = state["rng"]
+        self.rng.setstate((version, tuple(internal), gauss))
+
+    def save(self):
+        state = {
+            "generation": self.generation,
+            "population": self.population,
+            "hall": self.hall,
+            "scores": self.scores,
+            "rng": self.rng.getstate(),
+        }
+        with open(self.checkpoint + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.checkpoint + ".tmp", self.checkpoint)
+
+    def score(self, code) -> float:
+        value = self.scores[program_hash(code)]
+        return -math.inf if value is None else value
+
+    def evaluate_population(self):
+        pending = dict()
+        for code in self.population:
+            key = program_hash(code)
+            if key not in self.scores:
+                pending[key] = code
+        for key, value in zip(pending.keys(), self.evaluate(list(pending.values()))):
+            self.scores[key] = value
+        self.evaluated += len(pending)
+
+        known = {program_hash(code) for score, code in self.hall}
+        for code in self.population:
+            key = program_hash(code)
+            if self.scores[key] is not None and key not in known:
+                self.hall.append((self.scores[key], code))
+                known.add(key)
+        self.hall.sort(key=lambda entry: entry[0], reverse=True)
+        del self.hall[self.hall_size :]
+
+    def select(self) -> list:
+        contenders = self.rng.sample(self.population, min(self.tournament, len(self.population)))
+        return max(contenders, key=self.score)
+
+    def crossover(self, a: list, b: list) -> list:
+        if self.rng.random() >= self.crossover_rate or min(len(a), len(b)) < 2:
+            return [list(inst) for inst in a]
+        cut = self.rng.randint(1, min(len(a), len(b)) - 1)
+        return [list(inst) for inst in a[:cut] + b[cut:]]
+
+    def mutate(self, code: list) -> list:
+        for k, inst in enumerate(code):
+            if self.rng.random() >= self.mutation_rate:
+                continue
+            if inst[0] in gen and self.rng.random() < 0.5:
+                desc = gen[inst[0]]
+                inst[1] = desc[0](self.rng, desc[1])
+            else:
+                code[k] = random_program(self.isa, 1, self.rng)[0]
+        return code
+
+    def step(self):
+        self.evaluate_population()
+        ranked = []
+        seen = set()
+        for code in sorted(self.population, key=self.score, reverse=True):
+            key = program_hash(code)
+            if key not in seen:
+                seen.add(key)
+                ranked.append(code)
+        children = [[list(inst) for inst in code] for code in ranked[: self.elite]]
+        while len(children) < self.size:
+            children.append(self.mutate(self.crossover(self.select(), self.select())))
+        best = self.score(ranked[0])
+        self.population = children
+        self.generation += 1
+        if self.checkpoint is not None:
+            self.save()
+        return best
+
+    def run(self, generations: int):
+        while self.generation < generations:
+            started = time.perf_counter()
+            best = self.step()
+            print(
+                "generation %d | best: %f | hall of fame: %f | evaluated: %d | cached: %d | %.1fs"
+                % (
+                    self.generation,
+                    best,
+                    self.hall[0][0] if len(self.hall) > 0 else -math.inf,
+                    self.evaluated,
+                    len(self.scores),
+                    time.perf_counter() - started,
+                ),
+                flush=True,
+            )
+        for score, code in self.hall:
+            print(score, code)
+
+
+def evolve(base: pd.DataFrame, args):
+    vm = make_vm(MarketIndex.from_frame(base.head(2000)), args.lockstep)
+
+    def run(evaluate):
+        evolution = Evolution(
+            vm.get_is(),
+            evaluate,
+            size=args.population,
+            elite=args.elite,
+            seed=args.seed,
+            checkpoint=args.checkpoint,
+        )
+        evolution.run(args.generations)
+
+    if args.workers == 0:
+        run(lambda codes: fitness(vm, codes))
+        return
+    with worker_pool(base, args.workers, args.lockstep) as pool:
+        # Chunks of uncached programs are evaluated in parallel, each over one pass of data
+        def evaluate(codes):
+            chunks = [codes[i : i + args.batch] for i in range(0, len(codes), args.batch)]
+            return [score for chunk in pool.map(run_fitness, chunks) for score in chunk]
+
+        run(evaluate)
+
+
+def bench_run(vm: VM, fn, programs, rows: int):
+    # Each program runs rows times, like once per data row in search, until it fails
+    steps = 0
+    results = []
+    started = time.perf_counter()
+    for code in programs:
+        for i in range(rows):
+            try:
+                result = fn(code)
+            except Exception as ex:
+                result = type(ex)
+            steps += vm.steps
+            results.append(result)
+    return steps / (time.perf_counter() - started), results
+
+
+def bench_evaluate(vm: Union[VM, BatchVM], codes, rows: int):
+    # Without static analysis, which would otherwise leave out programs before VMs get to run them
+    started = time.perf_counter()
+    results = evaluate(vm, codes, carry=True, rows=rows, static=False)
+    return len(codes) * rows / (time.perf_counter() - started), results
+
+
+def benchmark(base: pd.DataFrame, programs: int, rows: int, seed: int):
+    index = MarketIndex.from_frame(base.head(2000))
+    vm = VM(index, 1000)
+    batch_vm = BatchVM(index)
+    full_isa = vm.get_is()
+    for name, isa in [("all", full_isa), ("no data", [op for op in full_isa if op not in data_ops])]:
+        codes = [random_program(isa, rng=program_rng(seed, number)) for number in range(programs)]
+        before, expected = bench_run(vm, vm.execute, codes, rows)
+        compiled = [vm.compile(code) for code in codes]
+        after, results = bench_run(vm, vm.run, compiled, rows)
+        same = all(a == b or (a != a and b != b) for a, b in zip(expected, results))
+        print(
+            "%s instructions | interpreted: %.0f/s | compiled: %.0f/s | speedup: %.2fx | same results: %s"
+            % (name, before, after, after / before, same)
+        )
+        started = time.perf_counter()
+        pruned = prune(codes, vm.index.columns)
+        elapsed = time.perf_counter() - started
+        kept = [(code, simplified) for code, simplified in zip(codes, pruned) if simplified is not None]
+        print(
+            "%s static analysis | %.0f programs/s | rejected: %d of %d | kept length: %.1f -> %.1f"
+            % (
+                name,
+                len(codes) / elapsed,
+                len(codes) - len(kept),
+                len(codes),
+                np.mean([len(code) for code, simplified in kept]) if len(kept) > 0 else 0,
+                np.mean([len(simplified) for code, simplified in kept]) if len(kept) > 0 else 0,
+            )
+        )
+        before, expected = bench_evaluate(vm, codes, rows)
+        after, results = bench_evaluate(batch_vm, codes, rows)
+        same = [(k, float(equity)) for k, equity in expected] == [(k, float(equity)) for k, equity in results]
+        print(
+            "%s program rows | %d programs, %d survived | compiled: %.0f/s | lockstep: %.0f/s | speedup: %.2fx"
+            " | same results: %s" % (name, len(codes), len(expected), before, after, after / before, same)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Random search for VM trading programs")
+    parser.add_argument("--dataset", default="stock_dataset.csv")
+    parser.add_argument("--programs", type=int, default=200000)
+    parser.add_argument("--bench", action="store_true", help="Compare interpreted and compiled VM speed")
+    parser.add_argument("--rows", type=int, default=100, help="Runs of each program when benchmarking")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes, -1 for one per core, 0 to run serially")
+    parser.add_argument("--batch", type=int, default=1000, help="Programs evaluated together over one pass of data")
+    parser.add_argument("--lockstep", action="store_true", help="Run each batch of programs together on BatchVM")
+    parser.add_argument("--evolve", action="store_true", help="Evolve programs instead of random search")
+    parser.add_argument("--generations", type=int, default=100)
+    parser.add_argument("--population", type=int, default=200)
+    parser.add_argument("--elite", type=int, default=10)
+    parser.add_argument("--checkpoint", default=None, help="File to resume evolution from and save it to")
+    args = parser.parse_args()
+
+    base = load_dataset(args.dataset)
+    if args.bench:
+        benchmark(base, min(args.programs, 200), args.rows, args.seed)
+    elif args.evolve:
+        evolve(base, args)
+    elif args.workers != 0:
+        parallel_search(base, args.programs, args.workers, args.seed, args.batch, args.lockstep)
+    else:
+        search(base, args.programs, args.seed, args.batch, args.lockstep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+# Example program for vm trader, holds while last price is over 1% under mean of last 100 trades
+        PUSH 100
+        MEAN 0          # Mean price over last 100 trades
+        PUSH 0.99
+        MUL
+        LOAD1
+        READ 0          # Last price
+        CMPLT           # 1 if last price < 0.99 * mean
+        JZ Flat
+        BUY
+        HALT
+Flat:   SELL
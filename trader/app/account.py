@@ -0,0 +1,226 @@
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+
+# Messages of authenticated user channel about our orders
+ORDER_EVENTS = {"received", "open", "match", "done", "change", "activate"}
+
+
+class AccountTracker:
+    # Orders and balances kept in memory from user channel events, so that order state machine doesn't
+    # poll REST. Every trader gets events of all products its feed subscribed to, as a fill of another
+    # pair can change balance of currency we share. Orders of products that feed doesn't trade (other
+    # processes, UI) produce no events, they only show up at next reconciliation, or right away when
+    # an order gets rejected for insufficient funds. Holds are derived from open orders we know about
+    # plus whatever else REST reported as held at last reconciliation. Balances are approximate
+    # between reconciliations (fee rounding, missed events), so they are replaced by REST snapshot
+    # periodically and after every reconnect. Tracker is live only when user channel is connected and
+    # reconciled since it connected.
+    pair: str
+    currencies: List[str]
+    orders: Dict[str, dict]
+    balances: Dict[str, float]
+    base_holds: Dict[str, float]
+    fee_ratio: float = 0
+    connected: bool = False
+    epoch: int = 0
+    reconciled_epoch: int = -1
+    reconciled_at: float = 0
+    events: int = 0
+
+    def __init__(self, pair: str) -> None:
+        self.pair = pair
+        self.currencies = pair.split("-")
+        self.orders = dict()
+        self.balances = {currency: 0.0 for currency in self.currencies}
+        self.base_holds = {currency: 0.0 for currency in self.currencies}
+        self.lock = Lock()
+
+    @property
+    def live(self) -> bool:
+        return self.connected and self.reconciled_epoch == self.epoch
+
+    def set_connected(self, connected: bool):
+        with self.lock:
+            if connected and not self.connected:
+                # Whatever happened while we were away has to come from REST first
+                self.epoch += 1
+            self.connected = connected
+
+    def invalidate(self):
+        # Balances are known to be off, REST is used until next reconciliation
+        with self.lock:
+            self.reconciled_epoch = -1
+
+    def stale(self, period: float) -> bool:
+        # Whether REST reconciliation is due, it's pointless while channel is down as REST is used anyway
+        if not self.connected:
+            return False
+        return self.reconciled_epoch != self.epoch or time.time() - self.reconciled_at >= period
+
+    def relevant(self, product_id: Optional[str]) -> bool:
+        if product_id is None:
+            return False
+        return product_id == self.pair or any(currency in self.currencies for currency in product_id.split("-"))
+
+    def hold(self, order: dict) -> float:
+        remaining = max(0.0, order["size"] - order["filled_size"])
+        if order["side"] == "buy":
+            return remaining * order["price"] * (1 + self.fee_ratio)
+        return remaining
+
+    def held(self, currency: str) -> float:
+        total = 0.0
+        for order in self.orders.values():
+            if order["status"] == "done":
+                continue
+            target, quote = order["product_id"].split("-")
+            if currency == (quote if order["side"] == "buy" else target):
+                total += self.hold(order)
+        return total
+
+    def load_accounts(self, accounts: List[dict], epoch: Optional[int] = None):
+        # REST snapshot, epoch is the one reconciliation started in, as channel may have dropped meanwhile
+        with self.lock:
+            for account in accounts:
+                currency = account["currency"]
+                if currency in self.balances:
+                    self.balances[currency] = float(account["balance"])
+                    self.base_holds[currency] = max(0.0, float(account["hold"]) - self.held(currency))
+            self.reconciled_epoch = self.epoch if epoch is None else epoch
+            self.reconciled_at = time.time()
+            self.prune()
+
+    def prune(self, keep: float = 3600):
+        # Done orders are only needed until state machine sees them
+        now = time.time()
+        for order_id in [k for k, order in self.orders.items() if order["status"] == "done"]:
+            if now - self.orders[order_id]["updated"] > keep:
+                del self.orders[order_id]
+
+    def entry(self, order_id: str, msg: dict) -> dict:
+        order = self.orders.get(order_id)
+        if order is None:
+            size = msg.get("size") or msg.get("remaining_size") or 0
+            order = self.orders[order_id] = {
+                "id": order_id,
+                "product_id": msg["product_id"],
+                "side": msg.get("side", "buy"),
+                "price": float(msg.get("price") or 0),
+                "size": float(size),
+                "filled_size": 0.0,
+                "status": "pending",
+                "done_reason": None,
+                "updated": time.time(),
+            }
+        return order
+
+    def track(self, resp: dict):
+        # Response of order we just placed over REST, events may have been faster than the response
+        if "id" not in resp:
+            return
+        with self.lock:
+            order = self.entry(resp["id"], resp)
+            if order["status"] == "pending":
+                order["status"] = resp.get("status", "pending")
+
+    def update(self, order_id: str, status: dict):
+        # Order as REST returned it, authoritative over events
+        with self.lock:
+            if "message" in status:
+                # REST doesn't keep cancelled orders without fills
+                order = self.orders.get(order_id)
+                if order is not None and order["status"] != "done" and order["filled_size"] <= 0:
+                    order["status"], order["done_reason"] = "done", "canceled"
+                return
+            order = self.entry(order_id, status)
+            order["status"] = status["status"]
+            order["filled_size"] = float(status.get("filled_size") or 0)
+            order["done_reason"] = status.get("done_reason")
+            order["updated"] = time.time()
+
+    def on_message(self, msg: dict) -> bool:
+        # Applies user channel event, returns whether it finished an order of our pair
+        kind = msg.get("type")
+        if kind not in ORDER_EVENTS or not self.relevant(msg.get("product_id")):
+            return False
+        with self.lock:
+            self.events += 1
+            if kind == "match":
+                self.on_match(msg)
+                return False
+            order_id = msg.get("order_id")
+            if order_id is None:
+                return False
+            order = self.entry(order_id, msg)
+            order["updated"] = time.time()
+            if kind == "open":
+                if order["status"] != "done":
+                    order["status"] = "open"
+            elif kind == "change":
+                if "new_size" in msg:
+                    order["size"] = order["filled_size"] + float(msg["new_size"])
+            elif kind == "done":
+                order["status"] = "done"
+                order["done_reason"] = msg.get("reason")
+                return order["product_id"] == self.pair
+            return False
+
+    def on_match(self, msg: dict):
+        maker = self.orders.get(msg.get("maker_order_id"))
+        taker = self.orders.get(msg.get("taker_order_id"))
+        order = maker if maker is not None else taker
+        if order is None:
+            return
+        fee = msg.get("maker_fee_rate" if maker is not None else "taker_fee_rate")
+        fee = float(fee) if fee is not None else self.fee_ratio
+        size = float(msg["size"])
+        value = size * float(msg["price"])
+        target, quote = order["product_id"].split("-")
+        order["filled_size"] += size
+        order["updated"] = time.time()
+        if order["side"] == "buy":
+            self.add(quote, -value * (1 + fee))
+            self.add(target, size)
+        else:
+            self.add(target, -size)
+            self.add(quote, value * (1 - fee))
+
+    def add(self, currency: str, amount: float):
+        if currency in self.balances:
+            self.balances[currency] += amount
+
+    def order(self, order_id: str) -> Optional[dict]:
+        # Same shape as REST get_order, None when we don't know the order
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return None
+            if order["status"] == "done" and order["done_reason"] == "canceled" and order["filled_size"] <= 0:
+                return {"message": "NotFound", "done_reason": "canceled"}
+            return {
+                "id": order["id"],
+                "product_id": order["product_id"],
+                "side": order["side"],
+                "price": str(order["price"]),
+                "size": str(order["size"]),
+                "status": order["status"],
+                "filled_size": str(order["filled_size"]),
+                "done_reason": order["done_reason"],
+            }
+
+    def account(self, currency: str) -> dict:
+        # Same shape as REST get_account
+        with self.lock:
+            balance = self.balances[currency]
+            hold = self.base_holds[currency] + self.held(currency)
+        return {
+            "id": currency,
+            "currency": currency,
+            "balance": str(balance),
+            "hold": str(hold),
+            "available": str(max(0.0, balance - hold)),
+        }
+
+    def accounts(self) -> List[dict]:
+        return [self.account(currency) for currency in self.currencies]
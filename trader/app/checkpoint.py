@@ -0,0 +1,42 @@
+import time
+from threading import Event, Thread
+
+from trader.logs import get_logger
+from trader.model import CheckpointDef
+
+logger = get_logger()
+
+
+class Checkpointer(Thread):
+    # Periodically appends new rows of trader streams to their stores, so a crash loses
+    # at most one interval and shutdown only has to write what came in since last checkpoint
+    config: CheckpointDef
+
+    def __init__(self, trader, config: CheckpointDef) -> None:
+        super().__init__(name="Checkpointer:" + trader.pair, daemon=True)
+        self.trader = trader
+        self.config = config
+        self.stopped = Event()
+        self.last_flush = time.time()
+        self.last_compaction = time.time()
+
+    def due(self) -> bool:
+        if time.time() - self.last_flush >= self.config.interval:
+            return True
+        return self.trader.unflushed_rows() >= self.config.rows
+
+    def run(self):
+        while not self.stopped.wait(1):
+            try:
+                if self.due():
+                    self.trader.flush_streams()
+                    self.last_flush = time.time()
+                if time.time() - self.last_compaction >= self.config.compact_interval:
+                    self.trader.compact_streams()
+                    self.last_compaction = time.time()
+            except Exception as ex:
+                logger.error("Checkpoint failed with exception", exc_info=ex)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
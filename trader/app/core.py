@@ -4,28 +4,52 @@ import os
 import time
 from threading import Lock
 from types import LambdaType
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import cbpro
 import pandas as pd
 from redis import Redis
 
+from trader.app.account import ORDER_EVENTS, AccountTracker
+from trader.app.checkpoint import Checkpointer
+from trader.app.equity import EquityHistory
+from trader.app.orders import OrderWorker
+from trader.app.rolling import RollingStats
+from trader.app.snapshot import StatusSnapshot
+from trader.app.store import ColumnStore, PartitionedStore, convert_csv
+from trader.app.stream import EQUITY_SCHEMA, SIDE_CODES, TRADE_SCHEMA, ColumnBuffer, TradeStream, ticker_row
+from trader.db.state import StateCache
 from trader.logs import get_logger
-from trader.model import Config, TradingStrategy
+from trader.metrics import (
+    Timed,
+    on_price_seconds,
+    on_tick_seconds,
+    stream_bytes,
+    stream_rows,
+    ticks_skipped,
+    ticks_total,
+    ws_lag_seconds,
+)
+from trader.model import ApiKey, Config, TradingStrategy
 from trader.strategy.base import BaseStrategy
+from trader.util import feed_apikey
 
 logger = get_logger()
 
 
 class Trader:
     redis: Redis
+    state: StateCache
     strategy: BaseStrategy
 
     config: Config
     trading_strategy: TradingStrategy
 
-    trade_stream: pd.DataFrame
-    equity_stream: pd.DataFrame
+    trade_stream: TradeStream
+    equity_stream: ColumnBuffer
+    history: EquityHistory
+    stats: RollingStats
+    tracker: AccountTracker
     pair: str
     tick_period: float = 0.25
 
@@ -35,9 +59,25 @@ class Trader:
     current_min: float = 0
     current_round: int = 0
     current_temperature: float = 0
-    lock = Lock()
 
-    def __init__(self, redis: Redis, trading_strategy: BaseStrategy, config: Config) -> None:
+    # Published for API by tick thread, REST data it shows are refreshed by order thread
+    snapshot: Optional[StatusSnapshot] = None
+    snapshot_period: float = 1
+    published_at: float = 0
+    fee_ratio: float = 0
+    accounts: List[Dict] = []
+    refresh_period: float = 5
+    refreshed_at: float = 0
+    fees_ttl: int = 60
+
+    def __init__(
+        self,
+        redis: Redis,
+        trading_strategy: BaseStrategy,
+        config: Config,
+        feed: Optional["MarketFeed"] = None,
+        client: Optional[cbpro.AuthenticatedClient] = None,
+    ) -> None:
         pair = config.target + "-" + config.currency
         in_data = config.initial_dataset
         self.pair = pair
@@ -47,92 +87,146 @@ class Trader:
         self.trading_strategy = config.strategy
         self.config = config
         self.strategy = trading_strategy
-        self.redis = redis
+        self.redis = Timed(redis, config.db, wrap=("pipeline",))
+        self.state = StateCache(self.redis, self.name, config.state_hash)
         self.active = True
+        self.lock = Lock()
         self.last_tick = time.perf_counter()
-        self.out_path = "data/" + config.target + "_" + config.currency + ".csv"
+        self.out_path = "data/" + config.target + "_" + config.currency
+        checkpoint = config.checkpoint
+        self.trade_store = ColumnStore(self.out_path, TRADE_SCHEMA, checkpoint.segment_rows, checkpoint.segment_age)
+        self.equity_store = ColumnStore(
+            self.out_path + "_equity", EQUITY_SCHEMA, checkpoint.segment_rows, checkpoint.segment_age
+        )
+        self.trade_stream = TradeStream(pair)
+        self.equity_stream = ColumnBuffer(EQUITY_SCHEMA)
 
         logger.info(f"Initial dataset located at {in_data}")
-
-        if not os.path.exists(self.out_path):
-            df = None
-            logger.info("Loading initial dataset")
-            if os.path.exists(in_data):
-                df = pd.read_csv(
+        # Directory is output of trader.collector, we only ever read our pair from it
+        collector = None
+        if in_data is not None and os.path.isdir(in_data):
+            collector = PartitionedStore(os.path.join(in_data, pair), TRADE_SCHEMA)
+
+        if not self.trade_store.exists():
+            logger.info("Converting initial dataset")
+            if os.path.exists(self.out_path + ".csv"):
+                # Dataset cached by previous versions, already filtered to our pair
+                convert_csv(self.trade_store, self.out_path + ".csv", self.trade_stream.frame_columns)
+            elif collector is not None:
+                # Collected trades are picked up below, recent partitions only
+                self.trade_store.create()
+            elif os.path.exists(in_data):
+                convert_csv(
+                    self.trade_store,
                     in_data,
+                    self.trade_stream.frame_columns,
+                    symbol=pair,
                     header=None,
                     names=["seq", "symbol", "close", "bid", "ask", "side", "time", "txid"],
-                    parse_dates=["time"],
-                ).set_index("time")
+                )
             else:
                 logger.warn(f"Input data path {in_data} doesn't exist, creating empty dataset instead")
-                df = pd.DataFrame(
-                    columns=["seq", "symbol", "close", "bid", "ask", "side", "txid"],
-                    index=pd.to_datetime([], utc=True),
-                )
-                df.index.name = "time"
-            df = df[df["symbol"] == pair]
-            df.to_csv(self.out_path)
-            logger.info("Initial dataset loaded")
+                self.trade_store.create()
+            logger.info("Initial dataset converted")
+
+        if not self.equity_store.exists():
+            if os.path.exists("data/equity_stream.csv"):
+                convert_csv(self.equity_store, "data/equity_stream.csv", self.equity_stream.frame_columns)
+                # Legacy file isn't namespaced by pair, so make sure only one trader picks it up
+                os.replace("data/equity_stream.csv", "data/equity_stream.csv.converted")
+            else:
+                self.equity_store.create()
 
         # Prepare dynamic stuff
         apikey = self.config.apikey
-        logger.info("Loading cached dataframe")
-        df = pd.read_csv(self.out_path, parse_dates=["time"]).set_index("time")
-        df = df[df["symbol"] == pair]
-        if "vol" not in df.columns:
-            df["vol"] = 0
-        self.trade_stream = df
+        logger.info("Loading cached dataset")
+        self.trade_store.repair()
+        self.equity_store.repair()
+        req_window = max(self.config.temperature.window, self.trading_strategy.window)
+        created_time = pd.Timestamp.utcnow() - pd.DateOffset(minutes=req_window * 2)
+        if collector is not None:
+            # Catch up with trades collector saw while we weren't running
+            stored = self.trade_store.read(created_time.value)["time"]
+            since = int(stored[-1]) if len(stored) > 0 else created_time.value
+            rows = self.trade_store.append(collector.read(since))
+            logger.info(f"Loaded {rows} collected rows of {pair}")
+        self.trade_stream.extend(self.trade_store.read(created_time.value))
+        # Rows we didn't load are on disk already, keep absolute numbering aligned with the store
+        self.trade_stream.evicted = len(self.trade_store) - len(self.trade_stream)
+        self.trade_stream.flushed = len(self.trade_store)
+        self.history = EquityHistory(self.equity_stream, config.equity)
+        self.history.load(self.equity_store.read())
+        self.equity_stream.evicted = len(self.equity_store) - len(self.equity_stream)
+        self.equity_stream.flushed = len(self.equity_store)
+        self.init_stats()
+        stream_rows.set_function(lambda: len(self.trade_stream), pair)
+        stream_bytes.set_function(lambda: sum(column.nbytes for column in self.trade_stream.arrays), pair)
+        # Client can be injected, i.e. fake exchange of benchmarks
         logger.info("Creating Coinbase client")
-        if config.sandbox:
+        if client is not None:
+            logger.info("Using provided client")
+        elif config.sandbox:
             apikey = self.config.sandbox_apikey
-            self.client = cbpro.AuthenticatedClient(
+            client = cbpro.AuthenticatedClient(
                 apikey.name,
                 apikey.key,
                 apikey.passphrase,
                 api_url="https://api-public.sandbox.exchange.coinbase.com",
             )
         else:
-            self.client = cbpro.AuthenticatedClient(apikey.name, apikey.key, apikey.passphrase)
+            client = cbpro.AuthenticatedClient(apikey.name, apikey.key, apikey.passphrase)
+        self.client = Timed(client, "cbpro")
 
         # Let's cache points of our interest
         logger.info("Loading account details")
         whitelist = [config.target, config.currency]
         self.accountIds = dict()
         accounts = self.client.get_accounts()
+        self.accounts = accounts
+        self.tracker = AccountTracker(pair)
+        self.tracker.load_accounts(accounts)
         for account in accounts:
             if account["currency"] in whitelist:
                 self.accountIds[account["currency"]] = account["id"]
             if account["currency"] in [config.currency, config.target]:
                 self.write_num(account["currency"], float(account["balance"]))
-
-        logger.info("Loading cached equity stream")
-        self.equity_stream = pd.DataFrame(columns=["equity", "ccy", "crypto"], index=pd.to_datetime([], utc=True))
-        self.equity_stream.index.name = "time"
-        if os.path.exists("data/equity_stream.csv"):
-            self.equity_stream = pd.read_csv("data/equity_stream.csv", parse_dates=["time"]).set_index("time")
+        self.flush()
 
         logger.info("Loading balanced")
         balances = self.get_balances(False)
-        self.start_ws_client()
+        self.orders = OrderWorker(self.order_tick, config.order_queue, "OrderWorker:" + pair)
+        self.flush_lock = Lock()
+        self.checkpointer = Checkpointer(self, config.checkpoint)
+        self.checkpointer.start()
+        self.fee_ratio = self.get_flat_fee()
+        self.tracker.fee_ratio = self.fee_ratio
+        self.refreshed_at = time.time()
+        self.publish()
+        # Traders of one process can share a feed, otherwise we get our own connection
+        self.owns_feed = feed is None
+        self.feed = feed if feed is not None else MarketFeed(config.sandbox, config.ws_url, feed_apikey(config))
+        self.feed.add(self)
+        if self.owns_feed:
+            self.feed.start()
 
         logger.info("Trader active, currency: %f, crypto: %f" % (balances[config.currency], balances[config.target]))
 
     def read(self, entity) -> str:
-        value = self.redis.get(self.name + ":" + entity)
-        return value.decode("utf-8") if value is not None else None
+        return self.state.get(entity)
 
     def write(self, entity, value, ex: int = None) -> Optional[bool]:
-        if ex is None:
-            return self.redis.set(self.name + ":" + entity, value)
-        return self.redis.setex(self.name + ":" + entity, ex, value)
+        # Lands in Redis on next flush, which happens at the end of every tick
+        self.state.set(entity, value, ex)
+        return True
+
+    def flush(self):
+        self.state.flush()
 
     def cached(self, entity, ex: int, getter: LambdaType) -> Optional[str]:
-        key = self.name + ":" + entity
-        value = self.redis.get(key)
+        value = self.state.get(entity)
         if value is None:
             value = getter()
-            self.redis.setex(key, ex, value)
+            self.state.set(entity, value, ex)
         return value
 
     def cached_obj(self, entity, ex: int, getter: LambdaType) -> Optional[str]:
@@ -153,8 +247,18 @@ class Trader:
         return self.write(entity, str(value))
 
     def get_account(self, ccy: str):
+        if self.tracker.live:
+            return self.tracker.account(ccy)
         return self.client.get_account(self.accountIds[ccy])
 
+    def get_order(self, order_id: str) -> dict:
+        # User channel knows about orders we placed, REST is asked only when it's down
+        status = self.tracker.order(order_id) if self.tracker.live else None
+        if status is None:
+            status = self.client.get_order(order_id)
+            self.tracker.update(order_id, status)
+        return status
+
     def get_xchg_rate(self) -> Optional[float]:
         return self.read_num("xchg")
 
@@ -183,60 +287,126 @@ class Trader:
             sum += xchg[key] * balances[key]
         return sum
 
+    def init_stats(self):
+        # Replay retained history once, from now on stats are updated per trade in on_price
+        self.stats = RollingStats([self.trading_strategy.window, self.config.temperature.window])
+        req_window = max(self.config.temperature.window, self.trading_strategy.window)
+        created_time = pd.Timestamp.utcnow() - pd.DateOffset(minutes=req_window * 2)
+        self.trade_stream.evict(created_time.value)
+        for t, price in zip(self.trade_stream["time"].tolist(), self.trade_stream["close"].tolist()):
+            self.stats.push(t, price)
+
     def tick(self, time_index):
         with self.lock:
             t = time.perf_counter()
             if t - self.last_tick >= self.period:
+                ticks_total.inc(self.pair)
                 try:
-                    self.on_tick(time_index)
+                    with on_tick_seconds.time(self.pair):
+                        self.on_tick(time_index)
+                    self.flush()
+                    if t - self.published_at >= self.snapshot_period:
+                        self.publish()
                 except Exception as ex:
                     logger.error("Tick failed with exception", exc_info=ex)
                 self.last_tick = t
+            else:
+                ticks_skipped.inc(self.pair)
+
+    def publish(self):
+        self.published_at = time.perf_counter()
+        self.snapshot = StatusSnapshot(self.get_status(), self.get_portfolio())
 
     def on_tick(self, time_index) -> bool:
-        state = self.read_state()
-        if self.trade_stream.shape[0] < 2:
+        if len(self.trade_stream) < 2:
             return True
 
         # Log our current equity
         balances = self.get_balances()
         equity = self.calc_equity(balances)
-        self.equity_stream.loc[time_index] = {
-            "equity": equity,
-            "ccy": balances[self.config.currency],
-            "crypto": balances[self.config.target],
-        }
+        self.history.append(time_index.value, equity, balances[self.config.currency], balances[self.config.target])
 
         # Get rid of old stuff
         req_window = max(self.config.temperature.window, self.trading_strategy.window)
         created_time = pd.Timestamp.utcnow() - pd.DateOffset(minutes=req_window * 2)
-        self.trade_stream = self.trade_stream[self.trade_stream.index > created_time]
+        self.trade_stream.evict(created_time.value)
+        self.history.evict()
 
-        # Create a copy that we work with from now on
-        df = self.trade_stream.copy()
-        # Get current price
-        price = df["close"].tail(1)[0]
-        # Get previous min/max over time window
-
-        frame = df["close"].rolling(str(self.trading_strategy.window) + "min").max().dropna()
-        if frame.shape[0] == 0:
+        if self.stats.count < 2:
             return True
 
-        last = df["close"].rolling(str(self.trading_strategy.window) + "min").max().dropna().tail(2).head(1)[0]
-        last_min = df["close"].rolling(str(self.trading_strategy.window) + "min").min().dropna().tail(2).head(1)[0]
+        # Get current price and previous min/max over time window
+        window = self.stats[self.trading_strategy.window]
+        price = self.stats.price
+        last = window.prev_max
+        last_min = window.prev_min
         # Calculate change
         change = price / last - 1
 
         # Calculate temperature
-        temp_min = df["close"].rolling(str(self.config.temperature.window) + "min").min().tail(1)[0]
-        temp_max = df["close"].rolling(str(self.config.temperature.window) + "min").max().tail(1)[0]
-        temperature = temp_max / temp_min - 1
+        temp_window = self.stats[self.config.temperature.window]
+        temperature = temp_window.max / temp_window.min - 1
 
         self.current_temperature = temperature
         self.current_price = price
         self.current_max = last
         self.current_min = last_min
         self.last_change = change
+        self.strategy.on_tick(self)
+
+        # Order management talks to Coinbase over REST, so it runs on its own thread
+        # while we keep consuming websocket at full rate
+        self.orders.submit(time_index)
+        return True
+
+    def order_tick(self, time_index):
+        try:
+            self.refresh()
+            self.on_order_tick(time_index)
+        finally:
+            self.flush()
+
+    def refresh(self):
+        # Blocking parts of status and portfolio, fetched here so that tick thread never waits for them
+        if self.tracker.stale(self.config.orders.reconcile):
+            self.reconcile()
+        if time.time() - self.refreshed_at < self.refresh_period:
+            return
+        self.refreshed_at = time.time()
+        self.fee_ratio = self.get_flat_fee()
+        self.tracker.fee_ratio = self.fee_ratio
+        self.accounts = self.tracker.accounts() if self.tracker.live else self.get_accounts()
+
+    def reconcile(self):
+        # REST snapshot of balances and of the order we wait for, recovers events missed while
+        # user channel was down and drift of balances we compute from events
+        epoch = self.tracker.epoch
+        self.accounts = self.client.get_accounts()
+        key = {"buying": "buy_response", "selling": "sell_response"}.get(self.read_state())
+        if key is not None:
+            order = json.loads(self.read(key))
+            if "id" in order:
+                self.tracker.update(order["id"], self.client.get_order(order["id"]))
+        self.tracker.load_accounts(self.accounts, epoch)
+
+    def on_order(self, msg):
+        # User channel event, when our order is done state machine runs right away instead of on next tick
+        if self.tracker.on_message(msg):
+            self.orders.submit(pd.Timestamp(msg["time"]))
+
+    def on_rejected(self, resp: dict):
+        # Tracked balances missed something, i.e. a fill of pair this feed doesn't subscribe to
+        if self.tracker.live and "insufficient" in resp["message"].lower():
+            logger.warning("Order rejected for insufficient funds, reconciling balances")
+            self.tracker.invalidate()
+
+    def on_user_channel(self, connected: bool):
+        self.tracker.set_connected(connected)
+
+    def on_order_tick(self, time_index) -> bool:
+        price = self.current_price
+        last = self.current_max
+        temperature = self.current_temperature
 
         state = self.read_state()
         round = self.read_num("round")
@@ -309,6 +479,7 @@ class Trader:
                 self.write_num("buy_fees", fees)
                 self.write_num("buy_value", total_cost)
                 self.write_num("buy_time", time.time())
+                self.flush()
 
                 # Place an order and save response
                 resp = self.client.place_limit_order(
@@ -319,22 +490,25 @@ class Trader:
                     size=str(much),
                 )
                 self.write("buy_response", json.dumps(resp))
+                self.tracker.track(resp)
 
                 if "message" in resp:
                     # If it fails, return to current state and try once again
                     logger.error("Buying failed, reason: %s" % (resp["message"]))
                     self.write_state("buy")
+                    self.on_rejected(resp)
         elif state == "buying":
             # In this stage we already place a limit buy order and are waiting for it's completion
             # if the buy order was cancelled (by user in UI), we go back to buy stage
             self.period = self.tick_period * 4
             order = json.loads(self.read("buy_response"))
-            status = self.client.get_order(order["id"])
+            status = self.get_order(order["id"])
             trigger_max = self.read_num("buy_trigger_max")
             buy_time = self.read_num("buy_time")            
 
             if "message" in status and status["message"] == "NotFound":
-                if (time.time() - buy_time) < 60:
+                # REST may not see fresh order yet, user channel knows when it was cancelled
+                if (time.time() - buy_time) < 60 and "done_reason" not in status:
                     return False
                 logger.warning("Buy order was cancelled, reverting to buy stage")
                 logger.warning(status)
@@ -419,6 +593,7 @@ class Trader:
             self.write_num("margin", sell_price / buy_price)
             self.write_num("net_sell_price", net_sell_price)
             self.write_num("net_margin", net_sell_price / buy_price)
+            self.flush()
 
             # Place an order and save response
             resp = self.client.place_limit_order(
@@ -429,11 +604,13 @@ class Trader:
                 size=str(avail),
             )
             self.write("sell_response", json.dumps(resp))
+            self.tracker.track(resp)
 
             # Check if the order was successful (it contains message with error if not)
             if "message" in resp:
                 logger.info("Selling failed, reason: %s" % (resp["message"]))
                 self.write_state("bought")
+                self.on_rejected(resp)
 
         elif state == "selling":
             # In this stage we are waiting for completion of limit sell order,
@@ -441,11 +618,11 @@ class Trader:
             # if the order was completed, we go back to buy stage
             self.period = self.tick_period * 4
             order = json.loads(self.read("sell_response"))
-            status = self.client.get_order(order["id"])
+            status = self.get_order(order["id"])
             sell_time = self.read_num("sell_time")
                 
             if "message" in status and status["message"] == "NotFound":
-                if (time.time() - sell_time) < 60:
+                if (time.time() - sell_time) < 60 and "done_reason" not in status:
                     return False
                 logger.warning("Sell order was cancelled, reverting to bought stage")
                 logger.warning(status)
@@ -460,51 +637,54 @@ class Trader:
         return True
 
     def on_price(self, obj):
-        new_row = {
-            "seq": int(obj["sequence"]),
-            "symbol": obj["product_id"],
-            "close": float(obj["price"]),
-            "bid": float(obj["best_bid"]),
-            "ask": float(obj["best_ask"]),
-            "side": obj["side"],
-            "vol": float(obj["last_size"]),
-            "txid": int(obj["trade_id"]),
-        }
-        time_index = pd.to_datetime([obj["time"]])[0]
-        self.write_num("xchg", new_row["close"])
-        self.trade_stream.loc[time_index] = new_row
+        started = time.perf_counter()
+        close = float(obj["price"])
+        time_index = pd.Timestamp(obj["time"])
+        ws_lag_seconds.observe(time.time() - time_index.value / 1e9, self.pair)
+        self.write_num("xchg", close)
+        self.trade_stream.append(*ticker_row(obj, time_index.value))
+        self.stats.push(time_index.value, close)
         # Make sure we go through tick fn, so we don't update every now and then
         # but rather in predefined intervals. In this fashion, we don't get hit by
         # rate limiter
         self.tick(time_index)
+        on_price_seconds.observe(time.perf_counter() - started, self.pair)
+
+    def unflushed_rows(self) -> int:
+        return self.trade_stream.total - self.trade_stream.flushed
+
+    def flush_streams(self):
+        # Only rows appended since last flush are written, we copy them while holding the lock,
+        # so websocket thread isn't blocked by disk I/O
+        with self.flush_lock:
+            for stream, store in [(self.trade_stream, self.trade_store), (self.equity_stream, self.equity_store)]:
+                with self.lock:
+                    total = stream.total
+                    pending = {name: column.copy() for name, column in stream.pending().items()}
+                store.append(pending)
+                stream.flushed = total
+
+    def compact_streams(self):
+        with self.flush_lock:
+            self.trade_store.compact()
+            self.equity_store.compact()
 
     def get_cashflow(self):
-        df = self.trade_stream.copy()
-        df["cash"] = df["close"] * df["vol"]
-        sellers = df[df["side"] == "sell"]
-        buyers = df[df["side"] == "buy"]
-        sell_sum = sellers["cash"].sum()
-        buy_sum = buyers["cash"].sum()
+        cash = self.trade_stream["close"] * self.trade_stream["vol"]
+        side = self.trade_stream["side"]
+        sell_sum = float(cash[side == SIDE_CODES["sell"]].sum())
+        buy_sum = float(cash[side == SIDE_CODES["buy"]].sum())
         return {"buyers": buy_sum, "sellers": sell_sum, "cashflow": sell_sum - buy_sum}
 
-    def start_ws_client(self):
-        self.ws_client = TraderWSClient(self.pair, self, self.config.sandbox)
-        self.ws_client.start()
-
-    def on_ws_dead(self):
-        if self.active:
-            logger.warning("Websocket client closed, reconnecting")
-            time.sleep(1)
-            self.start_ws_client()
-        else:
-            logger.info("Websocket client closed")
-
     def on_shutdown(self):
         logger.info("Shutting down")
         self.active = False
-        self.trade_stream.to_csv(self.out_path)
-        self.equity_stream.to_csv("data/equity_stream.csv")
-        self.ws_client.close()
+        self.orders.stop()
+        self.checkpointer.stop()
+        self.flush()
+        self.flush_streams()
+        if self.owns_feed:
+            self.feed.close()
 
     def get_fees(self):
         return self.client._send_message("get", "/fees")
@@ -512,20 +692,18 @@ class Trader:
     def get_accounts(self):
         return self.cached_obj("accounts", 5, lambda: self.client.get_accounts())
 
-    def get_history(self) -> pd.DataFrame:
-        return self.equity_stream
-
     def get_flat_fee(self):
         if self.config.forex:
             return 0
-        fees = self.cached_obj("fees", 5, lambda: self.get_fees())
+        fees = self.cached_obj("fees", self.fees_ttl, lambda: self.get_fees())
         maker = float(fees["maker_fee_rate"])
         taker = float(fees["taker_fee_rate"])
         fee_ratio = min(maker, taker)
         return fee_ratio
 
     def get_status(self):
-        fee_ratio = self.get_flat_fee()
+        # Only reads memory, REST values come from last refresh()
+        fee_ratio = self.fee_ratio
         round = self.read_num("round")
         if round is None:
             round = 0
@@ -566,10 +744,11 @@ class Trader:
             "cashflow": self.get_cashflow(),
             "margin": self.read_num("margin"),
             "net_margin": self.read_num("net_margin"),
+            "orders": self.orders.get_metrics(),
         }
 
     def get_portfolio(self):
-        accounts = self.get_accounts()
+        accounts = self.accounts
         cfg = self.config
         holdings = dict()
         equity = 0
@@ -581,7 +760,7 @@ class Trader:
                     equity += float(account["balance"])
                     avail_equity += float(account["available"])
                 elif account["currency"] == cfg.target:
-                    xchg = self.get_xchg_rate()
+                    xchg = self.get_xchg_rate() or 0
                     equity += float(account["balance"]) * xchg
                     avail_equity += float(account["available"]) * xchg
                 holdings[account["currency"]] = {
@@ -591,27 +770,124 @@ class Trader:
                 }
         return {"equity": {"balance": equity, "available": avail_equity}, "holdings": holdings}
 
+    def status(self):
+        return self.snapshot.status
 
-class TraderWSClient(cbpro.WebsocketClient):
-    pair: str
+    def portfolio(self):
+        return self.snapshot.portfolio
+
+    def equity_csv(
+        self, start: Optional[int] = None, end: Optional[int] = None, resolution: Optional[str] = None
+    ) -> str:
+        return self.history.query(start, end, resolution)
+
+
+class MarketFeed:
+    # Single websocket connection subscribed to products of all registered traders,
+    # ticker messages are dispatched to trader by their product_id
+    traders: Dict[str, Trader]
+    sandbox: bool
+    url: Optional[str]
+    apikey: Optional[ApiKey]
+
+    def __init__(self, sandbox: bool = False, url: Optional[str] = None, apikey: Optional[ApiKey] = None) -> None:
+        self.traders = dict()
+        self.sandbox = sandbox
+        self.url = url
+        self.apikey = apikey
+        self.active = True
+        self.ws_client = None
+
+    def add(self, trader: Trader):
+        self.traders[trader.pair] = trader
+
+    def start(self):
+        self.ws_client = TraderWSClient(list(self.traders.keys()), self, self.sandbox, self.url, self.apikey)
+        self.ws_client.start()
+
+    def on_price(self, msg):
+        trader = self.traders.get(msg.get("product_id"))
+        if trader is not None:
+            trader.on_price(msg)
 
-    def __init__(self, pair: str, parent: Trader, sandbox: bool = False):
+    def on_order(self, msg):
+        # Fill of any pair can change balance of currency other traders share, so everyone gets it
+        for trader in self.traders.values():
+            trader.on_order(msg)
+
+    def on_subscriptions(self, msg):
+        if self.apikey is None:
+            return
+        channels = [channel.get("name") for channel in msg.get("channels", []) if isinstance(channel, dict)]
+        for trader in self.traders.values():
+            trader.on_user_channel("user" in channels)
+
+    def on_ws_dead(self):
+        if self.apikey is not None:
+            for trader in self.traders.values():
+                trader.on_user_channel(False)
+        if self.active:
+            logger.warning("Websocket client closed, reconnecting")
+            time.sleep(1)
+            # Feed might have been closed while we waited
+            if self.active:
+                self.start()
+        else:
+            logger.info("Websocket client closed")
+
+    def close(self):
+        self.active = False
+        if self.ws_client is not None:
+            self.ws_client.close()
+
+
+class TraderWSClient(cbpro.WebsocketClient):
+    pairs: List[str]
+    feed_url: Optional[str]
+
+    def __init__(
+        self,
+        pairs: List[str],
+        parent: MarketFeed,
+        sandbox: bool = False,
+        url: Optional[str] = None,
+        apikey: Optional[ApiKey] = None,
+    ):
         super().__init__()
-        self.pair = pair
+        self.pairs = pairs
         self.parent = parent
         self.sandbox = sandbox
+        self.feed_url = url
+        # Subscribe message gets signed, so that we also receive events of our own orders
+        if apikey is not None:
+            self.auth = True
+            self.api_key = apikey.name
+            self.api_secret = apikey.key
+            self.api_passphrase = apikey.passphrase
 
     def on_open(self):
+        # Explicit url wins, i.e. local replay server of trader.replay
         self.url = "wss://ws-feed.pro.coinbase.com/"
-        if self.sandbox:
+        if self.feed_url:
+            self.url = self.feed_url
+        elif self.sandbox:
             self.url = "wss://ws-feed-public.sandbox.exchange.coinbase.com/"
-        self.products = [self.pair]
-        self.channels = [{"name": "ticker", "product_ids": [self.pair]}]
+        self.products = self.pairs
+        self.channels = [{"name": "ticker", "product_ids": self.pairs}]
+        if self.auth:
+            self.channels.append({"name": "user", "product_ids": self.pairs})
         logger.info("Websocket client opened")
 
     def on_message(self, msg):
-        if "price" in msg and "type" in msg:
+        kind = msg.get("type")
+        if kind in ORDER_EVENTS:
+            self.parent.on_order(msg)
+        elif "price" in msg and kind is not None:
             self.parent.on_price(msg)
+        elif kind == "subscriptions":
+            self.parent.on_subscriptions(msg)
+        elif kind == "error":
+            logger.error(f"Websocket error: {msg.get('message')} {msg.get('reason', '')}")
 
     def on_close(self):
         self.parent.on_ws_dead()
@@ -0,0 +1,194 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from trader.app.stream import ColumnBuffer
+from trader.model import EquityDef
+
+NS_PER_SECOND = 1000 * 1000 * 1000
+
+RESOLUTIONS = ["auto", "raw", "1m", "1h"]
+
+OHLC_SCHEMA = {
+    "time": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "ccy": np.float64,
+    "crypto": np.float64,
+}
+# Columns of raw equity stream as taken from OHLC buckets, for callers which didn't ask for a resolution
+LEGACY_COLUMNS = {"time": "time", "equity": "close", "ccy": "ccy", "crypto": "crypto"}
+OHLC_COLUMNS = ["time", "open", "high", "low", "close"]
+
+
+class OHLCSeries(ColumnBuffer):
+    # Values aggregated into buckets of `span` seconds, time is start of the bucket and
+    # the last bucket is updated in place until a value of the next one arrives. Balances
+    # are kept as of the close of the bucket.
+    span: int
+
+    def __init__(self, span: float, capacity: int = 4096) -> None:
+        super().__init__(OHLC_SCHEMA, capacity)
+        self.span = int(span * NS_PER_SECOND)
+
+    def push(self, t: int, value: float, ccy: float, crypto: float):
+        bucket = t - t % self.span
+        end = self.end
+        if end > self.start and self.columns["time"][end - 1] == bucket:
+            columns = self.columns
+            columns["high"][end - 1] = max(columns["high"][end - 1], value)
+            columns["low"][end - 1] = min(columns["low"][end - 1], value)
+            columns["close"][end - 1] = value
+            columns["ccy"][end - 1] = ccy
+            columns["crypto"][end - 1] = crypto
+        else:
+            self.append(bucket, value, value, value, value, ccy, crypto)
+
+    def push_many(self, times: np.ndarray, values: np.ndarray, ccy: np.ndarray, crypto: np.ndarray):
+        # Same as push() for every row, but aggregated with NumPy
+        if len(times) == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        buckets = times - times % self.span
+        starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+        ends = np.append(starts[1:], len(times))
+        if len(self) > 0 and self.last("time") == buckets[0]:
+            head = values[: ends[0]]
+            last = ends[0] - 1
+            for value in [head.max(), head.min(), head[-1]]:
+                self.push(int(buckets[0]), value, ccy[last], crypto[last])
+            starts, ends = starts[1:], ends[1:]
+        self.extend(
+            {
+                "time": buckets[starts],
+                "open": values[starts],
+                "high": np.maximum.reduceat(values, starts) if len(starts) > 0 else values[:0],
+                "low": np.minimum.reduceat(values, starts) if len(starts) > 0 else values[:0],
+                "close": values[ends - 1],
+                "ccy": ccy[ends - 1],
+                "crypto": crypto[ends - 1],
+            }
+        )
+
+
+class EquityHistory:
+    # Equity of trader in tiers, full resolution for the last `raw` minutes and OHLC of 1m and 1h
+    # buckets for older data, so memory doesn't grow with uptime. Queries pick the finest tier
+    # that covers the range within max_points rows, and rendered responses are cached for a while.
+    # Without resolution the finest tier is picked the same way, but OHLC rows are rendered as
+    # the columns of raw stream, so that callers of the old endpoint get the format they know.
+    # Raw stream is also flushed to disk by trader, so all mutations happen under trader lock
+    # as well as ours, while readers only take ours.
+    config: EquityDef
+    raw: ColumnBuffer
+    tiers: Dict[str, OHLCSeries]
+
+    def __init__(self, raw: ColumnBuffer, config: EquityDef, cache_size: int = 64) -> None:
+        self.raw = raw
+        self.config = config
+        self.tiers = {"1m": OHLCSeries(60), "1h": OHLCSeries(3600)}
+        self.horizons = {"raw": int(config.raw * 60 * NS_PER_SECOND), "1m": int(config.minutes * 60 * NS_PER_SECOND)}
+        self.lock = Lock()
+        self.cache_lock = Lock()
+        self.cache: OrderedDict = OrderedDict()
+        self.cache_size = cache_size
+
+    def load(self, columns: Dict[str, np.ndarray]):
+        # Aggregates are rebuilt from all stored rows, raw stream only gets ones within its horizon
+        with self.lock:
+            times = columns["time"]
+            if len(times) > 0:
+                skip = int(np.searchsorted(times, times[-1] - self.horizons["raw"], side="right"))
+                self.raw.extend({name: column[skip:] for name, column in columns.items()})
+            for tier in self.tiers.values():
+                tier.push_many(times, columns["equity"], columns["ccy"], columns["crypto"])
+            self.trim()
+
+    def append(self, t: int, equity: float, ccy: float, crypto: float):
+        with self.lock:
+            self.raw.append(t, equity, ccy, crypto)
+            for tier in self.tiers.values():
+                tier.push(t, equity, ccy, crypto)
+
+    def trim(self):
+        now = self.raw.last("time")
+        if now is None:
+            return
+        self.raw.evict(now - self.horizons["raw"])
+        self.tiers["1m"].evict(now - self.horizons["1m"])
+
+    def evict(self):
+        with self.lock:
+            self.trim()
+
+    def covers(self, buffer: ColumnBuffer, start: Optional[int]) -> bool:
+        # Whether buffer still holds everything since start
+        if buffer.evicted == 0:
+            return True
+        return start is not None and len(buffer) > 0 and buffer["time"][0] <= start
+
+    def select(self, start: Optional[int], end: Optional[int], resolution: str) -> Tuple[str, ColumnBuffer, int, int]:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution {resolution}, expected one of {', '.join(RESOLUTIONS)}")
+        buffers = [("raw", self.raw)] + list(self.tiers.items())
+        candidates = []
+        for name, buffer in buffers:
+            times = buffer["time"]
+            lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+            hi = len(times) if end is None else int(np.searchsorted(times, end, side="right"))
+            if name == resolution:
+                return name, buffer, lo, hi
+            candidates.append((name, buffer, lo, hi))
+        for name, buffer, lo, hi in candidates:
+            if self.covers(buffer, start) and hi - lo <= self.config.max_points:
+                return name, buffer, lo, hi
+        return candidates[-1]
+
+    def render(self, start: Optional[int], end: Optional[int], resolution: Optional[str]) -> str:
+        with self.lock:
+            name, buffer, lo, hi = self.select(start, end, resolution or "auto")
+            if name == "raw":
+                fields = {field: field for field in buffer.fields}
+            elif resolution is None:
+                fields = LEGACY_COLUMNS
+            else:
+                fields = {field: field for field in OHLC_COLUMNS}
+            columns = {column: buffer[field][lo:hi].copy() for column, field in fields.items()}
+        index = pd.DatetimeIndex(columns.pop("time").view("datetime64[ns]"), tz="UTC")
+        index.name = "time"
+        return pd.DataFrame(columns, index=index, copy=False).to_csv()
+
+    def query(self, start: Optional[int] = None, end: Optional[int] = None, resolution: Optional[str] = None) -> str:
+        key = (start, end, resolution)
+        now = time.time()
+        with self.cache_lock:
+            cached = self.cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        csv = self.render(start, end, resolution)
+        with self.cache_lock:
+            self.cache[key] = (now + self.config.cache_ttl, csv)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return csv
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    # Unix seconds or anything pandas understands as timestamp, naive ones are UTC
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value) * NS_PER_SECOND)
+    except ValueError:
+        pass
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return ts.value
@@ -0,0 +1,83 @@
+import time
+from queue import Empty, Full, Queue
+from threading import Thread
+from typing import Any, Callable, Dict
+
+from trader.logs import get_logger
+
+logger = get_logger()
+
+
+class OrderWorker:
+    # Runs order state transitions (and therefore all blocking REST calls) on a dedicated
+    # thread, so websocket consumption never waits for Coinbase. Queue is bounded, when it's
+    # full the tick is skipped, as the next one carries fresher market data anyway.
+    handler: Callable[[Any], Any]
+    queue: Queue
+    active: bool = True
+
+    submitted: int = 0
+    processed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    lag: float = 0
+    max_lag: float = 0
+    duration: float = 0
+    busy_since: float = 0
+
+    def __init__(self, handler: Callable[[Any], Any], maxsize: int = 1, name: str = "OrderWorker") -> None:
+        self.handler = handler
+        self.queue = Queue(maxsize=max(1, maxsize))
+        self.thread = Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item: Any) -> bool:
+        try:
+            self.queue.put_nowait((time.perf_counter(), item))
+            self.submitted += 1
+            return True
+        except Full:
+            self.skipped += 1
+            return False
+
+    def run(self):
+        while self.active:
+            try:
+                queued_at, item = self.queue.get(timeout=1)
+            except Empty:
+                continue
+            if item is None:
+                break
+            started = time.perf_counter()
+            self.busy_since = started
+            self.lag = started - queued_at
+            self.max_lag = max(self.max_lag, self.lag)
+            try:
+                self.handler(item)
+            except Exception as ex:
+                self.failed += 1
+                logger.error("Order tick failed with exception", exc_info=ex)
+            self.busy_since = 0
+            self.duration = time.perf_counter() - started
+            self.processed += 1
+
+    def stop(self):
+        self.active = False
+        try:
+            self.queue.put_nowait((time.perf_counter(), None))
+        except Full:
+            pass
+
+    def get_metrics(self) -> Dict[str, Any]:
+        busy_since = self.busy_since
+        return {
+            "queued": self.queue.qsize(),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "duration": self.duration,
+            "busy_for": time.perf_counter() - busy_since if busy_since > 0 else 0,
+        }
@@ -0,0 +1,65 @@
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+NS_PER_MINUTE = 60 * 1000 * 1000 * 1000
+
+
+class RollingWindow:
+    # Streaming equivalent of df["close"].rolling("<n>min").max()/min(), window is (t - n, t]
+    span: int
+    count: int = 0
+    max: Optional[float] = None
+    min: Optional[float] = None
+    prev_max: Optional[float] = None
+    prev_min: Optional[float] = None
+
+    def __init__(self, minutes: float) -> None:
+        self.span = int(minutes * NS_PER_MINUTE)
+        self.maxq: Deque[Tuple[int, float]] = deque()
+        self.minq: Deque[Tuple[int, float]] = deque()
+
+    def push(self, t: int, value: float):
+        # Values of previous row are what on_tick compares current price against
+        self.prev_max = self.max
+        self.prev_min = self.min
+
+        horizon = t - self.span
+        maxq = self.maxq
+        minq = self.minq
+        while maxq and maxq[0][0] <= horizon:
+            maxq.popleft()
+        while minq and minq[0][0] <= horizon:
+            minq.popleft()
+        while maxq and maxq[-1][1] <= value:
+            maxq.pop()
+        while minq and minq[-1][1] >= value:
+            minq.pop()
+        maxq.append((t, value))
+        minq.append((t, value))
+
+        self.max = maxq[0][1]
+        self.min = minq[0][1]
+        self.count += 1
+
+
+class RollingStats:
+    windows: Dict[float, RollingWindow]
+    count: int = 0
+    price: Optional[float] = None
+    time: Optional[int] = None
+
+    def __init__(self, windows: Iterable[float]) -> None:
+        self.windows = dict()
+        for minutes in windows:
+            if minutes not in self.windows:
+                self.windows[minutes] = RollingWindow(minutes)
+
+    def __getitem__(self, minutes: float) -> RollingWindow:
+        return self.windows[minutes]
+
+    def push(self, t: int, value: float):
+        for window in self.windows.values():
+            window.push(t, value)
+        self.price = value
+        self.time = t
+        self.count += 1
@@ -0,0 +1,12 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+
+@dataclass(frozen=True)
+class StatusSnapshot:
+    # What API serves about a trader, built on tick thread and published by swapping one
+    # reference, so readers never lock or touch Redis. Contents are never mutated after publish.
+    status: Dict[str, Any]
+    portfolio: Dict[str, Any]
+    created: float = field(default_factory=time.time)
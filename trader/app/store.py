@@ -0,0 +1,393 @@
+import calendar
+import json
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from trader.logs import get_logger
+
+logger = get_logger()
+
+
+class Segment:
+    # One raw binary file per column, append-only and read back through memory maps
+    path: str
+    schema: Dict[str, type]
+
+    def __init__(self, path: str, schema: Dict[str, type]) -> None:
+        self.path = path
+        self.schema = schema
+        self.fields = list(schema.keys())
+
+    def column_path(self, name: str) -> str:
+        return os.path.join(self.path, name + ".bin")
+
+    def create(self):
+        os.makedirs(self.path, exist_ok=True)
+        for name in self.fields:
+            open(self.column_path(name), "ab").close()
+
+    def __len__(self) -> int:
+        # Columns might differ in length if we crashed in the middle of append
+        return min(
+            os.path.getsize(self.column_path(name)) // np.dtype(dtype).itemsize for name, dtype in self.schema.items()
+        )
+
+    def repair(self):
+        rows = len(self)
+        for name, dtype in self.schema.items():
+            size = rows * np.dtype(dtype).itemsize
+            if os.path.getsize(self.column_path(name)) != size:
+                os.truncate(self.column_path(name), size)
+
+    def append(self, columns: Dict[str, np.ndarray]) -> int:
+        rows = len(columns[self.fields[0]])
+        if rows == 0:
+            return 0
+        for name, dtype in self.schema.items():
+            with open(self.column_path(name), "ab") as f:
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        return rows
+
+    def sync(self):
+        for name in self.fields:
+            with open(self.column_path(name), "rb+") as f:
+                os.fsync(f.fileno())
+
+    def read(self, since: Optional[int] = None) -> Dict[str, np.ndarray]:
+        # Memory mapped columns of rows with time > since (everything if since is None)
+        rows = len(self)
+        if rows == 0:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in self.schema.items()}
+        columns = {
+            name: np.memmap(self.column_path(name), dtype=dtype, mode="r", shape=(rows,))
+            for name, dtype in self.schema.items()
+        }
+        start = 0
+        if since is not None:
+            start = int(np.searchsorted(columns["time"], since, side="right"))
+        return {name: column[start:] for name, column in columns.items()}
+
+
+class ColumnStore:
+    # On-disk counterpart of ColumnBuffer, a directory of segments plus meta.json with the
+    # schema and ordered list of live segments. Appends go to the newest segment, which is
+    # fsynced and closed once it grows over segment_rows or gets older than segment_age seconds.
+    # Small closed neighbours are merged by compact(), so both the number of files and cost
+    # of a flush stay bounded. Segment list is swapped atomically, so a crash mid-merge
+    # leaves at most an orphaned directory that is removed on next load.
+    path: str
+    schema: Dict[str, type]
+    segments: List[Segment]
+
+    def __init__(
+        self, path: str, schema: Dict[str, type], segment_rows: int = 1000000, segment_age: float = 3600
+    ) -> None:
+        self.path = path
+        self.schema = schema
+        self.fields = list(schema.keys())
+        self.meta_path = os.path.join(path, "meta.json")
+        self.segment_rows = segment_rows
+        self.segment_age = segment_age
+        self.segments = []
+        self.sizes = []
+        self.next_number = 0
+        self.opened_at = time.time()
+        if self.exists():
+            self.load_segments()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.meta_path)
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self.path, "%08d" % number)
+
+    def load_segments(self):
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        names = meta.get("segments", [])
+        # Flat layout written by earlier versions becomes the very first segment
+        if os.path.exists(os.path.join(self.path, self.fields[0] + ".bin")):
+            first = self.segment_path(0)
+            os.makedirs(first, exist_ok=True)
+            for name in self.fields:
+                os.replace(os.path.join(self.path, name + ".bin"), os.path.join(first, name + ".bin"))
+            names = [os.path.basename(first)]
+            self.segments = [Segment(first, self.schema)]
+            self.write_meta()
+        for name in os.listdir(self.path):
+            if name not in names and os.path.isdir(os.path.join(self.path, name)):
+                shutil.rmtree(os.path.join(self.path, name))
+        self.segments = [Segment(os.path.join(self.path, name), self.schema) for name in names]
+        self.sizes = [len(segment) for segment in self.segments]
+        self.next_number = max([int(name) + 1 for name in names], default=0)
+
+    def write_meta(self):
+        meta = {
+            "schema": {name: np.dtype(dtype).str for name, dtype in self.schema.items()},
+            "segments": [os.path.basename(segment.path) for segment in self.segments],
+        }
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+    def create(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.write_meta()
+        self.load_segments()
+
+    def __len__(self) -> int:
+        return sum(self.sizes)
+
+    def repair(self):
+        for i, segment in enumerate(self.segments):
+            segment.repair()
+            self.sizes[i] = len(segment)
+
+    def rotate(self):
+        if len(self.segments) > 0:
+            self.segments[-1].sync()
+        segment = Segment(self.segment_path(self.next_number), self.schema)
+        segment.create()
+        self.next_number += 1
+        self.segments.append(segment)
+        self.sizes.append(0)
+        self.write_meta()
+        self.opened_at = time.time()
+
+    def append(self, columns: Dict[str, np.ndarray]) -> int:
+        rows = len(columns[self.fields[0]])
+        if rows == 0:
+            return 0
+        if (
+            len(self.segments) == 0
+            or self.sizes[-1] >= self.segment_rows
+            or (self.sizes[-1] > 0 and time.time() - self.opened_at >= self.segment_age)
+        ):
+            self.rotate()
+        self.segments[-1].append(columns)
+        self.sizes[-1] += rows
+        return rows
+
+    def compact(self) -> int:
+        # Merge runs of adjacent closed segments as long as they fit into segment_rows together
+        merged = 0
+        i = 0
+        while i < len(self.segments) - 1:
+            j = i
+            rows = self.sizes[i]
+            while j + 1 < len(self.segments) - 1 and rows + self.sizes[j + 1] <= self.segment_rows:
+                j += 1
+                rows += self.sizes[j]
+            if j > i:
+                self.merge(i, j)
+                merged += j - i
+            i += 1
+        return merged
+
+    def merge(self, first: int, last: int):
+        group = self.segments[first : last + 1]
+        merged = Segment(self.segment_path(self.next_number), self.schema)
+        self.next_number += 1
+        merged.create()
+        for segment in group:
+            merged.append(segment.read())
+        merged.sync()
+        self.segments[first : last + 1] = [merged]
+        self.sizes[first : last + 1] = [sum(self.sizes[first : last + 1])]
+        self.write_meta()
+        for segment in group:
+            shutil.rmtree(segment.path)
+
+    def read(self, since: Optional[int] = None) -> Dict[str, np.ndarray]:
+        # Rows with time > since (everything if since is None), only segments that overlap
+        # are mapped, and a single segment is returned without copying
+        parts = []
+        for segment, size in zip(reversed(self.segments), reversed(self.sizes)):
+            if size == 0:
+                continue
+            part = segment.read(since)
+            parts.append(part)
+            if since is not None and len(part[self.fields[0]]) < size:
+                break
+        if len(parts) == 0:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in self.schema.items()}
+        if len(parts) == 1:
+            return parts[0]
+        parts.reverse()
+        return {name: np.concatenate([part[name] for part in parts]) for name in self.fields}
+
+
+def convert_csv(
+    store: ColumnStore,
+    path: str,
+    encode: Callable[[pd.DataFrame], Dict[str, np.ndarray]],
+    symbol: Optional[str] = None,
+    chunksize: int = 1000000,
+    **kwargs,
+) -> int:
+    # One-time conversion of CSV layout into column store, done in chunks to keep memory flat.
+    # We write into temporary directory first, so interrupted conversion is simply redone.
+    tmp = ColumnStore(store.path + ".tmp", store.schema, store.segment_rows, store.segment_age)
+    if os.path.exists(tmp.path):
+        shutil.rmtree(tmp.path)
+    tmp.create()
+    rows = 0
+    for chunk in pd.read_csv(path, parse_dates=["time"], chunksize=chunksize, **kwargs):
+        if symbol is not None:
+            chunk = chunk[chunk["symbol"] == symbol]
+        rows += tmp.append(encode(chunk.set_index("time")))
+        logger.info(f"Converted {rows} rows of {path} into {store.path}")
+    if len(tmp.segments) > 0:
+        tmp.segments[-1].sync()
+    if os.path.exists(store.path):
+        shutil.rmtree(store.path)
+    os.replace(tmp.path, store.path)
+    store.load_segments()
+    return rows
+
+
+class PartitionedStore:
+    # Column stores of one stream split by time, one directory per `partition` seconds (UTC)
+    # named after partition start, so readers that only need recent rows never open older
+    # partitions. Rows are appended in time order, when they move on to a new partition
+    # the previous one is fsynced and closed. Partition length is kept in partitions.json,
+    # so readers don't have to know what the writer was started with, and rows older than
+    # the newest stored one are dropped, as they would break ordered reads.
+    path: str
+    schema: Dict[str, type]
+    partition: int
+    last_time: Optional[int] = None
+
+    def __init__(
+        self,
+        path: str,
+        schema: Dict[str, type],
+        partition: Optional[float] = None,
+        segment_rows: int = 1000000,
+        segment_age: float = 3600,
+    ) -> None:
+        self.path = path
+        self.schema = schema
+        self.meta_path = os.path.join(path, "partitions.json")
+        stored = self.load_meta()
+        if stored is not None and partition is not None and stored != partition:
+            logger.warning(f"{path} is partitioned by {stored}s, ignoring requested {partition}s")
+        if stored is not None:
+            partition = stored
+        # Stores written before partition length was saved all used the default
+        self.partition = int((partition if partition is not None else 86400) * 1000000000)
+        self.segment_rows = segment_rows
+        self.segment_age = segment_age
+        self.current = None
+        self.current_start = None
+        self.last_loaded = False
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.path)
+
+    def load_meta(self) -> Optional[float]:
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)["partition"]
+
+    def write_meta(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"partition": self.partition / 1000000000}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+    def last(self) -> Optional[int]:
+        # Time of the newest stored row, read once from the last non-empty segment
+        if not self.last_loaded:
+            self.last_loaded = True
+            for name in reversed(self.partitions()):
+                store = self.open(name)
+                for segment, size in zip(reversed(store.segments), reversed(store.sizes)):
+                    if size > 0:
+                        self.last_time = int(segment.read()["time"][-1])
+                        return self.last_time
+        return self.last_time
+
+    def partition_name(self, start: int) -> str:
+        return time.strftime("%Y%m%dT%H%M%S", time.gmtime(start // 1000000000))
+
+    def partition_start(self, name: str) -> int:
+        return calendar.timegm(time.strptime(name, "%Y%m%dT%H%M%S")) * 1000000000
+
+    def partitions(self) -> List[str]:
+        if not self.exists():
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.path)
+            if not name.endswith(".tmp") and os.path.exists(os.path.join(self.path, name, "meta.json"))
+        )
+
+    def open(self, name: str) -> ColumnStore:
+        return ColumnStore(os.path.join(self.path, name), self.schema, self.segment_rows, self.segment_age)
+
+    def rotate(self, start: int):
+        self.close()
+        if not os.path.exists(self.meta_path):
+            self.write_meta()
+        store = self.open(self.partition_name(start))
+        if store.exists():
+            store.repair()
+        else:
+            store.create()
+        self.current = store
+        self.current_start = start
+
+    def append(self, columns: Dict[str, np.ndarray]) -> int:
+        last = self.last()
+        if last is not None and len(columns["time"]) > 0 and columns["time"][0] < last:
+            keep = columns["time"] >= last
+            logger.warning(f"Dropping {len(keep) - int(keep.sum())} rows of {self.path} older than stored ones")
+            columns = {name: column[keep] for name, column in columns.items()}
+        times = columns["time"]
+        rows = len(times)
+        if rows > 0:
+            self.last_time = int(times[-1])
+        lo = 0
+        while lo < rows:
+            start = int(times[lo]) - int(times[lo]) % self.partition
+            if start != self.current_start:
+                self.rotate(start)
+            hi = int(np.searchsorted(times, start + self.partition, side="left"))
+            self.current.append({name: column[lo:hi] for name, column in columns.items()})
+            lo = hi
+        return rows
+
+    def compact(self) -> int:
+        return self.current.compact() if self.current is not None else 0
+
+    def close(self):
+        if self.current is not None and len(self.current.segments) > 0:
+            self.current.segments[-1].sync()
+        self.current = None
+        self.current_start = None
+
+    def read(self, since: Optional[int] = None) -> Dict[str, np.ndarray]:
+        # Rows with time > since, partitions that end before since aren't opened at all
+        parts = []
+        for name in self.partitions():
+            if since is not None and self.partition_start(name) + self.partition <= since:
+                continue
+            part = self.open(name).read(since)
+            if len(part["time"]) > 0:
+                parts.append(part)
+        if len(parts) == 0:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in self.schema.items()}
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([part[name] for part in parts]) for name in self.schema}
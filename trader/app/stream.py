@@ -0,0 +1,177 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+TRADE_SCHEMA = {
+    "time": np.int64,
+    "seq": np.int64,
+    "close": np.float64,
+    "bid": np.float64,
+    "ask": np.float64,
+    "side": np.int8,
+    "vol": np.float64,
+    "txid": np.int64,
+}
+
+EQUITY_SCHEMA = {
+    "time": np.int64,
+    "equity": np.float64,
+    "ccy": np.float64,
+    "crypto": np.float64,
+}
+
+SIDES = ["", "buy", "sell"]
+SIDE_CODES = {"buy": 1, "sell": 2}
+
+
+def ticker_row(obj, time: Optional[int] = None) -> tuple:
+    # Websocket ticker message as TRADE_SCHEMA row, shared by trader and collector
+    if time is None:
+        time = pd.Timestamp(obj["time"]).value
+    return (
+        time,
+        int(obj["sequence"]),
+        float(obj["price"]),
+        float(obj["best_bid"]),
+        float(obj["best_ask"]),
+        SIDE_CODES.get(obj["side"], 0),
+        float(obj["last_size"]),
+        int(obj["trade_id"]),
+    )
+
+
+def time_ns(index) -> np.ndarray:
+    # UTC nanoseconds since epoch, regardless of resolution pandas parsed the index into
+    index = pd.to_datetime(index, utc=True).tz_convert(None)
+    return index.values.astype("datetime64[ns]").view(np.int64)
+
+
+class ColumnBuffer:
+    # Preallocated column arrays, live rows are always contiguous in [start, end) so that
+    # every column can be handed out as a view without copying. When we run out of space
+    # at the end, live rows are moved to the front (and capacity doubled if still too full),
+    # which keeps append amortized O(1). Rows are expected to arrive ordered by time.
+    schema: Dict[str, type]
+    fields: List[str]
+    start: int = 0
+    end: int = 0
+    # Absolute row numbers, so we know what was already persisted even after eviction
+    evicted: int = 0
+    flushed: int = 0
+
+    def __init__(self, schema: Dict[str, type], capacity: int = 4096) -> None:
+        self.schema = schema
+        self.fields = list(schema.keys())
+        self.capacity = max(16, capacity)
+        self.columns = {name: np.zeros(self.capacity, dtype=dtype) for name, dtype in schema.items()}
+        self.arrays = [self.columns[name] for name in self.fields]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    @property
+    def total(self) -> int:
+        return self.evicted + len(self)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name][self.start : self.end]
+
+    def view(self) -> Dict[str, np.ndarray]:
+        return {name: self[name] for name in self.fields}
+
+    def reserve(self, extra: int):
+        if self.end + extra <= self.capacity:
+            return
+        size = len(self)
+        capacity = self.capacity
+        while size + extra > capacity // 2:
+            capacity *= 2
+        if capacity != self.capacity:
+            columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.schema.items()}
+        else:
+            columns = self.columns
+        for name in self.fields:
+            columns[name][:size] = self.columns[name][self.start : self.end]
+        self.columns = columns
+        self.arrays = [columns[name] for name in self.fields]
+        self.capacity = capacity
+        self.start = 0
+        self.end = size
+
+    def append(self, *values):
+        if self.end == self.capacity:
+            self.reserve(1)
+        end = self.end
+        for arr, value in zip(self.arrays, values):
+            arr[end] = value
+        self.end = end + 1
+
+    def extend(self, columns: Dict[str, np.ndarray]):
+        size = len(columns[self.fields[0]])
+        if size == 0:
+            return
+        self.reserve(size)
+        for name in self.fields:
+            self.columns[name][self.end : self.end + size] = columns[name]
+        self.end += size
+
+    def evict(self, before: int):
+        # Drop rows with time <= before
+        count = int(np.searchsorted(self["time"], before, side="right"))
+        self.start += count
+        self.evicted += count
+
+    def take(self) -> Dict[str, np.ndarray]:
+        # Copies of all live rows, which are then dropped as if evicted
+        columns = {name: self[name].copy() for name in self.fields}
+        self.evicted += len(self)
+        self.start = self.end
+        return columns
+
+    def pending(self) -> Dict[str, np.ndarray]:
+        # Rows appended since last flush that are still in memory
+        skip = max(0, self.flushed - self.evicted)
+        return {name: self[name][skip:] for name in self.fields}
+
+    def last(self, name: str) -> Optional[float]:
+        if self.end == self.start:
+            return None
+        return self.columns[name][self.end - 1]
+
+    def index(self) -> pd.DatetimeIndex:
+        index = pd.DatetimeIndex(self["time"].view("datetime64[ns]"), tz="UTC")
+        index.name = "time"
+        return index
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: self[name] for name in self.fields[1:]}, index=self.index(), copy=False)
+
+    def frame_columns(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        columns = {"time": time_ns(df.index)}
+        for name in self.fields[1:]:
+            columns[name] = df[name].fillna(0).values.astype(self.schema[name])
+        return columns
+
+    def extend_frame(self, df: pd.DataFrame):
+        self.extend(self.frame_columns(df))
+
+
+class TradeStream(ColumnBuffer):
+    symbol: str
+
+    def __init__(self, symbol: str, capacity: int = 65536) -> None:
+        super().__init__(TRADE_SCHEMA, capacity)
+        self.symbol = symbol
+
+    def to_frame(self) -> pd.DataFrame:
+        df = super().to_frame()
+        df.insert(1, "symbol", self.symbol)
+        df["side"] = np.array(SIDES, dtype=object)[df["side"].values]
+        return df[["seq", "symbol", "close", "bid", "ask", "side", "txid", "vol"]]
+
+    def frame_columns(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        if "vol" not in df.columns:
+            df = df.assign(vol=0)
+        df = df.assign(side=df["side"].map(SIDE_CODES).fillna(0))
+        return super().frame_columns(df)
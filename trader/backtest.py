@@ -0,0 +1,395 @@
+import argparse
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from trader.app.store import ColumnStore, PartitionedStore
+from trader.app.stream import TRADE_SCHEMA, TradeStream
+from trader.model import Config
+from trader.strategy.base import BaseStrategy, BatchParams
+from trader.strategy.factory import get_strategy
+from trader.util import load_config, pair_configs
+
+NS_PER_MINUTE = 60 * 1000 * 1000 * 1000
+
+
+def load_dataset(path: str, pair: str) -> Dict[str, np.ndarray]:
+    # Either output directory of trader.collector, column store of trader or CSV of js/collector.js
+    if os.path.isdir(os.path.join(path, pair)):
+        return PartitionedStore(os.path.join(path, pair), TRADE_SCHEMA).read()
+    if os.path.isdir(path):
+        return ColumnStore(path, TRADE_SCHEMA).read()
+    df = pd.read_csv(
+        path,
+        header=None,
+        names=["seq", "symbol", "close", "bid", "ask", "side", "time", "txid"],
+        parse_dates=["time"],
+    ).set_index("time")
+    return TradeStream(pair).frame_columns(df[df["symbol"] == pair])
+
+
+def rolling(times: np.ndarray, values: np.ndarray, minutes: float, fn: str) -> np.ndarray:
+    # Same time based window as RollingWindow, (t - minutes, t]
+    series = pd.Series(values, index=pd.DatetimeIndex(times.view("datetime64[ns]")))
+    return getattr(series.rolling(pd.Timedelta(minutes=minutes)), fn)().values
+
+
+class ReplayStream:
+    # Rows of dataset up to current tick, what trade stream of trader would hold at that point
+    end: int = 0
+
+    def __init__(self, data: Dict[str, np.ndarray]) -> None:
+        self.data = data
+
+    def __len__(self) -> int:
+        return self.end
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.data[name][: self.end]
+
+
+class SimTrader:
+    # What strategies get to see instead of Trader, state lives in a dict instead of Redis
+    trade_stream: ReplayStream
+    current_price: float = 0
+    current_max: float = 0
+    current_min: float = 0
+    current_round: int = 0
+    current_temperature: float = 0
+    last_change: float = 0
+
+    def __init__(self, stream: ReplayStream) -> None:
+        self.values = dict()
+        self.trade_stream = stream
+
+    def read_num(self, entity="buy_price") -> Optional[float]:
+        return self.values.get(entity)
+
+    def write_num(self, entity: str, value: float):
+        self.values[entity] = value
+
+
+@dataclass
+class Fill:
+    time: int
+    side: str
+    price: float
+    amount: float
+    fees: float
+
+
+@dataclass
+class BacktestResult:
+    ticks: int
+    elapsed: float
+    rounds: int
+    cash: float
+    ccy: float
+    crypto: float
+    equity: float
+    state: str
+    fills: List[Fill] = field(default_factory=list)
+
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks / max(self.elapsed, 1e-9)
+
+    @property
+    def gain(self) -> float:
+        return self.equity / self.cash - 1
+
+
+class Backtest:
+    # Replays trades through real strategy against simulated exchange. Limit orders are
+    # post-only, so buy fills on first later trade at or below its price and sell on first
+    # trade at or above, fees are flat. In fast mode, rows where nothing can happen are
+    # skipped with NumPy scans over precomputed rolling arrays, strategies with batched
+    # will_buy get the whole remaining range at once, others are asked tick by tick.
+    # Strategies deciding in on_tick (vm) get it called on every row, which rules out skipping.
+    strategy: BaseStrategy
+    config: Config
+
+    def __init__(
+        self,
+        strategy: BaseStrategy,
+        config: Config,
+        data: Dict[str, np.ndarray],
+        fee: float = 0.004,
+        cash: float = 1000.0,
+    ) -> None:
+        self.strategy = strategy
+        self.config = config
+        self.fee = 0 if config.forex else fee
+        self.cash = cash
+
+        self.data = data
+        self.time = np.ascontiguousarray(data["time"], dtype=np.int64)
+        self.close = np.ascontiguousarray(data["close"], dtype=np.float64)
+        self.ticking = type(strategy).on_tick is not BaseStrategy.on_tick
+        window = config.strategy.window
+        temperature = config.temperature
+        # Previous row's rolling extremes are what trader compares current price against
+        self.max = np.roll(rolling(self.time, self.close, window, "max"), 1)
+        self.min = np.roll(rolling(self.time, self.close, window, "min"), 1)
+        if len(self.close) > 0:
+            self.max[0] = self.min[0] = np.nan
+        self.change = self.close / self.max - 1
+        temp_max = rolling(self.time, self.close, temperature.window, "max")
+        temp_min = rolling(self.time, self.close, temperature.window, "min")
+        self.temperature = temp_max / temp_min - 1
+        self.tradable = ~np.isnan(self.max)
+        if temperature.enabled:
+            self.tradable &= (self.temperature < temperature.max) & (self.temperature > temperature.min)
+
+    def reset(self):
+        self.sim = SimTrader(ReplayStream(self.data))
+        self.state = "buy"
+        self.ccy = self.cash
+        self.crypto = 0.0
+        self.fills = []
+
+    def set_tick(self, i: int):
+        sim = self.sim
+        sim.current_price = self.close[i]
+        sim.current_max = self.max[i]
+        sim.current_min = self.min[i]
+        sim.current_temperature = self.temperature[i]
+        sim.last_change = self.change[i]
+
+    def batch_params(self, lo: int, hi: int) -> BatchParams:
+        sim = self.sim
+        return BatchParams(
+            buy_price=sim.read_num("buy_price"),
+            sell_price=sim.read_num("sell_price"),
+            price=self.close[lo:hi],
+            change=self.change[lo:hi],
+            round=sim.current_round,
+            max=self.max[lo:hi],
+            min=self.min[lo:hi],
+            temperature=self.temperature[lo:hi],
+        )
+
+    def scan(self, start: int, predicate: Callable[[int, int], np.ndarray]) -> int:
+        # First row >= start matching predicate, evaluated over growing chunks so that
+        # events close to start don't pay for the whole remaining dataset
+        n = len(self.close)
+        size = 1024
+        while start < n:
+            end = min(n, start + size)
+            mask = predicate(start, end)
+            if mask.any():
+                return start + int(np.argmax(mask))
+            start = end
+            size *= 4
+        return n
+
+    def next_buy(self, start: int) -> int:
+        if self.config.place_immediately:
+            return self.scan(start, lambda lo, hi: self.tradable[lo:hi])
+        if self.strategy.will_buy_batch(self.batch_params(start, start + 1)) is None:
+            return start
+        return self.scan(
+            start, lambda lo, hi: self.tradable[lo:hi] & self.strategy.will_buy_batch(self.batch_params(lo, hi))
+        )
+
+    def next_buying(self, start: int) -> int:
+        values = self.sim.values
+        cfg = self.config
+
+        def predicate(lo: int, hi: int) -> np.ndarray:
+            mask = self.close[lo:hi] <= values["buy_price"]
+            if cfg.place_immediately:
+                mask |= self.max[lo:hi] != values["buy_trigger_max"]
+            if cfg.autocancel > 0:
+                mask |= self.time[lo:hi] - values["buy_time"] >= cfg.autocancel * NS_PER_MINUTE
+            return mask
+
+        return self.scan(start, predicate)
+
+    def next_selling(self, start: int) -> int:
+        sell_price = self.sim.values["sell_price"]
+        return self.scan(start, lambda lo, hi: self.close[lo:hi] >= sell_price)
+
+    def buy(self, i: int) -> bool:
+        cfg = self.config
+        sim = self.sim
+        price = self.close[i]
+        if np.isnan(self.max[i]) or (cfg.temperature.enabled and not self.tradable[i]):
+            return False
+
+        buy_price = price
+        if cfg.place_immediately:
+            buy_price = self.strategy.buy_price(sim)
+        elif not self.strategy.will_buy(sim):
+            return False
+        if buy_price is None:
+            return False
+
+        trigger_price = buy_price
+        buy_price = buy_price * (1.0 - cfg.strategy.buy_underprice)
+        ccy = self.ccy * cfg.trade_partition
+        buy_price = math.floor(buy_price * cfg.currency_precision) / cfg.currency_precision
+        much = ccy / buy_price / (1 + self.fee)
+        much = math.floor(much * cfg.target_precision) / cfg.target_precision
+        total_cost = much * buy_price
+        fees = total_cost * self.fee
+        if much <= 0:
+            return False
+        sim.values.update(
+            {
+                "buy_trigger_max": self.max[i],
+                "buy_trigger_price": trigger_price,
+                "buy_price": buy_price,
+                "buy_amount": much,
+                "buy_cost": total_cost + fees,
+                "buy_fees": fees,
+                "buy_time": self.time[i],
+            }
+        )
+        return True
+
+    def check_buying(self, i: int) -> Optional[str]:
+        cfg = self.config
+        values = self.sim.values
+        if self.close[i] <= values["buy_price"]:
+            self.ccy -= values["buy_cost"]
+            self.crypto += values["buy_amount"]
+            self.fills.append(Fill(self.time[i], "buy", values["buy_price"], values["buy_amount"], values["buy_fees"]))
+            return "bought"
+        if cfg.place_immediately and self.max[i] != values["buy_trigger_max"]:
+            return "buy"
+        if cfg.autocancel > 0 and self.time[i] - values["buy_time"] >= cfg.autocancel * NS_PER_MINUTE:
+            return "buy"
+        return None
+
+    def sell(self, i: int):
+        cfg = self.config
+        values = self.sim.values
+        sell_price = self.strategy.sell_price(self.sim)
+        avail = math.floor(self.crypto * cfg.target_precision) / cfg.target_precision
+        net_sell_price = sell_price
+        sell_price = (sell_price * avail + values["buy_fees"]) / avail
+        sell_price = sell_price / (1 - self.fee)
+        sell_price = math.ceil(sell_price * cfg.currency_precision) / cfg.currency_precision
+        total_earn = avail * sell_price
+        values.update(
+            {
+                "sell_price": sell_price,
+                "sell_amount": avail,
+                "sell_fees": total_earn * self.fee,
+                "sell_value": total_earn * (1 - self.fee),
+                "sell_time": self.time[i],
+                "net_sell_price": net_sell_price,
+            }
+        )
+
+    def check_selling(self, i: int) -> bool:
+        values = self.sim.values
+        if self.close[i] < values["sell_price"]:
+            return False
+        self.ccy += values["sell_value"]
+        self.crypto -= values["sell_amount"]
+        self.fills.append(Fill(self.time[i], "sell", values["sell_price"], values["sell_amount"], values["sell_fees"]))
+        self.sim.current_round += 1
+        return True
+
+    def run(self, fast: bool = True) -> BacktestResult:
+        self.reset()
+        started = time.perf_counter()
+        fast = fast and not self.ticking
+        n = len(self.close)
+        i = 0
+        while i < n:
+            if self.ticking:
+                self.set_tick(i)
+                self.sim.trade_stream.end = i + 1
+                self.strategy.on_tick(self.sim)
+            state = self.state
+            if state == "buy":
+                if fast:
+                    i = self.next_buy(i)
+                    if i >= n:
+                        break
+                self.set_tick(i)
+                if self.buy(i):
+                    self.state = "buying"
+            elif state == "buying":
+                if fast:
+                    i = self.next_buying(i)
+                    if i >= n:
+                        break
+                self.set_tick(i)
+                self.state = self.check_buying(i) or state
+            elif state == "bought":
+                self.set_tick(i)
+                self.sell(i)
+                self.state = "selling"
+            elif state == "selling":
+                if fast:
+                    i = self.next_selling(i)
+                    if i >= n:
+                        break
+                self.set_tick(i)
+                if self.check_selling(i):
+                    self.state = "buy"
+            i += 1
+
+        price = self.close[-1] if n > 0 else 0
+        return BacktestResult(
+            ticks=n,
+            elapsed=time.perf_counter() - started,
+            rounds=self.sim.current_round,
+            cash=self.cash,
+            ccy=self.ccy,
+            crypto=self.crypto,
+            equity=self.ccy + self.crypto * price,
+            state=self.state,
+            fills=self.fills,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay trades through trading strategy")
+    parser.add_argument("--config", default="./resources/config.yaml")
+    parser.add_argument("--dataset", default=None, help="CSV in collector layout or column store directory")
+    parser.add_argument("--pair", default=None)
+    parser.add_argument("--trader", default=None, help="Strategy, defaults to one from config")
+    parser.add_argument("--fee", type=float, default=0.004)
+    parser.add_argument("--cash", type=float, default=1000.0)
+    parser.add_argument("--slow", action="store_true", help="Ask strategy on every tick")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    configs = {c.target + "-" + c.currency: c for c in pair_configs(cfg)}
+    pair = args.pair or next(iter(configs.keys()))
+    if pair in configs:
+        cfg = configs[pair]
+    dataset = args.dataset or cfg.initial_dataset
+    strategy = get_strategy(args.trader or cfg.trader, cfg.strategy)
+
+    data = load_dataset(dataset, pair)
+    backtest = Backtest(strategy, cfg, data, fee=args.fee, cash=args.cash)
+    result = backtest.run(fast=not args.slow)
+    print(
+        "%s | ticks: %d (%.0f/s) | rounds: %d | equity: %f (%+.2f%%) | ccy: %f | crypto: %f | state: %s"
+        % (
+            pair,
+            result.ticks,
+            result.ticks_per_second,
+            result.rounds,
+            result.equity,
+            result.gain * 100,
+            result.ccy,
+            result.crypto,
+            result.state,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
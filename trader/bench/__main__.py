@@ -0,0 +1,3 @@
+from trader.bench.runner import main
+
+main()
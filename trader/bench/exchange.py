@@ -0,0 +1,189 @@
+import datetime
+import itertools
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+
+class FakeExchange:
+    # Offline stand-in for cbpro.AuthenticatedClient with the calls trader makes. Limit orders
+    # rest on the book until a ticker price crosses them (fed through on_price), then fill
+    # completely with maker fee. Every call can be delayed to emulate REST round trips.
+    # Listener gets user channel events of orders, as authenticated websocket would deliver them.
+    balances: Dict[str, float]
+    orders: Dict[str, dict]
+    listener: Optional[Callable[[dict], None]] = None
+
+    def __init__(
+        self,
+        balances: Dict[str, float],
+        maker_fee: float = 0.004,
+        taker_fee: float = 0.006,
+        latency: float = 0,
+    ) -> None:
+        self.balances = dict(balances)
+        self.holds = {currency: 0.0 for currency in balances}
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.latency = latency
+        self.orders = dict()
+        self.resting: Dict[str, dict] = dict()
+        self.ids = itertools.count(1)
+        self.lock = Lock()
+        self.calls = 0
+        self.fills = 0
+
+    def emit(self, kind: str, order: dict, **fields):
+        if self.listener is None:
+            return
+        msg = {
+            "type": kind,
+            "order_id": order["id"],
+            "product_id": order["product_id"],
+            "side": order["side"],
+            "price": str(order["price"]),
+            "time": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        }
+        msg.update(fields)
+        self.listener(msg)
+
+    def wait(self):
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def account(self, currency: str) -> dict:
+        balance = self.balances[currency]
+        hold = self.holds[currency]
+        return {
+            "id": currency,
+            "currency": currency,
+            "balance": str(balance),
+            "hold": str(hold),
+            "available": str(balance - hold),
+        }
+
+    def get_accounts(self) -> List[dict]:
+        self.wait()
+        with self.lock:
+            return [self.account(currency) for currency in self.balances]
+
+    def get_account(self, account_id: str) -> dict:
+        self.wait()
+        with self.lock:
+            if account_id not in self.balances:
+                return {"message": "NotFound"}
+            return self.account(account_id)
+
+    def _send_message(self, method: str, endpoint: str, params=None, data=None):
+        self.wait()
+        if endpoint == "/fees":
+            return {"maker_fee_rate": str(self.maker_fee), "taker_fee_rate": str(self.taker_fee)}
+        return {"message": "NotFound"}
+
+    def place_limit_order(self, product_id: str, side: str, price: str, size: str, **kwargs) -> dict:
+        self.wait()
+        target, currency = product_id.split("-")
+        price, size = float(price), float(size)
+        with self.lock:
+            if side == "buy":
+                held, amount = currency, price * size * (1 + self.maker_fee)
+            else:
+                held, amount = target, size
+            if amount > self.balances[held] - self.holds[held] + 1e-9:
+                return {"message": "Insufficient funds"}
+            self.holds[held] += amount
+            order = {
+                "id": str(next(self.ids)),
+                "product_id": product_id,
+                "side": side,
+                "price": price,
+                "size": size,
+                "held": held,
+                "amount": amount,
+                "status": "open",
+                "filled_size": 0.0,
+            }
+            self.orders[order["id"]] = order
+            self.resting[order["id"]] = order
+        self.emit("received", order, size=str(size), order_type="limit")
+        self.emit("open", order, remaining_size=str(size))
+        return self.order_status(order)
+
+    def order_status(self, order: dict) -> dict:
+        return {
+            "id": order["id"],
+            "product_id": order["product_id"],
+            "side": order["side"],
+            "price": str(order["price"]),
+            "size": str(order["size"]),
+            "status": order["status"],
+            "filled_size": str(order["filled_size"]),
+        }
+
+    def get_order(self, order_id: str) -> dict:
+        self.wait()
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return {"message": "NotFound"}
+            return self.order_status(order)
+
+    def cancel_order(self, order_id: str):
+        self.wait()
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order["status"] != "open":
+                return {"message": "NotFound"}
+            self.holds[order["held"]] -= order["amount"]
+            del self.orders[order_id]
+            del self.resting[order_id]
+        self.emit("done", order, remaining_size=str(order["size"]), reason="canceled")
+        return order_id
+
+    def on_price(self, msg: dict):
+        # Fill resting orders of the product that given trade crossed
+        price = float(msg["price"])
+        filled = []
+        with self.lock:
+            for order in list(self.resting.values()):
+                if order["product_id"] != msg["product_id"]:
+                    continue
+                if order["side"] == "buy" and price > order["price"]:
+                    continue
+                if order["side"] == "sell" and price < order["price"]:
+                    continue
+                self.fill(order)
+                filled.append(order)
+        for order in filled:
+            size = str(order["size"])
+            self.emit("match", order, size=size, maker_order_id=order["id"], maker_fee_rate=str(self.maker_fee))
+            self.emit("done", order, remaining_size="0", reason="filled")
+
+    def fill(self, order: dict):
+        target, currency = order["product_id"].split("-")
+        value = order["price"] * order["size"]
+        self.holds[order["held"]] -= order["amount"]
+        if order["side"] == "buy":
+            self.balances[currency] -= order["amount"]
+            self.balances[target] += order["size"]
+        else:
+            self.balances[target] -= order["size"]
+            self.balances[currency] += value * (1 - self.maker_fee)
+        order["status"] = "done"
+        order["filled_size"] = order["size"]
+        del self.resting[order["id"]]
+        self.fills += 1
+
+    def equity(self, prices: Dict[str, float], currency: str) -> float:
+        with self.lock:
+            total = self.balances.get(currency, 0.0)
+            for currency_pair, price in prices.items():
+                target, quote = currency_pair.split("-")
+                if quote == currency:
+                    total += self.balances.get(target, 0.0) * price
+            return total
+
+    def open_orders(self) -> int:
+        with self.lock:
+            return len(self.resting)
@@ -0,0 +1,105 @@
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from trader.app.stream import SIDES
+from trader.backtest import load_dataset
+
+NS_PER_SECOND = 1000 * 1000 * 1000
+
+
+def timestamps(times: np.ndarray) -> np.ndarray:
+    # Same format as exchange uses in ticker messages
+    return np.char.add(np.datetime_as_string(times.view("datetime64[ns]"), unit="us"), "Z")
+
+
+def ticker_message(pair: str, sequence: int, t: str, price, bid, ask, side: str, txid: int, vol) -> dict:
+    # Fields of ticker channel message that trader reads
+    return {
+        "type": "ticker",
+        "product_id": pair,
+        "sequence": sequence,
+        "price": str(price),
+        "best_bid": str(bid),
+        "best_ask": str(ask),
+        "side": side or "buy",
+        "time": t,
+        "trade_id": int(txid),
+        "last_size": str(vol),
+    }
+
+
+def messages(pair: str, columns: Dict[str, np.ndarray], first_sequence: int = 0) -> List[dict]:
+    # Ticker messages of one pair from columns in TRADE_SCHEMA layout
+    times = timestamps(columns["time"])
+    sides = np.array(SIDES, dtype=object)[columns["side"]]
+    return [
+        ticker_message(pair, first_sequence + i, str(t), price, bid, ask, side, txid, vol)
+        for i, (t, price, bid, ask, side, txid, vol) in enumerate(
+            zip(
+                times,
+                columns["close"].tolist(),
+                columns["bid"].tolist(),
+                columns["ask"].tolist(),
+                sides,
+                columns["txid"].tolist(),
+                columns["vol"].tolist(),
+            )
+        )
+    ]
+
+
+def interleave(feeds: List[List[dict]]) -> List[dict]:
+    # Messages of several pairs in order of their time, as one connection would deliver them
+    merged = [msg for feed in feeds for msg in feed]
+    merged.sort(key=lambda msg: msg["time"])
+    return merged
+
+
+def synthetic(
+    pairs: List[str],
+    count: int,
+    spacing: float = 0.05,
+    volatility: float = 0.002,
+    seed: int = 0,
+    end: Optional[float] = None,
+) -> List[dict]:
+    # Random walk of log price per pair, trades `spacing` seconds apart ending at `end` (now)
+    rng = np.random.default_rng(seed)
+    end = time.time() if end is None else end
+    per_pair = max(1, count // max(1, len(pairs)))
+    feeds = []
+    for k, pair in enumerate(pairs):
+        times = (end - spacing * len(pairs) * np.arange(per_pair, 0, -1) + spacing * k) * NS_PER_SECOND
+        close = 100 * np.exp(np.cumsum(rng.normal(0, volatility, per_pair)))
+        spread = close * 0.0005
+        columns = {
+            "time": times.astype(np.int64),
+            "close": np.round(close, 2),
+            "bid": np.round(close - spread, 2),
+            "ask": np.round(close + spread, 2),
+            "side": rng.integers(1, 3, per_pair),
+            "txid": np.arange(per_pair, dtype=np.int64),
+            "vol": np.round(rng.exponential(0.5, per_pair), 6),
+        }
+        feeds.append(messages(pair, columns, k * per_pair))
+    return interleave(feeds)
+
+
+def recorded(path: str, pairs: List[str], count: Optional[int] = None, end: Optional[float] = None) -> List[dict]:
+    # Last `count` trades of recorded dataset, shifted in time so that the newest ends now,
+    # as trader drops trades older than its windows
+    end = time.time() if end is None else end
+    feeds = []
+    per_pair = None if count is None else max(1, count // max(1, len(pairs)))
+    for pair in pairs:
+        columns = load_dataset(path, pair)
+        if per_pair is not None:
+            columns = {name: column[-per_pair:] for name, column in columns.items()}
+        columns = {name: np.asarray(column) for name, column in columns.items()}
+        if len(columns["time"]) == 0:
+            continue
+        columns["time"] = columns["time"] - columns["time"][-1] + int(end * NS_PER_SECOND)
+        feeds.append(messages(pair, columns))
+    return interleave(feeds)
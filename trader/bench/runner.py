@@ -0,0 +1,210 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from trader.app.core import MarketFeed, Trader, TraderWSClient
+from trader.bench.exchange import FakeExchange
+from trader.bench.feed import recorded, synthetic
+from trader.db.poordis import Poordis
+from trader.logs import log_to
+from trader.model import Config
+from trader.strategy.factory import get_strategy, strategies
+from trader.util import load_config, pair_configs
+
+
+class BenchTrader(Trader):
+    # Trader that keeps duration of every on_tick. Ticks are throttled on message time instead of
+    # wall clock, otherwise a feed faster than live finishes within a few tick periods and
+    # hardly any on_tick runs, so every message gets as many ticks as it would live.
+    tick_times: List[float]
+    message_tick: float = float("-inf")
+
+    def tick(self, time_index):
+        t = time_index.value / 1e9
+        if t - self.message_tick >= self.period:
+            self.message_tick = t
+            self.last_tick = float("-inf")
+        else:
+            self.last_tick = time.perf_counter()
+        super().tick(time_index)
+
+    def on_tick(self, time_index) -> bool:
+        started = time.perf_counter()
+        try:
+            return super().on_tick(time_index)
+        finally:
+            self.tick_times.append(time.perf_counter() - started)
+
+
+def peak_rss() -> float:
+    # Megabytes, ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_strategy(name: str, cfg: Config, args: argparse.Namespace, workdir: str, conn):
+    # Runs in its own process, so that peak RSS belongs to one strategy only
+    configs = pair_configs(cfg)
+    pairs = [c.target + "-" + c.currency for c in configs]
+    if args.dataset is not None:
+        feed_messages = recorded(args.dataset, pairs, args.messages)
+    else:
+        feed_messages = synthetic(pairs, args.messages, args.spacing, seed=args.seed)
+
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("logs", exist_ok=True)
+    # Keeps benchmark runs out of log of the tree bench was started from
+    log_to("logs/trades.log")
+    balances = dict()
+    for c in configs:
+        balances[c.currency] = args.cash
+        balances[c.target] = 0.0
+    exchange = FakeExchange(balances, latency=args.latency / 1000)
+    db = Poordis(path="data/poordis")
+    feed = MarketFeed(cfg.sandbox, apikey=cfg.apikey if args.user_channel else None)
+    traders = []
+    for c in configs:
+        trader = BenchTrader(db, get_strategy(name, c.strategy), c, feed, client=exchange)
+        trader.tick_times = []
+        traders.append(trader)
+    ws_client = TraderWSClient(pairs, feed, cfg.sandbox)
+    if args.user_channel:
+        # Order events go through the same handler as they would from authenticated websocket
+        exchange.listener = ws_client.on_message
+        ws_client.on_message({"type": "subscriptions", "channels": [{"name": "user", "product_ids": pairs}]})
+    baseline = peak_rss()
+
+    started = time.perf_counter()
+    for i, msg in enumerate(feed_messages):
+        if args.rate > 0:
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        exchange.on_price(msg)
+        ws_client.on_message(msg)
+    elapsed = time.perf_counter() - started
+
+    tick_times = np.array([t for trader in traders for t in trader.tick_times]) * 1000
+    prices = {trader.pair: trader.current_price for trader in traders}
+    result = {
+        "strategy": name,
+        "messages": len(feed_messages),
+        "elapsed": elapsed,
+        "messages_per_second": len(feed_messages) / max(elapsed, 1e-9),
+        "ticks": len(tick_times),
+        "tick_p50_ms": float(np.percentile(tick_times, 50)) if len(tick_times) > 0 else None,
+        "tick_p99_ms": float(np.percentile(tick_times, 99)) if len(tick_times) > 0 else None,
+        "tick_max_ms": float(tick_times.max()) if len(tick_times) > 0 else None,
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": peak_rss(),
+        "rest_calls": exchange.calls,
+        "fills": exchange.fills,
+        "equity": exchange.equity(prices, configs[0].currency),
+    }
+    for trader in traders:
+        trader.orders.stop()
+        trader.on_shutdown()
+    db.close()
+    conn.send(result)
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    ticks = "n/a"
+    if result["ticks"] > 0:
+        ticks = "p50 %.3f ms, p99 %.3f ms, max %.3f ms" % (
+            result["tick_p50_ms"],
+            result["tick_p99_ms"],
+            result["tick_max_ms"],
+        )
+    line = "%-10s | msgs: %d (%.0f/s) | ticks: %d, on_tick %s | rss: %.1f MB (%.1f MB before feed) | fills: %d"
+    line += " | rest calls: %d"
+    return line % (
+        result["strategy"],
+        result["messages"],
+        result["messages_per_second"],
+        result["ticks"],
+        ticks,
+        result["peak_rss_mb"],
+        result["baseline_rss_mb"],
+        result["fills"],
+        result["rest_calls"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feed ticker messages through trader against fake exchange")
+    parser.add_argument("--config", default="./resources/config.yaml")
+    parser.add_argument("--strategies", default=",".join(strategies.keys()), help="Comma separated strategies")
+    parser.add_argument("--messages", type=int, default=20000, help="Number of ticker messages")
+    parser.add_argument("--dataset", default=None, help="Replay recorded trades instead of synthetic ones")
+    parser.add_argument("--rate", type=float, default=0, help="Messages per second, 0 feeds as fast as possible")
+    parser.add_argument("--spacing", type=float, default=0.05, help="Seconds between synthetic trades")
+    parser.add_argument("--tick-rate", type=float, default=None, help="Ticks per second of message time")
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds every REST call takes")
+    parser.add_argument("--user-channel", action="store_true", help="Track orders from events instead of REST")
+    parser.add_argument("--cash", type=float, default=1000.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Write results to this file as well")
+    args = parser.parse_args()
+
+    names = args.strategies.split(",")
+    unknown = [name for name in names if name not in strategies]
+    if unknown:
+        parser.error("unknown strategies %s, expected some of %s" % (",".join(unknown), ",".join(strategies.keys())))
+    if not os.path.exists(args.config):
+        args.config = "./resources/template.yaml"
+    cfg = load_config(args.config)
+    cfg.db = "poordis"
+    cfg.workers = 0
+    cfg.initial_dataset = "dataset.csv"
+    if args.tick_rate is not None:
+        if args.tick_rate <= 0:
+            parser.error("--tick-rate has to be positive")
+        cfg.tick_rate = args.tick_rate
+    # Work directory is temporary, so program of vm strategy has to be found from here
+    cfg.strategy.program.path = os.path.abspath(cfg.strategy.program.path)
+    for pair in cfg.pairs:
+        if pair.strategy is not None:
+            pair.strategy.program.path = os.path.abspath(pair.strategy.program.path)
+
+    ctx = mp.get_context("spawn")
+    results = []
+    for name in names:
+        workdir = tempfile.mkdtemp(prefix="trader-bench-")
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=run_strategy, args=(name, cfg, args, workdir, child_conn))
+        process.start()
+        # Otherwise a crashed child never closes the pipe and recv() waits forever
+        child_conn.close()
+        try:
+            result = parent_conn.recv()
+        except EOFError:
+            result = None
+        process.join()
+        if result is None:
+            # Work directory is kept, it has the log of failed run
+            print("%-10s | failed, see %s" % (name, os.path.join(workdir, "logs", "trades.log")))
+            continue
+        shutil.rmtree(workdir, ignore_errors=True)
+        results.append(result)
+        print(format_result(result))
+        if result["ticks"] == 0:
+            print("%-10s | warning: no tick ran, feed more messages than fit in one tick period" % name)
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
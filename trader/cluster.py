@@ -0,0 +1,202 @@
+import multiprocessing as mp
+import os
+import queue
+from threading import Lock, Thread
+from typing import Dict, List
+
+from trader.app.account import ORDER_EVENTS
+from trader.app.core import MarketFeed, Trader
+from trader.db.factory import get_db
+from trader.logs import get_logger
+from trader.metrics import registry
+from trader.model import Config
+from trader.strategy.factory import get_strategy
+from trader.util import feed_apikey
+
+logger = get_logger()
+
+
+class QueueFeed:
+    # Worker side of the feed, ticker messages come from ingest process over a queue, as well
+    # as user channel events and its state, which every trader of the shard gets
+    traders: Dict[str, Trader]
+
+    def __init__(self, inbox: mp.Queue) -> None:
+        self.inbox = inbox
+        self.traders = dict()
+        self.active = True
+
+    def add(self, trader: Trader):
+        self.traders[trader.pair] = trader
+
+    def start(self):
+        self.thread = Thread(target=self.run, name="QueueFeed", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.active:
+            try:
+                msg = self.inbox.get(timeout=1)
+            except queue.Empty:
+                continue
+            kind = msg.get("type")
+            if kind in ORDER_EVENTS:
+                for trader in self.traders.values():
+                    trader.on_order(msg)
+            elif kind == "user_channel":
+                for trader in self.traders.values():
+                    trader.on_user_channel(msg["connected"])
+            else:
+                trader = self.traders.get(msg.get("product_id"))
+                if trader is not None:
+                    trader.on_price(msg)
+
+    def close(self):
+        self.active = False
+
+
+def run_shard(index: int, configs: List[Config], redis_host: str, inbox: mp.Queue, conn):
+    db_class = get_db(configs[0].db)
+    if configs[0].db == "poordis":
+        # Poordis is single-process, so every shard keeps its own files
+        db = db_class(path=f"data/poordis-{index}")
+    else:
+        db = db_class(host=redis_host)
+    feed = QueueFeed(inbox)
+    traders = dict()
+    for cfg in configs:
+        trader = Trader(db, get_strategy(cfg.trader, cfg.strategy), cfg, feed)
+        traders[trader.pair] = trader
+    feed.start()
+    conn.send(("ready", list(traders.keys())))
+
+    while True:
+        method, pair, args = conn.recv()
+        if method == "metrics":
+            conn.send(("ok", registry.collect()))
+            continue
+        if method == "shutdown":
+            for trader in traders.values():
+                trader.on_shutdown()
+            feed.close()
+            db.close()
+            conn.send(("ok", None))
+            break
+        try:
+            conn.send(("ok", getattr(traders[pair], method)(*args)))
+        except Exception as ex:
+            logger.error(f"Shard call {method} for {pair} failed", exc_info=ex)
+            conn.send(("error", str(ex)))
+
+
+class Shard:
+    # Ingest side of a worker process, requests are serialized over one pipe
+    index: int
+    pairs: List[str]
+
+    def __init__(self, index: int, configs: List[Config], redis_host: str) -> None:
+        ctx = mp.get_context("spawn")
+        self.index = index
+        self.inbox = ctx.Queue()
+        self.conn, child_conn = ctx.Pipe()
+        self.lock = Lock()
+        self.process = ctx.Process(
+            target=run_shard,
+            args=(index, configs, redis_host, self.inbox, child_conn),
+            name=f"Shard-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        # Otherwise a shard that died never closes the pipe and recv() waits forever
+        child_conn.close()
+        self.pairs = []
+
+    def died(self) -> RuntimeError:
+        self.process.join(1)
+        return RuntimeError(f"Shard {self.index} died with exit code {self.process.exitcode}, see logs/trades.log")
+
+    def wait_ready(self):
+        try:
+            status, pairs = self.conn.recv()
+        except EOFError:
+            raise self.died()
+        self.pairs = pairs
+        logger.info(f"Shard {self.index} ready, trading {', '.join(pairs)}")
+
+    def call(self, method: str, pair: str, *args):
+        with self.lock:
+            try:
+                self.conn.send((method, pair, args))
+                status, result = self.conn.recv()
+            except (EOFError, BrokenPipeError):
+                raise self.died()
+        if status != "ok":
+            raise RuntimeError(result)
+        return result
+
+    def shutdown(self):
+        try:
+            self.call("shutdown", None)
+        except (RuntimeError, OSError):
+            pass
+        self.process.join(30)
+
+
+class RemoteTrader:
+    # Stand-in for Trader living in a shard, exposes what server and feed need. Feed hands
+    # user channel to every trader, but shard fans it out itself, so only its first pair forwards it
+    pair: str
+
+    def __init__(self, pair: str, shard: Shard) -> None:
+        self.pair = pair
+        self.shard = shard
+        self.primary = pair == shard.pairs[0]
+
+    def on_price(self, msg):
+        self.shard.inbox.put(msg)
+
+    def on_order(self, msg):
+        if self.primary:
+            self.shard.inbox.put(msg)
+
+    def on_user_channel(self, connected: bool):
+        if self.primary:
+            self.shard.inbox.put({"type": "user_channel", "connected": connected})
+
+    def status(self):
+        return self.shard.call("status", self.pair)
+
+    def portfolio(self):
+        return self.shard.call("portfolio", self.pair)
+
+    def equity_csv(self, *args) -> str:
+        return self.shard.call("equity_csv", self.pair, *args)
+
+
+class Cluster:
+    # Shards pairs across worker processes, this process only ingests websocket
+    # and fans ticker messages out to shard that trades the pair
+    shards: List[Shard]
+    traders: Dict[str, RemoteTrader]
+
+    def __init__(self, configs: List[Config], workers: int, redis_host: str) -> None:
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(configs)))
+        self.shards = [Shard(i, configs[i::workers], redis_host) for i in range(workers)]
+        self.feed = MarketFeed(configs[0].sandbox, configs[0].ws_url, feed_apikey(configs[0]))
+        self.traders = dict()
+        for shard in self.shards:
+            shard.wait_ready()
+            for pair in shard.pairs:
+                self.traders[pair] = RemoteTrader(pair, shard)
+                self.feed.add(self.traders[pair])
+        self.feed.start()
+
+    def collect_metrics(self) -> Dict[str, list]:
+        return {f"shard-{shard.index}": shard.call("metrics", None) for shard in self.shards}
+
+    def shutdown(self):
+        self.feed.close()
+        for shard in self.shards:
+            shard.shutdown()
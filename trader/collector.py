@@ -0,0 +1,137 @@
+import argparse
+import os
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from trader.app.checkpoint import Checkpointer
+from trader.app.core import MarketFeed
+from trader.app.store import PartitionedStore
+from trader.app.stream import TRADE_SCHEMA, TradeStream, ticker_row
+from trader.logs import get_logger
+from trader.model import CheckpointDef
+from trader.util import load_config, pair_configs
+
+logger = get_logger()
+
+
+class PairCollector:
+    # Ticker messages of one pair are appended to in-memory columns and written out in
+    # batches by checkpointer, so websocket thread never waits for disk
+    pair: str
+    stream: TradeStream
+    store: PartitionedStore
+    received: int = 0
+
+    def __init__(self, pair: str, path: str, partition: Optional[float], checkpoint: CheckpointDef) -> None:
+        self.pair = pair
+        self.lock = Lock()
+        self.stream = TradeStream(pair)
+        self.store = PartitionedStore(
+            os.path.join(path, pair), TRADE_SCHEMA, partition, checkpoint.segment_rows, checkpoint.segment_age
+        )
+
+    def on_price(self, obj):
+        row = ticker_row(obj)
+        with self.lock:
+            self.stream.append(*row)
+            self.received += 1
+
+    def flush(self) -> int:
+        with self.lock:
+            columns = self.stream.take()
+        # Messages of different connections might interleave, store expects rows ordered by time
+        order = np.argsort(columns["time"], kind="stable")
+        return self.store.append({name: column[order] for name, column in columns.items()})
+
+
+class Collector:
+    # Records trades of many pairs from one websocket connection into data/<collector>/<pair>/,
+    # partitioned by time, in the same layout Trader keeps its own trade stream in
+    pair: str = "collector"
+    collectors: Dict[str, PairCollector]
+
+    def __init__(
+        self,
+        pairs: List[str],
+        path: str,
+        partition: Optional[float],
+        checkpoint: CheckpointDef,
+        sandbox: bool = False,
+        url: Optional[str] = None,
+    ) -> None:
+        self.collectors = {pair: PairCollector(pair, path, partition, checkpoint) for pair in pairs}
+        self.written = 0
+        self.feed = MarketFeed(sandbox, url)
+        for collector in self.collectors.values():
+            self.feed.add(collector)
+        self.checkpointer = Checkpointer(self, checkpoint)
+
+    def start(self):
+        self.feed.start()
+        self.checkpointer.start()
+
+    def unflushed_rows(self) -> int:
+        return sum(len(collector.stream) for collector in self.collectors.values())
+
+    def flush_streams(self):
+        for collector in self.collectors.values():
+            self.written += collector.flush()
+
+    def compact_streams(self):
+        for collector in self.collectors.values():
+            collector.store.compact()
+
+    def close(self):
+        self.feed.close()
+        self.checkpointer.stop()
+        self.flush_streams()
+        for collector in self.collectors.values():
+            collector.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record ticker messages of many pairs into column stores")
+    parser.add_argument("--config", default="./resources/config.yaml")
+    parser.add_argument("--pairs", default=None, help="Comma separated pairs, defaults to ones from config")
+    parser.add_argument("--out", default="data/collector")
+    parser.add_argument(
+        "--partition", type=float, default=None, help="Seconds of trades per partition of new stores, 86400 by default"
+    )
+    parser.add_argument("--sandbox", action="store_true")
+    parser.add_argument("--ws-url", default=None, help="Websocket feed, i.e. ws://127.0.0.1:8765 of trader.replay")
+    parser.add_argument("--interval", type=float, default=30, help="Seconds between progress logs")
+    args = parser.parse_args()
+
+    checkpoint = CheckpointDef()
+    sandbox = args.sandbox
+    url = args.ws_url
+    if args.pairs is not None:
+        pairs = [pair.strip().upper() for pair in args.pairs.split(",") if pair.strip()]
+    else:
+        cfg = load_config(args.config)
+        pairs = [c.target + "-" + c.currency for c in pair_configs(cfg)]
+        checkpoint = cfg.checkpoint
+        sandbox = sandbox or cfg.sandbox
+        url = url or cfg.ws_url
+
+    collector = Collector(pairs, args.out, args.partition, checkpoint, sandbox, url)
+    collector.start()
+    logger.info(f"Collecting {', '.join(pairs)} into {args.out}")
+    last = 0
+    try:
+        while True:
+            time.sleep(args.interval)
+            received = sum(c.received for c in collector.collectors.values())
+            logger.info(f"Received {received} (+{received - last}), written {collector.written}")
+            last = received
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,45 +2,212 @@ import json
 import os
 import time
 from threading import Lock
-from typing import Optional
+from typing import Dict, List, Optional
 
 class Poordis:
-    lock = Lock()
+    # Keeps everything in memory, every write is appended to a log that gets replayed
+    # on start and periodically compacted into a snapshot (written to a temp file and
+    # atomically renamed over the old one). Expired keys are dropped lazily.
+    lock: Lock
+    data: Dict[str, list]
 
-    def __init__(self, **kwargs) -> None:
-        pass
+    def __init__(
+        self,
+        path: str = "data/poordis",
+        compact_every: int = 10000,
+        compact_interval: float = 300,
+        fsync: bool = False,
+        **kwargs,
+    ) -> None:
+        self.lock = Lock()
+        self.snapshot_path = path + ".json"
+        self.log_path = path + ".log"
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.fsync = fsync
+        self.data = self.load_data()
+        self.log_entries = 0
+        self.replay_log()
+        self.last_compaction = time.time()
+        self.log = open(self.log_path, "a", encoding="utf-8")
 
     def load_data(self):
-        if not os.path.exists("data/poordis.json"):
+        if not os.path.exists(self.snapshot_path):
             return {}
-        with open("data/poordis.json", "r", encoding="utf-8") as f:
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
             data = json.load(f)
             return data
-    
-    def store_data(self, data):
-        with open("data/poordis.json", "w", encoding="utf-8") as f:
-            json.dump(data, f)
 
-    def get(self, key: str) -> Optional[bytes]:
+    def replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        valid = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    name, args = json.loads(line)
+                except ValueError:
+                    # Torn write at the end of log after a crash, cut it off so we can append again
+                    break
+                getattr(self, "do_" + name)(*args)
+                self.log_entries += 1
+                valid += len(line)
+        if valid != os.path.getsize(self.log_path):
+            os.truncate(self.log_path, valid)
+
+    def store_data(self):
+        now = time.time()
+        live = {key: item for key, item in self.data.items() if item[1] == 0 or item[1] > now}
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(live, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.data = live
+
+    def compact(self):
         with self.lock:
-            data = self.load_data()
-            if key not in data:
-                return None
-            item = data[key]
-            if item[1] > 0 and time.time() > item[1]:
-                return None
-            return str(item[0]).encode("utf-8")
+            self.store_data()
+            # Replaying log over the new snapshot is idempotent, so crash before truncate is fine
+            self.log.close()
+            self.log = open(self.log_path, "w", encoding="utf-8")
+            self.log_entries = 0
+            self.last_compaction = time.time()
 
-    def setex(self, key: str, ex: Optional[int], value) -> bool:
+    def append_log(self, entries: List[str]):
+        self.log.write("".join(entries))
+        self.log.flush()
+        if self.fsync:
+            os.fsync(self.log.fileno())
+        self.log_entries += len(entries)
+
+    def run(self, commands, write: bool):
         with self.lock:
-            data = self.load_data()
-            if ex is not None:
-                ex = time.time() + ex
-            else:
-                ex = 0
-            data[key] = [str(value), ex]
-            self.store_data(data)
-            return True
+            results = [getattr(self, "do_" + name)(*args) for name, args in commands]
+            if write:
+                entries = [json.dumps([name, args]) + "\n" for name, args in commands if name in ("setex", "hset")]
+                self.append_log(entries)
+        if write and (
+            self.log_entries >= self.compact_every or time.time() - self.last_compaction >= self.compact_interval
+        ):
+            self.compact()
+        return results
+
+    def live(self, key: str) -> Optional[list]:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        if item[1] > 0 and time.time() > item[1]:
+            del self.data[key]
+            return None
+        return item
+
+    def do_get(self, key: str) -> Optional[bytes]:
+        item = self.live(key)
+        if item is None:
+            return None
+        return str(item[0]).encode("utf-8")
+
+    def do_pttl(self, key: str) -> int:
+        item = self.live(key)
+        if item is None:
+            return -2
+        if item[1] == 0:
+            return -1
+        return int((item[1] - time.time()) * 1000)
+
+    def do_setex(self, key: str, ex: Optional[float], value) -> bool:
+        # Log stores absolute expiry, so it's replayed with the original deadline
+        self.data[key] = [str(value), ex if ex is not None else 0]
+        return True
+
+    def do_hget(self, key: str, field: str) -> Optional[bytes]:
+        item = self.live(key)
+        if item is None or not isinstance(item[0], dict) or field not in item[0]:
+            return None
+        return item[0][field].encode("utf-8")
+
+    def do_hgetall(self, key: str) -> Dict[bytes, bytes]:
+        item = self.live(key)
+        if item is None or not isinstance(item[0], dict):
+            return {}
+        return {k.encode("utf-8"): v.encode("utf-8") for k, v in item[0].items()}
+
+    def do_hset(self, key: str, mapping: Dict[str, str]) -> int:
+        item = self.live(key)
+        if item is None or not isinstance(item[0], dict):
+            item = self.data[key] = [dict(), 0]
+        added = len([k for k in mapping if k not in item[0]])
+        item[0].update({k: str(v) for k, v in mapping.items()})
+        return added
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.run([("get", (key,))], False)[0]
+
+    def pttl(self, key: str) -> int:
+        return self.run([("pttl", (key,))], False)[0]
+
+    def setex(self, key: str, ex: Optional[int], value) -> bool:
+        return self.pipeline().setex(key, ex, value).execute()[0]
 
     def set(self, key: str, value) -> bool:
         return self.setex(key, None, value)
+
+    def hget(self, key: str, field: str) -> Optional[bytes]:
+        return self.run([("hget", (key, field))], False)[0]
+
+    def hgetall(self, key: str) -> Dict[bytes, bytes]:
+        return self.run([("hgetall", (key,))], False)[0]
+
+    def hset(self, key: str, mapping: Dict[str, str]) -> int:
+        return self.run([("hset", (key, {k: str(v) for k, v in mapping.items()}))], True)[0]
+
+    def pipeline(self, transaction: bool = True) -> "PoordisPipeline":
+        return PoordisPipeline(self)
+
+    def close(self):
+        self.compact()
+        self.log.close()
+
+
+class PoordisPipeline:
+    # Mimics redis pipeline, all queued commands run under one lock and one log append
+    def __init__(self, db: Poordis) -> None:
+        self.db = db
+        self.commands = []
+        self.write = False
+
+    def queue(self, name: str, args: tuple, write: bool = False):
+        self.commands.append((name, args))
+        self.write = self.write or write
+        return self
+
+    def get(self, key: str):
+        return self.queue("get", (key,))
+
+    def pttl(self, key: str):
+        return self.queue("pttl", (key,))
+
+    def setex(self, key: str, ex: Optional[int], value):
+        expires = time.time() + ex if ex is not None else None
+        return self.queue("setex", (key, expires, str(value)), True)
+
+    def set(self, key: str, value):
+        return self.setex(key, None, value)
+
+    def hget(self, key: str, field: str):
+        return self.queue("hget", (key, field))
+
+    def hgetall(self, key: str):
+        return self.queue("hgetall", (key,))
+
+    def hset(self, key: str, mapping: Dict[str, str]):
+        return self.queue("hset", (key, {k: str(v) for k, v in mapping.items()}), True)
+
+    def execute(self):
+        commands = self.commands
+        self.commands = []
+        if len(commands) == 0:
+            return []
+        return self.db.run(commands, self.write)
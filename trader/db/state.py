@@ -0,0 +1,92 @@
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+
+class StateCache:
+    # Write-through cache in front of Redis. Reads are served from memory after first load,
+    # writes land in memory immediately and are batched into one pipeline on flush, Redis
+    # stays the durable store. Trader is the only writer of its keys, so once loaded,
+    # memory is authoritative. Optionally, entries without expiry are kept in one hash.
+    prefix: str
+    use_hash: bool
+
+    def __init__(self, db, prefix: str, use_hash: bool = False) -> None:
+        self.db = db
+        self.prefix = prefix
+        self.use_hash = use_hash
+        self.hash_key = prefix + ":hash"
+        self.values: Dict[str, Tuple[Optional[str], float]] = dict()
+        self.pending: Dict[str, Tuple[str, Optional[int]]] = dict()
+        self.lock = Lock()
+        if use_hash:
+            self.load_hash()
+
+    def load_hash(self):
+        for key, value in self.db.hgetall(self.hash_key).items():
+            key = key.decode("utf-8") if isinstance(key, bytes) else key
+            self.values[key] = (self.decode(value), 0)
+
+    def decode(self, value) -> Optional[str]:
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+
+    def fetch(self, entity: str) -> Tuple[Optional[str], float]:
+        if self.use_hash:
+            value = self.db.hget(self.hash_key, entity)
+            if value is not None:
+                return self.decode(value), 0
+        # Plain keys are also used for entries with expiry and by older deployments
+        pipe = self.db.pipeline()
+        pipe.get(self.prefix + ":" + entity)
+        pipe.pttl(self.prefix + ":" + entity)
+        value, ttl = pipe.execute()
+        expires = time.time() + ttl / 1000 if ttl is not None and ttl > 0 else 0
+        return self.decode(value), expires
+
+    def get(self, entity: str) -> Optional[str]:
+        with self.lock:
+            seen = self.values.get(entity)
+            if seen is not None and (seen[1] == 0 or time.time() < seen[1]):
+                return seen[0]
+        item = self.fetch(entity)
+        with self.lock:
+            # Don't overwrite value that was written while we were fetching
+            current = self.values.get(entity)
+            if current is seen:
+                self.values[entity] = current = item
+            return current[0]
+
+    def set(self, entity: str, value, ex: Optional[int] = None):
+        value = str(value)
+        with self.lock:
+            self.values[entity] = (value, time.time() + ex if ex is not None else 0)
+            self.pending[entity] = (value, ex)
+
+    def flush(self) -> int:
+        with self.lock:
+            pending = self.pending
+            self.pending = dict()
+        if len(pending) == 0:
+            return 0
+        pipe = self.db.pipeline()
+        mapping = dict()
+        for entity, (value, ex) in pending.items():
+            if ex is not None:
+                pipe.setex(self.prefix + ":" + entity, ex, value)
+            elif self.use_hash:
+                mapping[entity] = value
+            else:
+                pipe.set(self.prefix + ":" + entity, value)
+        if len(mapping) > 0:
+            pipe.hset(self.hash_key, mapping=mapping)
+        try:
+            pipe.execute()
+        except Exception:
+            # Put back whatever wasn't overwritten meanwhile, so next flush retries it
+            with self.lock:
+                for entity, item in pending.items():
+                    self.pending.setdefault(entity, item)
+            raise
+        return len(pending)
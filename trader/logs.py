@@ -3,16 +3,29 @@ import logging
 logger = None
 
 
+def file_handler(path: str) -> logging.FileHandler:
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    fh = logging.FileHandler(path)
+    fh.setLevel(logging.INFO)
+    fh.setFormatter(formatter)
+    return fh
+
+
 def get_logger():
     global logger
     if logger is None:
         logger = logging.getLogger("server")
         logger.setLevel(logging.INFO)
-
-        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-        fh = logging.FileHandler("logs/trades.log")
-        fh.setLevel(logging.INFO)
-        fh.setFormatter(formatter)
-        logger.addHandler(fh)
+        logger.addHandler(file_handler("logs/trades.log"))
 
     return logger
+
+
+def log_to(path: str):
+    # Handler is opened on first import relative to working directory of that moment
+    current = get_logger()
+    for handler in list(current.handlers):
+        if isinstance(handler, logging.FileHandler):
+            current.removeHandler(handler)
+            handler.close()
+    current.addHandler(file_handler(path))
@@ -0,0 +1,233 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Seconds, from 100us of a tick to 10s of a slow REST call
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+class Metric:
+    # One metric family, values are kept per tuple of label values and only turned
+    # into Prometheus text format when scraped
+    kind: str = "untyped"
+    name: str
+    help: str
+    labels: Labels
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = Lock()
+        self.values: Dict[Labels, Any] = dict()
+
+    def label_dict(self, values: Labels) -> Dict[str, str]:
+        return dict(zip(self.labels, values))
+
+    def samples(self) -> List[Sample]:
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name, self.label_dict(labels), value) for labels, value in items]
+
+    def collect(self) -> Family:
+        return self.name, self.kind, self.help, self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    # Either set explicitly or read from callback at scrape time, i.e. size of a buffer
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        super().__init__(name, help, labels)
+        self.callbacks: Dict[Labels, Callable[[], float]] = dict()
+
+    def set(self, value: float, *labels: str):
+        with self.lock:
+            self.values[labels] = value
+
+    def set_function(self, fn: Callable[[], float], *labels: str):
+        with self.lock:
+            self.callbacks[labels] = fn
+
+    def samples(self) -> List[Sample]:
+        samples = super().samples()
+        with self.lock:
+            callbacks = list(self.callbacks.items())
+        for labels, fn in callbacks:
+            try:
+                samples.append((self.name, self.label_dict(labels), float(fn())))
+            except Exception:
+                pass
+        return samples
+
+
+class Histogram(Metric):
+    # Per label set, counts of observations per bucket (not cumulative until scraped), sum and count
+    kind = "histogram"
+    buckets: List[float]
+
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: Optional[List[float]] = None) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = list(buckets or LATENCY_BUCKETS)
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def samples(self) -> List[Sample]:
+        with self.lock:
+            items = [(labels, (list(state[0]), state[1], state[2])) for labels, state in self.values.items()]
+        samples = []
+        for labels, (counts, total, count) in items:
+            base = self.label_dict(labels)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ["+Inf"], counts):
+                cumulative += bucket
+                samples.append((self.name + "_bucket", dict(base, le=str(bound)), cumulative))
+            samples.append((self.name + "_sum", base, total))
+            samples.append((self.name + "_count", base, count))
+        return samples
+
+
+class Timer:
+    # Context manager observing how long its block took
+    def __init__(self, histogram: Histogram, labels: Labels) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Registry:
+    metrics: Dict[str, Metric]
+
+    def __init__(self) -> None:
+        self.metrics = dict()
+        self.lock = Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Labels = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Labels = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Labels = (), buckets: Optional[List[float]] = None) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collect(self) -> List[Family]:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return [metric.collect() for metric in metrics]
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def merge(groups: Dict[str, List[Family]], label: str) -> List[Family]:
+    # Families collected by several processes, samples of each get `label` set to its key
+    merged: Dict[str, Family] = dict()
+    for key, group in groups.items():
+        for name, kind, help, samples in group:
+            samples = [(sample, dict(labels, **{label: key}), value) for sample, labels, value in samples]
+            if name in merged:
+                merged[name][3].extend(samples)
+            else:
+                merged[name] = (name, kind, help, list(samples))
+    return list(merged.values())
+
+
+def render(families: List[Family]) -> str:
+    # Prometheus text exposition format 0.0.4
+    lines = []
+    for name, kind, help, samples in families:
+        lines.append(f"# HELP {name} {escape(help)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample, labels, value in samples:
+            if labels:
+                pairs = ",".join(f'{key}="{escape(label)}"' for key, label in labels.items())
+                lines.append(f"{sample}{{{pairs}}} {float(value)!r}")
+            else:
+                lines.append(f"{sample} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+class Timed:
+    # Proxy timing every method call of wrapped client (Redis, cbpro) into histogram labelled
+    # by client and method, failed calls are counted too. Results of `wrap` methods get proxied
+    # as well (i.e. Redis pipelines, so their execute() is timed)
+    def __init__(self, target, client: str, wrap: Tuple[str, ...] = ()) -> None:
+        self._target = target
+        self._client = client
+        self._wrap = wrap
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        client = self._client
+        wrap = name in self._wrap
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                client_errors.inc(client, name)
+                raise
+            finally:
+                client_seconds.observe(time.perf_counter() - started, client, name)
+            return Timed(result, client + "." + name) if wrap else result
+
+        return call
+
+
+registry = Registry()
+
+on_price_seconds = registry.histogram("trader_on_price_seconds", "Time spent handling one ticker message", ("pair",))
+on_tick_seconds = registry.histogram("trader_on_tick_seconds", "Time spent in Trader.on_tick", ("pair",))
+ws_lag_seconds = registry.histogram(
+    "trader_ws_lag_seconds",
+    "Delay between exchange time of ticker message and its receipt",
+    ("pair",),
+    [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60],
+)
+ticks_total = registry.counter("trader_ticks_total", "Ticks that ran on_tick", ("pair",))
+ticks_skipped = registry.counter("trader_ticks_skipped_total", "Ticker messages that didn't tick due to throttle", ("pair",))
+client_seconds = registry.histogram(
+    "trader_client_seconds", "Latency of calls to Redis and Coinbase REST", ("client", "method")
+)
+client_errors = registry.counter("trader_client_errors_total", "Failed calls to Redis and Coinbase REST", ("client", "method"))
+stream_rows = registry.gauge("trader_trade_stream_rows", "Rows of trade stream kept in memory", ("pair",))
+stream_bytes = registry.gauge("trader_trade_stream_bytes", "Memory allocated by trade stream columns", ("pair",))
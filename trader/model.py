@@ -16,18 +16,56 @@ class TemperatureDef(BaseModel):
     window: int
 
 
+class CheckpointDef(BaseModel):
+    interval: float = 60
+    rows: int = 10000
+    segment_rows: int = 1000000
+    segment_age: float = 3600
+    compact_interval: float = 600
+
+
+class ProgramDef(BaseModel):
+    path: str = "resources/strategy.asm"
+    max_steps: int = 5000
+    max_time: float = 5
+
+
+class EquityDef(BaseModel):
+    raw: float = 1440
+    minutes: float = 43200
+    max_points: int = 2000
+    cache_ttl: float = 1
+
+
+class OrdersDef(BaseModel):
+    websocket: bool = True
+    reconcile: float = 60
+
+
 class TradingStrategy(BaseModel):
     buy: List[float]
     buy_underprice: float
     sell: List[float]
     window: float
     extra: Optional[object]
+    program: ProgramDef = ProgramDef()
+
+
+class PairDef(BaseModel):
+    target: str
+    currency: str
+    target_precision: Optional[int]
+    currency_precision: Optional[int]
+    trader: Optional[str]
+    strategy: Optional[TradingStrategy]
 
 
 class Config(BaseModel):
     sandbox: bool
+    ws_url: Optional[str] = None
     forex: bool = False
     db: str = "redis"
+    state_hash: bool = False
     initial_dataset: Optional[str] = "stock_dataset.csv"
     currency: str
     target: str
@@ -41,5 +79,11 @@ class Config(BaseModel):
     strategy: TradingStrategy
     place_immediately: bool
     tick_rate: float
+    order_queue: int = 1
     autocancel: float
     temperature: TemperatureDef
+    checkpoint: CheckpointDef = CheckpointDef()
+    equity: EquityDef = EquityDef()
+    orders: OrdersDef = OrdersDef()
+    pairs: List[PairDef] = []
+    workers: int = 0
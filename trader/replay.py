@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import os
+import struct
+import time
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from trader.app.stream import SIDES
+from trader.backtest import load_dataset
+from trader.bench.feed import ticker_message
+from trader.logs import get_logger
+
+logger = get_logger()
+
+# RFC 6455
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+MAX_PAYLOAD = 1 << 20
+# Seconds client has to answer our close frame before TCP connection is dropped
+CLOSE_TIMEOUT = 5
+
+
+class ProtocolError(Exception):
+    code: int
+
+    def __init__(self, message: str, code: int = CLOSE_PROTOCOL_ERROR) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key: str) -> str:
+    digest = hashlib.sha1((key + WS_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def encode_frame(opcode: int, payload: bytes) -> bytes:
+    # Server frames are never masked nor fragmented
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def unmask(payload: bytes, mask: bytes) -> bytes:
+    # XOR whole payload at once as one big integer instead of byte by byte
+    n = len(payload)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[bool, int, bytes]:
+    head = await reader.readexactly(2)
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    if head[0] & 0x70:
+        raise ProtocolError("Reserved bits set")
+    if not head[1] & 0x80:
+        raise ProtocolError("Client frames have to be masked")
+    length = head[1] & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if opcode >= OP_CLOSE and (length > 125 or not fin):
+        raise ProtocolError("Invalid control frame")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError("Frame too big", CLOSE_TOO_BIG)
+    mask = await reader.readexactly(4)
+    payload = await reader.readexactly(length)
+    return fin, opcode, unmask(payload, mask)
+
+
+def http_response(status: str, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status}"] + [f"{key}: {value}" for key, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class Connection:
+    # One websocket client and products it subscribed to
+    products: Set[str]
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.products = set()
+        self.closing = False
+        self.peer = writer.get_extra_info("peername")
+
+    async def handshake(self) -> bool:
+        try:
+            request = await self.reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return False
+        lines = request.decode("latin-1").split("\r\n")
+        method = lines[0].split(" ")
+        headers = dict()
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        upgrade = "websocket" == headers.get("upgrade", "").lower()
+        if method[0] != "GET" or not upgrade or key is None:
+            self.writer.write(http_response("400 Bad Request", {"Content-Length": "0", "Connection": "close"}))
+            return False
+        if headers.get("sec-websocket-version") != "13":
+            self.writer.write(http_response("426 Upgrade Required", {"Sec-WebSocket-Version": "13"}))
+            return False
+        self.writer.write(
+            http_response(
+                "101 Switching Protocols",
+                {"Upgrade": "websocket", "Connection": "Upgrade", "Sec-WebSocket-Accept": accept_key(key)},
+            )
+        )
+        await self.writer.drain()
+        return True
+
+    def send(self, opcode: int, payload: bytes):
+        if not self.closing:
+            self.writer.write(encode_frame(opcode, payload))
+
+    def send_json(self, obj: dict):
+        self.send(OP_TEXT, json.dumps(obj).encode("utf-8"))
+
+    async def close(self, code: int = CLOSE_NORMAL, reason: str = ""):
+        # TCP connection is closed once client answers, closing it right away with unread pings
+        # in our buffer would reset it and client would lose messages it didn't read yet
+        if self.closing:
+            return
+        self.send(OP_CLOSE, struct.pack("!H", code) + reason.encode("utf-8"))
+        self.closing = True
+        asyncio.get_running_loop().call_later(CLOSE_TIMEOUT, self.writer.transport.abort)
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    def abort(self):
+        # Drops TCP connection without close handshake, as a network failure would
+        self.closing = True
+        self.writer.transport.abort()
+
+    async def receive(self):
+        # Yields complete text messages, answers control frames on the way
+        fragments: List[bytes] = []
+        while True:
+            fin, opcode, payload = await read_frame(self.reader)
+            if opcode == OP_PING:
+                self.send(OP_PONG, payload)
+            elif opcode == OP_PONG:
+                pass
+            elif opcode == OP_CLOSE:
+                code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+                await self.close(code)
+                return
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONTINUATION):
+                if (opcode == OP_CONTINUATION) != (len(fragments) > 0):
+                    raise ProtocolError("Unexpected continuation frame")
+                fragments.append(payload)
+                if sum(len(fragment) for fragment in fragments) > MAX_PAYLOAD:
+                    raise ProtocolError("Message too big", CLOSE_TOO_BIG)
+                if fin:
+                    yield b"".join(fragments)
+                    fragments = []
+            else:
+                raise ProtocolError(f"Unknown opcode {opcode}")
+
+
+def subscribed_products(msg: dict) -> Set[str]:
+    # Products of subscribe/unsubscribe message, channels are either names or {name, product_ids}
+    products = set(msg.get("product_ids") or [])
+    for channel in msg.get("channels") or []:
+        if isinstance(channel, dict) and channel.get("name") == "ticker":
+            products.update(channel.get("product_ids") or [])
+    return products
+
+
+class Replay:
+    # Recorded trades of all products merged by time and broadcast as ticker messages to
+    # subscribed connections, like a single shared market. Pace follows recorded time divided by
+    # speed (0 sends as fast as clients read), messages are stamped with current time, so
+    # trader windows see N times the live message rate. Clients that are disconnected miss
+    # messages sent meanwhile.
+    columns: Dict[str, Dict[str, np.ndarray]]
+    connections: Set[Connection]
+
+    def __init__(
+        self,
+        columns: Dict[str, Dict[str, np.ndarray]],
+        speed: float = 1,
+        loop: bool = False,
+        disconnect_every: int = 0,
+        drop: bool = False,
+    ) -> None:
+        self.columns = columns
+        self.speed = speed
+        self.loop = loop
+        self.disconnect_every = disconnect_every
+        self.drop = drop
+        self.connections = set()
+        self.subscribed = asyncio.Event()
+        self.done = asyncio.Event()
+        self.sent = 0
+        self.delivered = 0
+        self.disconnects = 0
+        self.pairs = list(columns.keys())
+        self.sequences = {pair: 0 for pair in self.pairs}
+        lengths = [len(columns[pair]["time"]) for pair in self.pairs]
+        times = np.concatenate([columns[pair]["time"] for pair in self.pairs])
+        self.order = np.argsort(times, kind="stable")
+        self.times = times[self.order]
+        self.owners = np.repeat(np.arange(len(self.pairs)), lengths)[self.order]
+        self.rows = np.concatenate([np.arange(n) for n in lengths])[self.order]
+
+    def products(self) -> Set[str]:
+        return set(self.pairs)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = Connection(reader, writer)
+        if not await conn.handshake():
+            writer.close()
+            return
+        logger.info(f"Replay client {conn.peer} connected")
+        self.connections.add(conn)
+        try:
+            async for data in conn.receive():
+                self.on_message(conn, data)
+        except ProtocolError as e:
+            await conn.close(e.code, str(e))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections.discard(conn)
+            writer.close()
+            logger.info(f"Replay client {conn.peer} disconnected")
+
+    def on_message(self, conn: Connection, data: bytes):
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            conn.send_json({"type": "error", "message": "Malformed JSON"})
+            return
+        products = subscribed_products(msg)
+        if msg.get("type") == "subscribe":
+            unknown = products - self.products()
+            if unknown:
+                conn.send_json(
+                    {"type": "error", "message": "Failed to subscribe", "reason": f"{', '.join(unknown)} not replayed"}
+                )
+            conn.products.update(products & self.products())
+        elif msg.get("type") == "unsubscribe":
+            conn.products.difference_update(products)
+        else:
+            conn.send_json({"type": "error", "message": f"Unknown message type {msg.get('type')}"})
+            return
+        channels = [{"name": "ticker", "product_ids": sorted(conn.products)}]
+        conn.send_json({"type": "subscriptions", "channels": channels})
+        if conn.products:
+            self.subscribed.set()
+
+    def message(self, i: int) -> Tuple[str, bytes]:
+        pair = self.pairs[self.owners[i]]
+        row = self.rows[i]
+        columns = self.columns[pair]
+        self.sequences[pair] += 1
+        now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        msg = ticker_message(
+            pair,
+            self.sequences[pair],
+            now,
+            float(columns["close"][row]),
+            float(columns["bid"][row]),
+            float(columns["ask"][row]),
+            SIDES[columns["side"][row]],
+            columns["txid"][row],
+            float(columns["vol"][row]),
+        )
+        return pair, encode_frame(OP_TEXT, json.dumps(msg).encode("utf-8"))
+
+    async def broadcast(self, pair: str, frame: bytes):
+        receivers = [conn for conn in self.connections if pair in conn.products and not conn.closing]
+        for conn in receivers:
+            conn.writer.write(frame)
+        self.delivered += len(receivers)
+        # Slowest client sets the pace at max speed, as a real ingest backlog would
+        for conn in receivers:
+            try:
+                await conn.writer.drain()
+            except ConnectionError:
+                self.connections.discard(conn)
+
+    async def disconnect(self):
+        self.disconnects += 1
+        logger.info(f"Injecting disconnect #{self.disconnects} of {len(self.connections)} clients")
+        for conn in list(self.connections):
+            if self.drop:
+                conn.abort()
+            else:
+                await conn.close(CLOSE_GOING_AWAY, "Injected disconnect")
+            self.connections.discard(conn)
+
+    async def run(self):
+        await self.subscribed.wait()
+        event_loop = asyncio.get_running_loop()
+        while len(self.times) > 0:
+            started = event_loop.time()
+            first = self.times[0]
+            for i in range(len(self.times)):
+                if self.speed > 0:
+                    delay = started + (self.times[i] - first) / 1e9 / self.speed - event_loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                elif i % 256 == 0:
+                    await asyncio.sleep(0)
+                pair, frame = self.message(i)
+                await self.broadcast(pair, frame)
+                self.sent += 1
+                if self.disconnect_every > 0 and self.sent % self.disconnect_every == 0:
+                    await self.disconnect()
+            if not self.loop:
+                break
+        for conn in list(self.connections):
+            await conn.close(CLOSE_NORMAL, "Replay finished")
+        self.done.set()
+
+    async def report(self, interval: float):
+        last, last_time = 0, time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            rate = (self.sent - last) / (now - last_time)
+            logger.info(
+                f"Replayed {self.sent} messages ({rate:.0f}/s), delivered {self.delivered}, "
+                f"{len(self.connections)} clients, {self.disconnects} injected disconnects"
+            )
+            last, last_time = self.sent, now
+
+
+def dataset_pairs(path: str) -> List[str]:
+    # Every pair of collector output directory or CSV, column store of trader doesn't know its pair
+    if os.path.isdir(path):
+        return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+    return sorted(pd.read_csv(path, header=None, usecols=[1])[1].unique())
+
+
+async def serve(replay: Replay, host: str, port: int, interval: float):
+    server = await asyncio.start_server(replay.handle, host, port)
+    print(f"Replaying {', '.join(replay.pairs)} ({len(replay.times)} trades) on ws://{host}:{port}")
+    reporter = asyncio.ensure_future(replay.report(interval))
+    producer = asyncio.ensure_future(replay.run())
+    try:
+        await replay.done.wait()
+    finally:
+        reporter.cancel()
+        producer.cancel()
+        server.close()
+        await server.wait_closed()
+    logger.info(f"Replay finished, sent {replay.sent} messages")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local websocket server replaying recorded trades as ticker channel")
+    parser.add_argument("--dataset", default="dataset.csv", help="CSV, collector output or column store")
+    parser.add_argument("--pairs", default=None, help="Comma separated pairs, defaults to all pairs of dataset")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1, help="Multiple of recorded pace, 0 is max speed")
+    parser.add_argument("--loop", action="store_true", help="Start over when dataset runs out")
+    parser.add_argument("--disconnect-every", type=int, default=0, help="Disconnect all clients every N messages")
+    parser.add_argument("--drop", action="store_true", help="Disconnect by dropping TCP instead of closing websocket")
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between progress logs")
+    args = parser.parse_args()
+
+    if args.speed < 0:
+        parser.error("--speed can't be negative")
+    if args.pairs is not None:
+        pairs = [pair.strip().upper() for pair in args.pairs.split(",") if pair.strip()]
+    elif os.path.exists(os.path.join(args.dataset, "meta.json")):
+        parser.error("--pairs is required for column store datasets")
+    else:
+        pairs = dataset_pairs(args.dataset)
+    columns = {pair: load_dataset(args.dataset, pair) for pair in pairs}
+    columns = {pair: c for pair, c in columns.items() if len(c["time"]) > 0}
+    if len(columns) == 0:
+        parser.error(f"No trades of {', '.join(pairs)} in {args.dataset}")
+
+    async def run():
+        replay = Replay(columns, args.speed, args.loop, args.disconnect_every, args.drop)
+        await serve(replay, args.host, args.port, args.interval)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
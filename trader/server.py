@@ -1,14 +1,19 @@
 import os
+from typing import Optional
 
-from fastapi import FastAPI
-from fastapi.responses import PlainTextResponse
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response
 from redis import Redis
 
-from trader.app.core import Trader
+from trader.app.core import MarketFeed, Trader
+from trader.app.equity import RESOLUTIONS, parse_time
+from trader.cluster import Cluster
 from trader.db.factory import get_db
 from trader.logs import get_logger
+from trader.metrics import merge, registry, render
 from trader.strategy.factory import get_strategy
-from trader.util import load_config
+from trader.util import feed_apikey, load_config, pair_configs
 
 redis_host = os.environ.get("REDIS_HOST", "localhost")
 
@@ -17,27 +22,131 @@ cfg = load_config()
 logger = get_logger()
 
 logger.info(f"Db host: {redis_host}")
-db_class = get_db(cfg.db)
-db = db_class(host=redis_host)
-trading_strategy = get_strategy(cfg.trader, cfg.strategy)
-trader = Trader(db, trading_strategy, cfg)
+cluster = None
+db = None
+feed = None
+traders = dict()
+if cfg.workers != 0:
+    # Supervisor mode, traders run in worker processes and we only ingest and serve API
+    cluster = Cluster(pair_configs(cfg), cfg.workers, redis_host)
+    traders = cluster.traders
+else:
+    db_class = get_db(cfg.db)
+    db = db_class(host=redis_host)
+    feed = MarketFeed(cfg.sandbox, cfg.ws_url, feed_apikey(cfg))
+    for pair_cfg in pair_configs(cfg):
+        trading_strategy = get_strategy(pair_cfg.trader, pair_cfg.strategy)
+        pair_trader = Trader(db, trading_strategy, pair_cfg, feed)
+        traders[pair_trader.pair] = pair_trader
+    feed.start()
+# Routes without pair refer to the first one configured
+trader = next(iter(traders.values()))
+
+
+def get_trader(pair: str):
+    pair = pair.upper()
+    if pair not in traders:
+        raise HTTPException(status_code=404, detail=f"Pair {pair} is not traded")
+    return traders[pair]
+
+
+async def call(pair_trader, method: str):
+    # Local traders answer from snapshot in memory, remote ones block on their shard's pipe
+    if isinstance(pair_trader, Trader):
+        return getattr(pair_trader, method)()
+    return await run_in_threadpool(getattr(pair_trader, method))
+
+
+async def equity(pair_trader, start: Optional[str], end: Optional[str], resolution: Optional[str]) -> str:
+    # Times are unix seconds or ISO timestamps, rows are downsampled to fit range unless resolution says otherwise.
+    # OHLC columns are returned only when resolution is given, otherwise downsampled rows keep the raw columns.
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Resolution must be one of {', '.join(RESOLUTIONS)}")
+    try:
+        start, end = parse_time(start), parse_time(end)
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {ex}")
+    return await run_in_threadpool(pair_trader.equity_csv, start, end, resolution)
+
+
+def merge_holdings(portfolios):
+    holdings = dict()
+    for portfolio in portfolios:
+        holdings.update(portfolio["holdings"])
+    return holdings
 
 
 @app.get("/trader/")
 async def root():
-    return trader.cached_obj("appstatus", 1, lambda: trader.get_status())
+    return await call(trader, "status")
 
 
 @app.get("/trader/portfolio")
 async def portfolio():
-    return trader.cached_obj("portfolio", 1, lambda: trader.get_portfolio())
+    return await call(trader, "portfolio")
 
 
 @app.get("/trader/equity", response_class=PlainTextResponse)
-async def history():
-    return trader.get_history().to_csv()
+async def history(
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    resolution: Optional[str] = None,
+):
+    return await equity(trader, start, end, resolution)
+
+
+@app.get("/trader/pairs")
+async def pairs():
+    return list(traders.keys())
+
+
+@app.get("/trader/all/")
+async def all_status():
+    return {pair: await call(pair_trader, "status") for pair, pair_trader in traders.items()}
+
+
+@app.get("/trader/all/portfolio")
+async def all_portfolio():
+    portfolios = {pair: await call(pair_trader, "portfolio") for pair, pair_trader in traders.items()}
+    return {"pairs": portfolios, "holdings": merge_holdings(portfolios.values())}
+
+
+@app.get("/trader/{pair}/")
+async def pair_root(pair: str):
+    return await call(get_trader(pair), "status")
+
+
+@app.get("/trader/{pair}/portfolio")
+async def pair_portfolio(pair: str):
+    return await call(get_trader(pair), "portfolio")
+
+
+@app.get("/trader/{pair}/equity", response_class=PlainTextResponse)
+async def pair_history(
+    pair: str,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    resolution: Optional[str] = None,
+):
+    return await equity(get_trader(pair), start, end, resolution)
+
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format, traders living in shards report through their pipe
+    families = registry.collect()
+    if cluster is not None:
+        shards = await run_in_threadpool(cluster.collect_metrics)
+        families = merge(dict(shards, supervisor=families), "process")
+    return Response(render(families), media_type="text/plain; version=0.0.4")
 
 
 @app.on_event("shutdown")
 def shutdown_event():
-    trader.on_shutdown()
+    if cluster is not None:
+        cluster.shutdown()
+        return
+    for pair_trader in traders.values():
+        pair_trader.on_shutdown()
+    feed.close()
+    db.close()
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from typing import Optional
 
+import numpy as np
+
 from trader.model import TradingStrategy
 
 @dataclass
@@ -15,12 +17,29 @@ class Params:
     temperature: float
 
 
+@dataclass
+class BatchParams:
+    # Same as Params, but market data are arrays over many ticks with the same order state
+    buy_price: Optional[float]
+    sell_price: Optional[float]
+    price: np.ndarray
+    change: np.ndarray
+    round: int
+    max: np.ndarray
+    min: np.ndarray
+    temperature: np.ndarray
+
+
 class BaseStrategy:
     strategy: TradingStrategy
 
     def __init__(self, strategy: TradingStrategy) -> None:
         self.strategy = strategy
 
+    def on_tick(self, trader):
+        # Called from Trader.on_tick once current market values are updated
+        pass
+
     def will_buy(self, trader) -> bool:
         return False
 
@@ -33,6 +52,12 @@ class BaseStrategy:
     def buy_price(self, trader) -> Optional[float]:
         return None
 
+    # Vectorized will_buy used by backtester, strategies that can't decide over arrays
+    # (i.e. they are random or stateful) return None and are replayed tick by tick.
+    # Sells are limit orders at sell_price, so backtester never asks will_sell.
+    def will_buy_batch(self, params: BatchParams) -> Optional[np.ndarray]:
+        return None
+
     def get_params(self, trader) -> Params:
         return Params(
             buy_price=trader.read_num("buy_price"),
@@ -1,8 +1,11 @@
 from typing import Optional
+
+import numpy as np
+
 from trader.app.core import Trader
 
 from trader.model import TradingStrategy
-from trader.strategy.base import BaseStrategy, Params
+from trader.strategy.base import BaseStrategy, BatchParams, Params
 
 
 class Dipper(BaseStrategy):
@@ -24,3 +27,6 @@ class Dipper(BaseStrategy):
     def buy_price(self, trader: Trader) -> Optional[float]:
         params: Params = self.get_params(trader)
         return min(params.max * (1 + self.strategy.buy[params.round % len(self.strategy.buy)]), params.price)
+
+    def will_buy_batch(self, params: BatchParams) -> Optional[np.ndarray]:
+        return params.change <= self.strategy.buy[params.round % len(self.strategy.buy)]
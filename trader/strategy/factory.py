@@ -2,12 +2,15 @@ from trader.model import TradingStrategy
 from trader.strategy.base import BaseStrategy
 from trader.strategy.dipper import Dipper
 from trader.strategy.smartyolo import SmartYolo
+from trader.strategy.vm import VMStrategy
 from trader.strategy.yolo import Yolo
 
 
+strategies = {"dipper": Dipper, "yolo": Yolo, "smartyolo": SmartYolo, "vm": VMStrategy}
+
+
 def get_strategy(name: str, strategy: TradingStrategy) -> BaseStrategy:
-    classes = {"dipper": Dipper, "yolo": Yolo, "smartyolo": SmartYolo}
-    if name not in classes:
+    if name not in strategies:
         name = "dipper"
-    trader = classes[name]
+    trader = strategies[name]
     return trader(strategy)
@@ -0,0 +1,69 @@
+import time
+from typing import Optional
+
+from trader.app.core import Trader
+from trader.logs import get_logger
+from trader.model import TradingStrategy
+from trader.strategy.base import BaseStrategy, Params
+from trader.vm import VM, LiveIndex
+
+logger = get_logger()
+
+
+class VMStrategy(BaseStrategy):
+    # Runs program in asm/ syntax on every trader tick, over live trade stream. Program is
+    # compiled once and trades a virtual account carried between ticks like in genetic
+    # fitness, trader buys while program holds crypto and sells with configured margin.
+    # Steps and wall time of each run are capped, runs that fail or run out of time are
+    # discarded and leave previous decision in place.
+    vm: VM
+    index: LiveIndex
+    holding: bool = False
+    failures: int = 0
+
+    def __init__(self, strategy: TradingStrategy) -> None:
+        super().__init__(strategy)
+        program = strategy.program
+        self.index = LiveIndex()
+        self.vm = VM(self.index)
+        self.vm.maxexec = program.max_steps
+        self.max_time = program.max_time / 1000
+        with open(program.path) as f:
+            self.program = self.vm.compile(self.vm.parse(f.read()))
+        self.account = (1000.0, 0.0)
+        logger.info(f"Loaded VM program {program.path} ({len(self.program)} instructions)")
+
+    def on_tick(self, trader: Trader):
+        vm = self.vm
+        vm.seek(self.index.refresh(trader.trade_stream))
+        started = time.perf_counter()
+        try:
+            vm.run(self.program, *self.account, deadline=started + self.max_time)
+        except Exception as ex:
+            if self.failures == 0:
+                logger.warning(f"VM program failed at step {vm.steps}, ip {vm.ip}", exc_info=ex)
+            self.failures += 1
+            return
+        if vm.timed_out:
+            if self.failures == 0:
+                logger.warning(f"VM program ran out of time after {vm.steps} steps")
+            self.failures += 1
+            return
+        self.failures = 0
+        self.account = (vm.ccy, vm.crypto)
+        self.holding = vm.crypto > 0
+
+    def will_buy(self, trader: Trader) -> bool:
+        return self.holding
+
+    def will_sell(self, trader: Trader) -> bool:
+        return not self.holding
+
+    def sell_price(self, trader: Trader) -> Optional[float]:
+        params: Params = self.get_params(trader)
+        return max(params.buy_price, params.price) * (1 + self.strategy.sell[params.round % len(self.strategy.sell)])
+
+    def buy_price(self, trader: Trader) -> Optional[float]:
+        if not self.holding:
+            return None
+        return self.get_params(trader).price
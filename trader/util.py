@@ -1,8 +1,9 @@
 import os
+from typing import List, Optional
 
 import yaml
 
-from trader.model import Config
+from trader.model import ApiKey, Config
 
 
 def add_envs(obj, history):
@@ -19,8 +20,26 @@ def add_envs(obj, history):
             obj[key] = t(value)
 
 
-def load_config() -> Config:
-    with open("./resources/config.yaml", "r", encoding="utf-8") as f:
+def load_config(path: str = "./resources/config.yaml") -> Config:
+    with open(path, "r", encoding="utf-8") as f:
         obj = yaml.safe_load(f)
         add_envs(obj, [])
         return Config.parse_obj(obj)
+
+
+def pair_configs(cfg: Config) -> List[Config]:
+    # Every pair inherits top-level settings, overriding only what it specifies
+    if len(cfg.pairs) == 0:
+        return [cfg]
+    configs = []
+    for pair in cfg.pairs:
+        update = {key: getattr(pair, key) for key in pair.__fields__ if getattr(pair, key) is not None}
+        configs.append(cfg.copy(update=update))
+    return configs
+
+
+def feed_apikey(cfg: Config) -> Optional[ApiKey]:
+    # Key websocket feed authenticates with to get user channel, none keeps it public
+    if not cfg.orders.websocket:
+        return None
+    return cfg.sandbox_apikey if cfg.sandbox else cfg.apikey
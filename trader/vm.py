@@ -0,0 +1,819 @@
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from trader.app.stream import ColumnBuffer
+
+fields = ["price", "volume", "value"]
+
+# Instructions reading market data, benchmarked separately from ones that only touch VM state
+window_ops = ["STD", "MAX", "MIN", "MEDIAN", "MEAN", "READ"]
+data_ops = window_ops + ["BUY", "SELL"]
+
+blank_memory = [0.0] * 256
+
+# Steps between clock checks of VM.run() with deadline
+time_slice = 64
+
+
+class MarketIndex:
+    # Immutable columns of one dataset with window statistics, built once and shared
+    # read-only by all VMs, each of which only keeps a cursor of how many rows it sees.
+    # Window is the same as tail(window) of first `end` rows: positive takes last rows,
+    # zero is empty and negative drops first rows. MEAN and STD come from prefix sums
+    # (of values shifted by column mean, to keep STD precise), MIN and MAX from sparse
+    # tables and MEDIAN is memoized per window, as same windows repeat across programs.
+    columns: Dict[str, np.ndarray]
+
+    def __init__(self, columns: Dict[str, np.ndarray], median_cache: int = 100000) -> None:
+        self.columns = dict()
+        self.shifts = dict()
+        self.sums = dict()
+        self.squares = dict()
+        self.maxima = dict()
+        self.minima = dict()
+        self.medians = dict()
+        self.median_cache = median_cache
+        for name in fields:
+            # Missing columns raise KeyError on use, same as DataFrame lookup did
+            if name not in columns:
+                continue
+            values = np.asarray(columns[name], dtype=np.float64)
+            values.flags.writeable = False
+            shift = values.mean() if len(values) > 0 else 0.0
+            self.columns[name] = values
+            self.shifts[name] = shift
+            self.sums[name] = np.concatenate([[0.0], np.cumsum(values - shift)])
+            self.squares[name] = np.concatenate([[0.0], np.cumsum((values - shift) ** 2)])
+            self.maxima[name] = self.sparse_table(values, np.maximum)
+            self.minima[name] = self.sparse_table(values, np.minimum)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "MarketIndex":
+        return cls({name: df[name].to_numpy(dtype=np.float64, copy=True) for name in fields if name in df.columns})
+
+    def __len__(self) -> int:
+        return min([len(values) for values in self.columns.values()], default=0)
+
+    @staticmethod
+    def sparse_table(values: np.ndarray, fn) -> List[np.ndarray]:
+        # Level k holds reduction of values[i : i + 2^k]
+        levels = [values]
+        span = 1
+        while span * 2 <= len(values):
+            prev = levels[-1]
+            levels.append(fn(prev[:-span], prev[span:]))
+            span *= 2
+        return levels
+
+    @staticmethod
+    def window(end: int, window: int) -> Tuple[int, int]:
+        if window >= 0:
+            return max(0, end - window), end
+        return min(-window, end), end
+
+    def query(self, table: List[np.ndarray], lo: int, hi: int, fn) -> float:
+        if hi <= lo:
+            return np.nan
+        level = (hi - lo).bit_length() - 1
+        values = table[level]
+        return fn(values[lo], values[hi - (1 << level)])
+
+    def max(self, name: str, end: int, window: int) -> float:
+        lo, hi = self.window(end, window)
+        return self.query(self.maxima[name], lo, hi, max)
+
+    def min(self, name: str, end: int, window: int) -> float:
+        lo, hi = self.window(end, window)
+        return self.query(self.minima[name], lo, hi, min)
+
+    def mean(self, name: str, end: int, window: int) -> float:
+        sums = self.sums[name]
+        lo, hi = self.window(end, window)
+        if hi <= lo:
+            return np.nan
+        return self.shifts[name] + (sums[hi] - sums[lo]) / (hi - lo)
+
+    def std(self, name: str, end: int, window: int) -> float:
+        sums, squares = self.sums[name], self.squares[name]
+        lo, hi = self.window(end, window)
+        n = hi - lo
+        if n < 2:
+            return np.nan
+        total = sums[hi] - sums[lo]
+        variance = (squares[hi] - squares[lo] - total * total / n) / (n - 1)
+        return np.sqrt(max(variance, 0.0))
+
+    def median(self, name: str, end: int, window: int) -> float:
+        values = self.columns[name]
+        lo, hi = self.window(end, window)
+        if hi <= lo:
+            return np.nan
+        key = (name, lo, hi)
+        value = self.medians.get(key)
+        if value is None:
+            if len(self.medians) >= self.median_cache:
+                self.medians.clear()
+            value = self.medians[key] = np.median(values[lo:hi])
+        return value
+
+    def last(self, name: str, end: int) -> float:
+        if end <= 0:
+            raise IndexError("no rows")
+        return self.columns[name][end - 1]
+
+    def read(self, name: str, end: int, window: int) -> float:
+        values = self.columns[name]
+        lo, hi = self.window(end, window)
+        if hi <= lo:
+            return 0
+        return values[lo]
+
+
+class LiveIndex:
+    # Same queries as MarketIndex, but over trade stream of running trader, which keeps
+    # growing and evicting old rows, so nothing is precomputed and every query reduces
+    # only its window of column views taken by refresh(). Value column is computed
+    # on the fly from the window, as stream keeps only price and volume.
+    columns: Dict[str, np.ndarray]
+    sources = {"price": "close", "volume": "vol"}
+
+    def __init__(self, stream: Optional[ColumnBuffer] = None) -> None:
+        self.columns = dict()
+        if stream is not None:
+            self.refresh(stream)
+
+    def refresh(self, stream: ColumnBuffer) -> int:
+        # Views are valid only until next append, which may move rows within the same arrays, so
+        # they have to be taken again before every run. Trader appends and ticks on the same thread.
+        self.columns = {name: stream[source] for name, source in self.sources.items()}
+        return len(stream)
+
+    def __len__(self) -> int:
+        return len(self.columns.get("price", ()))
+
+    def values(self, name: str, end: int, window: int) -> np.ndarray:
+        lo, hi = MarketIndex.window(end, window)
+        if name == "value":
+            return self.columns["price"][lo:hi] * self.columns["volume"][lo:hi]
+        return self.columns[name][lo:hi]
+
+    def max(self, name: str, end: int, window: int) -> float:
+        values = self.values(name, end, window)
+        return values.max() if len(values) > 0 else np.nan
+
+    def min(self, name: str, end: int, window: int) -> float:
+        values = self.values(name, end, window)
+        return values.min() if len(values) > 0 else np.nan
+
+    def mean(self, name: str, end: int, window: int) -> float:
+        values = self.values(name, end, window)
+        return values.mean() if len(values) > 0 else np.nan
+
+    def std(self, name: str, end: int, window: int) -> float:
+        values = self.values(name, end, window)
+        return values.std(ddof=1) if len(values) > 1 else np.nan
+
+    def median(self, name: str, end: int, window: int) -> float:
+        values = self.values(name, end, window)
+        return np.median(values) if len(values) > 0 else np.nan
+
+    def last(self, name: str, end: int) -> float:
+        if end <= 0:
+            raise IndexError("no rows")
+        return self.values(name, end, 1)[0]
+
+    def read(self, name: str, end: int, window: int) -> float:
+        values = self.values(name, end, window)
+        if len(values) == 0:
+            return 0
+        return values[0]
+
+
+Step = Callable[[int], int]
+
+
+class VM:
+    # State is allocated once per VM and reset() only rewinds stack pointers,
+    # so running the same VM over many programs and rows doesn't allocate
+    __slots__ = (
+        "index", "cursor", "memory", "stk", "call_stk", "sp", "csp", "ip", "steps",
+        "ccy", "crypto", "halted", "exceeded", "timed_out", "maxexec",
+    )
+    index: Union[MarketIndex, LiveIndex]
+    cursor: int
+
+    def __init__(self, index: Union[MarketIndex, LiveIndex], cursor: int = 0) -> None:
+        # VM sees first `cursor` rows of the dataset
+        self.index = index
+        self.cursor = cursor
+        self.memory = list(blank_memory)
+        self.stk = [0.0] * 65536
+        self.call_stk = np.zeros(65536, dtype=np.uint32)
+        self.maxexec = 5000
+        self.reset()
+
+    def parse(self, text):
+        lines = text.split("\n")
+        code = []
+        labels = dict()
+        consts = dict()
+        ctr = 0
+        for line in lines:
+            line = re.sub("#.*$", "", line).strip()
+            if len(line) == 0:
+                continue
+            parts = re.match(
+                "([a-zA-Z0-9_.]+:)?\\s*([a-zA-Z01]+)\\s*(\\$?[a-zA-Z0-9_.]+)?", line
+            )
+            if parts is None:
+                continue
+
+            label = parts[1]
+            op = parts[2].upper()
+            imm = parts[3]
+
+            if label is not None:
+                label = label.replace(":", "")
+
+            # print(line, [label, op, imm])
+            if imm is not None:
+                if imm.startswith("$"):
+                    id = 0
+                    if imm in consts:
+                        id = consts[imm]
+                    else:
+                        consts[imm] = ctr
+                        id = ctr
+                        ctr += 1
+                    imm = id
+                elif re.match("^([0-9.]+)$", imm):
+                    if "." in imm:
+                        imm = float(imm)
+                    else:
+                        imm = int(imm)
+            else:
+                imm = 0
+
+            if getattr(self, op, None) is None:
+                raise RuntimeError("invalid instruction: " + op)
+
+            if label is not None:
+                labels[label] = len(code)
+
+            code.append([op, imm, label])
+        final = []
+
+        for i, inst in enumerate(code):
+            if isinstance(inst[1], str):
+                label = inst[1]
+                if label not in labels:
+                    raise RuntimeError("invalid label: " + label)
+                final.append([inst[0], labels[label] - i])
+            else:
+                final.append([inst[0], inst[1]])
+
+        return final
+
+    def on_row(self):
+        self.cursor += 1
+
+    def seek(self, cursor: int):
+        self.cursor = cursor
+
+    def reset(self, ccy: float = 1000, crypto: float = 0):
+        self.steps = 0
+        self.ip = 0
+        self.sp = 0
+        self.csp = 0
+        self.halted = False
+        self.exceeded = True
+        self.timed_out = False
+        self.ccy = ccy
+        self.crypto = crypto
+        self.memory[:] = blank_memory
+
+    def execute(self, code) -> float:
+        self.reset()
+        while not self.halted:
+            op = code[self.ip]
+            getattr(self, op[0])(op[1])
+            self.ip += 1
+            self.steps += 1
+            if self.ip == len(code) or self.steps >= self.maxexec:
+                self.exceeded = self.steps >= self.maxexec
+                break
+
+        if self.sp <= 0:
+            return None
+        return self.stk[self.sp - 1]
+
+    def compile(self, code) -> List[Step]:
+        # Every instruction becomes a closure bound to this VM that takes ip and returns
+        # the next one, so run() does no lookups or decoding. Jump offsets are baked in,
+        # but stay relative, so programs wandering into negative ip wrap around like in execute()
+        return [self.emit(op, imm) for op, imm in code]
+
+    def run(
+        self, program: List[Step], ccy: float = 1000, crypto: float = 0, deadline: Optional[float] = None
+    ) -> Optional[float]:
+        # Same semantics as execute(), but for program produced by compile(). With deadline
+        # (perf_counter() time), clock is checked every time_slice steps and run is cut short
+        # with timed_out set once it passes, otherwise inner loop is the same.
+        self.reset(ccy, crypto)
+        n = len(program)
+        maxexec = self.maxexec
+        limit = maxexec if deadline is None else min(maxexec, time_slice)
+        ip = 0
+        steps = 0
+        try:
+            while not self.halted:
+                ip = program[ip](ip)
+                steps += 1
+                if ip == n or steps >= limit:
+                    if ip == n or steps >= maxexec:
+                        self.exceeded = steps >= maxexec
+                        break
+                    if time.perf_counter() >= deadline:
+                        self.timed_out = True
+                        break
+                    limit = min(maxexec, steps + time_slice)
+        finally:
+            self.ip = ip
+            self.steps = steps
+
+        if self.sp <= 0:
+            return None
+        return self.stk[self.sp - 1]
+
+    def emit(self, op: str, imm) -> Step:
+        emitter = getattr(self, "emit_" + op, None)
+        if emitter is not None:
+            return emitter(imm)
+        # Rest (PRINT, debugging only) simply calls the interpreter
+        method = getattr(self, op)
+
+        def step(ip):
+            method(imm)
+            return ip + 1
+
+        return step
+
+    def emit_const(self, value: float) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp
+            stk[sp] = value
+            vm.sp = sp + 1
+            return ip + 1
+
+        return step
+
+    def emit_PUSH(self, imm) -> Step:
+        return self.emit_const(float(imm))
+
+    def emit_LOADK(self, imm) -> Step:
+        return self.emit_const(float(imm))
+
+    def emit_LOAD0(self, imm) -> Step:
+        return self.emit_const(0.0)
+
+    def emit_LOAD1(self, imm) -> Step:
+        return self.emit_const(1.0)
+
+    def emit_LOADM1(self, imm) -> Step:
+        return self.emit_const(-1.0)
+
+    def emit_LOAD(self, imm: int) -> Step:
+        vm, stk, memory = self, self.stk, self.memory
+
+        def step(ip):
+            sp = vm.sp
+            stk[sp] = memory[imm]
+            vm.sp = sp + 1
+            return ip + 1
+
+        return step
+
+    def emit_STORE(self, imm: int) -> Step:
+        vm, stk, memory = self, self.stk, self.memory
+
+        def step(ip):
+            sp = vm.sp
+            assert sp > 0
+            memory[imm] = stk[sp - 1]
+            vm.sp = sp - 1
+            return ip + 1
+
+        return step
+
+    def emit_POP(self, imm) -> Step:
+        vm = self
+
+        def step(ip):
+            assert vm.sp > 0
+            vm.sp -= 1
+            return ip + 1
+
+        return step
+
+    def emit_DUP(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp
+            assert sp > 0
+            stk[sp] = stk[sp - 1]
+            vm.sp = sp + 1
+            return ip + 1
+
+        return step
+
+    def emit_DUP2(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp
+            assert sp > 1
+            stk[sp] = stk[sp - 2]
+            stk[sp + 1] = stk[sp - 1]
+            vm.sp = sp + 2
+            return ip + 1
+
+        return step
+
+    def emit_ADD(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            stk[sp - 1] = stk[sp] + stk[sp - 1]
+            vm.sp = sp
+            return ip + 1
+
+        return step
+
+    def emit_SUB(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            stk[sp - 1] = stk[sp - 1] - stk[sp]
+            vm.sp = sp
+            return ip + 1
+
+        return step
+
+    def emit_MUL(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            stk[sp - 1] = stk[sp] * stk[sp - 1]
+            vm.sp = sp
+            return ip + 1
+
+        return step
+
+    def emit_DIV(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            b = stk[sp]
+            vm.sp = sp
+            assert b != 0
+            stk[sp - 1] = stk[sp - 1] / b
+            return ip + 1
+
+        return step
+
+    def emit_MOD(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            b = stk[sp]
+            vm.sp = sp
+            assert b != 0
+            stk[sp - 1] = stk[sp - 1] % b
+            return ip + 1
+
+        return step
+
+    def emit_CMPEQ(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            stk[sp - 1] = 0.0 if stk[sp] == stk[sp - 1] else 1.0
+            vm.sp = sp
+            return ip + 1
+
+        return step
+
+    def emit_CMPLT(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            stk[sp - 1] = 0.0 if stk[sp] >= stk[sp - 1] else 1.0
+            vm.sp = sp
+            return ip + 1
+
+        return step
+
+    def emit_CMPLTE(self, imm) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp > 0
+            stk[sp - 1] = 0.0 if stk[sp] > stk[sp - 1] else 1.0
+            vm.sp = sp
+            return ip + 1
+
+        return step
+
+    def emit_JZ(self, imm: int) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp >= 0
+            vm.sp = sp
+            return ip + imm if stk[sp] == 0 else ip + 1
+
+        return step
+
+    def emit_JNZ(self, imm: int) -> Step:
+        vm, stk = self, self.stk
+
+        def step(ip):
+            sp = vm.sp - 1
+            assert sp >= 0
+            vm.sp = sp
+            return ip + imm if stk[sp] != 0 else ip + 1
+
+        return step
+
+    def emit_JMP(self, imm: int) -> Step:
+        def step(ip):
+            return ip + imm
+
+        return step
+
+    def emit_CALL(self, imm: int) -> Step:
+        vm, call_stk = self, self.call_stk
+
+        def step(ip):
+            csp = vm.csp
+            call_stk[csp] = ip
+            vm.csp = csp + 1
+            return ip + imm
+
+        return step
+
+    def emit_RET(self, imm) -> Step:
+        vm, call_stk = self, self.call_stk
+
+        def step(ip):
+            csp = vm.csp - 1
+            assert csp >= 0
+            vm.csp = csp
+            return int(call_stk[csp]) + 1
+
+        return step
+
+    def emit_HALT(self, imm) -> Step:
+        vm = self
+
+        def step(ip):
+            vm.halted = True
+            return ip + 1
+
+        return step
+
+    def emit_stat(self, fn: str, imm: int) -> Step:
+        # Query of index is bound once, window on top of the stack is replaced by its result
+        vm, stk, query, name = self, self.stk, getattr(self.index, fn), fields[imm % len(fields)]
+
+        def step(ip):
+            sp = vm.sp
+            assert sp > 0
+            stk[sp - 1] = float(query(name, vm.cursor, int(stk[sp - 1])))
+            return ip + 1
+
+        return step
+
+    def emit_STD(self, imm: int) -> Step:
+        return self.emit_stat("std", imm)
+
+    def emit_MAX(self, imm: int) -> Step:
+        return self.emit_stat("max", imm)
+
+    def emit_MIN(self, imm: int) -> Step:
+        return self.emit_stat("min", imm)
+
+    def emit_MEDIAN(self, imm: int) -> Step:
+        return self.emit_stat("median", imm)
+
+    def emit_MEAN(self, imm: int) -> Step:
+        return self.emit_stat("mean", imm)
+
+    def emit_READ(self, imm: int) -> Step:
+        return self.emit_stat("read", imm)
+
+    def emit_BUY(self, imm) -> Step:
+        vm, last = self, self.index.last
+
+        def step(ip):
+            price = last("price", vm.cursor)
+            amt = vm.ccy / price
+            vm.ccy -= amt * price
+            vm.crypto += amt
+            return ip + 1
+
+        return step
+
+    def emit_SELL(self, imm) -> Step:
+        vm, last = self, self.index.last
+
+        def step(ip):
+            price = last("price", vm.cursor)
+            vm.ccy += vm.crypto * price
+            vm.crypto = 0
+            return ip + 1
+
+        return step
+
+    def PUSH(self, value: Union[int, float]):
+        self.stk[self.sp] = float(value)
+        self.sp += 1
+
+    def POP(self, value: Optional[int] = None):
+        assert self.sp > 0
+        self.sp -= 1
+        return self.stk[self.sp]
+
+    def LOADK(self, k: int):
+        self.PUSH(k)
+
+    def LOAD0(self, k: int):
+        self.PUSH(0)
+
+    def LOAD1(self, k: int):
+        self.PUSH(1)
+
+    def LOADM1(self, k: int):
+        self.PUSH(-1)
+
+    def LOAD(self, imm: int):
+        self.PUSH(self.memory[imm])
+
+    def STORE(self, imm: int):
+        self.memory[imm] = self.POP(0)
+
+    def DUP(self, value: Optional[int]):
+        assert self.sp > 0
+        self.PUSH(self.stk[self.sp - 1])
+
+    def DUP2(self, value: Optional[int]):
+        assert self.sp > 1
+        b = self.POP(0)
+        a = self.POP(0)
+        self.PUSH(a)
+        self.PUSH(b)
+        self.PUSH(a)
+        self.PUSH(b)
+
+    def stat(self, fn: str, value: int):
+        assert self.sp > 0
+        window = int(self.POP(0))
+        return getattr(self.index, fn)(fields[value % len(fields)], self.cursor, window)
+
+    def STD(self, value: int):
+        self.PUSH(self.stat("std", value))
+
+    def MAX(self, value: int):
+        self.PUSH(self.stat("max", value))
+
+    def MIN(self, value: int):
+        self.PUSH(self.stat("min", value))
+
+    def MEDIAN(self, value: int):
+        self.PUSH(self.stat("median", value))
+
+    def MEAN(self, value: int):
+        self.PUSH(self.stat("mean", value))
+
+    def READ(self, value: int):
+        assert self.sp > 0
+        window = int(self.POP(0))
+        self.PUSH(self.index.read(fields[value % len(fields)], self.cursor, window))
+
+    def ADD(self, value: Optional[int] = None):
+        assert self.sp > 1
+        self.PUSH(self.POP(0) + self.POP(0))
+
+    def SUB(self, value: Optional[int] = None):
+        assert self.sp > 1
+        b = self.POP(0)
+        a = self.POP(0)
+        self.PUSH(a - b)
+
+    def MUL(self, value: Optional[int] = None):
+        assert self.sp > 1
+        self.PUSH(self.POP(0) * self.POP(0))
+
+    def DIV(self, value: Optional[int] = None):
+        assert self.sp > 1
+        b = self.POP(0)
+        a = self.POP(0)
+        assert b != 0
+        self.PUSH(a / b)
+
+    def MOD(self, value: Optional[int] = None):
+        assert self.sp > 1
+        b = self.POP(0)
+        a = self.POP(0)
+        assert b != 0
+        self.PUSH(a % b)
+
+    def CMPEQ(self, value: Optional[int] = None):
+        assert self.sp > 1
+        self.PUSH(0 if self.POP(0) == self.POP(0) else 1)
+
+    def CMPLT(self, value: Optional[int] = None):
+        assert self.sp > 1
+        self.PUSH(0 if self.POP(0) >= self.POP(0) else 1)
+
+    def CMPLTE(self, value: Optional[int] = None):
+        assert self.sp > 1
+        self.PUSH(0 if self.POP(0) > self.POP(0) else 1)
+
+    def JZ(self, value: int):
+        assert self.sp > 0
+        if self.POP(0) == 0:
+            self.ip += value - 1
+
+    def JNZ(self, value: int):
+        assert self.sp > 0
+        if self.POP(0) != 0:
+            self.ip += value - 1
+
+    def JMP(self, value: int):
+        self.ip += value - 1
+
+    def CALL(self, value: int):
+        self.call_stk[self.csp] = self.ip
+        self.csp += 1
+        self.ip += value - 1
+
+    def RET(self, value: Optional[int] = None):
+        assert self.csp > 0
+        self.csp -= 1
+        self.ip = self.call_stk[self.csp]
+
+    def HALT(self, value: Optional[int] = None):
+        self.halted = True
+
+    def PRINT(self, value: Optional[int] = None):
+        assert self.sp > 0
+        print(self.stk[self.sp - 1])
+
+    def price(self) -> float:
+        return self.index.last("price", self.cursor)
+
+    def BUY(self, value: Optional[int] = None):
+        price = self.price()
+        amt = self.ccy / price
+        self.ccy -= amt * price
+        self.crypto += amt
+
+    def SELL(self, value: Optional[int] = None):
+        price = self.price()
+        self.ccy += self.crypto * price
+        self.crypto = 0
+
+    def get_is(self):
+        censored = ["PRINT", "HALT", "PUSH", "POP"]
+        return [fn for fn in dir(VM) if fn == fn.upper() and fn not in censored]
+
+    def print_top(self):
+        print(self.stk[self.sp - 1])
+
+    def equity(self):
+        price = self.price()
+        return self.ccy + self.crypto * price